@@ -0,0 +1,323 @@
+"""
+Aggregate the analysis of several Shadow runs of the same scenario.
+
+Each output directory (typically one per --seed) is one sample. For every
+run-level metric this reports the mean across runs with a bootstrap confidence
+interval, and it pools the delivery latencies of all runs into one
+distribution. Directories are analyzed in parallel worker processes. When
+the runs have a run_stats.json, it also reports the simulation speed
+(simulated seconds per wall clock second) and the largest single process peak
+RSS per node count.
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from analysis_session import LATENCY_PERCENTILES, AnalysisSession
+from run_stats import load_run_stats
+
+DEFAULT_BOOTSTRAP_RESAMPLES = 10_000
+DEFAULT_CONFIDENCE = 0.95
+
+
+def run_metrics(summary: dict) -> Dict[str, float]:
+    """Flatten the run-level metrics of an analysis.json summary."""
+    run = summary["run"]
+    metrics = {f"latency_{p}": value for p, value in run["latency"].items()}
+    for name in ("time_to_disseminate", "p50_to_disseminate", "avg_duplicates"):
+        if run[name]:
+            metrics[f"{name}_mean"] = run[name]["mean"]
+    if run["reached"]:
+        metrics["reached_mean"] = run["reached"]["mean"]
+        metrics["reached_min"] = run["reached"]["min"]
+    return metrics
+
+
+def simulation_cost(folders: List[str]) -> dict:
+    """
+    Summarise the run_stats.json of every run, grouped by node count.
+
+    Args:
+        folders: Shadow output directories, those without run_stats.json are
+            left out
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    runs = []
+    for folder in folders:
+        stats = load_run_stats(folder)
+        if stats is None:
+            continue
+        runs.append(
+            {
+                "folder": folder,
+                **{
+                    name: stats.get(name)
+                    for name in (
+                        "node_count",
+                        "wall_seconds",
+                        "simulated_seconds",
+                        "sim_seconds_per_wall_second",
+                        "cpu_seconds",
+                        "peak_rss_bytes",
+                    )
+                },
+            }
+        )
+
+    by_node_count = defaultdict(list)
+    for run in runs:
+        by_node_count[run["node_count"]].append(run)
+    groups = {}
+    for node_count, group in sorted(by_node_count.items()):
+        speeds = [
+            r["sim_seconds_per_wall_second"]
+            for r in group
+            if r["sim_seconds_per_wall_second"] is not None
+        ]
+        groups[str(node_count)] = {
+            "runs": len(group),
+            "sim_seconds_per_wall_second": float(np.mean(speeds)) if speeds else None,
+            "min_sim_seconds_per_wall_second": min(speeds, default=None),
+            "mean_wall_seconds": float(np.mean([r["wall_seconds"] for r in group])),
+            "max_peak_rss_bytes": max(r["peak_rss_bytes"] for r in group),
+        }
+    return {"runs": runs, "by_node_count": groups}
+
+
+def _analyse_run(folder: str, skip_messages: int) -> Tuple[dict, np.ndarray]:
+    # Module level so it can run in a worker process
+    session = AnalysisSession(folder)
+    return (
+        session.analysis_summary(skip_messages),
+        session.store.skip(skip_messages).latency_ns(),
+    )
+
+
+def bootstrap_mean_ci(
+    values: np.ndarray,
+    confidence: float = DEFAULT_CONFIDENCE,
+    resamples: int = DEFAULT_BOOTSTRAP_RESAMPLES,
+    rng: np.random.Generator = None,
+) -> Tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval of the mean.
+
+    Args:
+        values: One sample per run
+        confidence: Confidence level of the interval
+        resamples: Number of bootstrap resamples
+        rng: Random generator, for reproducible intervals
+
+    Returns:
+        Tuple of (low, high) bounds
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    indices = rng.integers(0, len(values), size=(resamples, len(values)))
+    means = values[indices].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def aggregate_runs(
+    folders: List[str],
+    skip_messages: int = 0,
+    jobs: int = 1,
+    confidence: float = DEFAULT_CONFIDENCE,
+    resamples: int = DEFAULT_BOOTSTRAP_RESAMPLES,
+    seed: int = 0,
+    allow_mixed: bool = False,
+) -> dict:
+    """
+    Analyze every output directory and aggregate the run-level metrics.
+
+    Args:
+        folders: Shadow output directories of the same scenario
+        skip_messages: Number of (warmup) messages to skip in every run
+        jobs: Number of directories analyzed in parallel, 0 uses all CPUs
+        confidence: Confidence level of the bootstrap intervals
+        resamples: Number of bootstrap resamples
+        seed: Seed of the bootstrap resampling
+        allow_mixed: Aggregate runs with different node counts, with a warning
+
+    Returns:
+        JSON-serialisable dictionary
+
+    Raises:
+        ValueError: If the runs have different node counts and not allow_mixed
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(folders)))
+    if jobs == 1:
+        results = [_analyse_run(folder, skip_messages) for folder in folders]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(
+                pool.map(_analyse_run, folders, [skip_messages] * len(folders))
+            )
+
+    node_counts = {summary["total_nodes"] for summary, _ in results}
+    if len(node_counts) > 1:
+        mismatch = (
+            f"runs have different node counts {sorted(node_counts)}, "
+            "they may not be of the same scenario"
+        )
+        if not allow_mixed:
+            raise ValueError(mismatch)
+        print(f"Warning: {mismatch}", file=sys.stderr)
+
+    per_run = [run_metrics(summary) for summary, _ in results]
+    rng = np.random.default_rng(seed)
+    metrics = {}
+    for name in per_run[0] if per_run else []:
+        values = np.array([run[name] for run in per_run if name in run])
+        low, high = bootstrap_mean_ci(values, confidence, resamples, rng)
+        metrics[name] = {
+            "runs": len(values),
+            "mean": float(values.mean()),
+            "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+            "ci_low": low,
+            "ci_high": high,
+        }
+
+    pooled = np.sort(np.concatenate([latencies for _, latencies in results]))
+    pooled_latency = {}
+    if len(pooled):
+        quantiles = np.array(LATENCY_PERCENTILES) / 100
+        positions = np.minimum(
+            (quantiles * len(pooled)).astype(np.int64), len(pooled) - 1
+        )
+        pooled_latency = {
+            f"p{p:g}": float(value / 1e9)
+            for p, value in zip(LATENCY_PERCENTILES, pooled[positions])
+        }
+
+    return {
+        "runs": [
+            {"folder": folder, **metrics_of_run}
+            for folder, metrics_of_run in zip(folders, per_run)
+        ],
+        "confidence": confidence,
+        "resamples": resamples,
+        "metrics": metrics,
+        "pooled": {"deliveries": len(pooled), "latency": pooled_latency},
+        "simulation": simulation_cost(folders),
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Render the aggregated metrics as a table."""
+    confidence = f"{summary['confidence']:.0%} CI"
+    lines = [
+        f"{len(summary['runs'])} runs",
+        f"{'metric':<26} {'mean':>10} {'std':>10}  {confidence}",
+    ]
+    for name, stats in summary["metrics"].items():
+        lines.append(
+            f"{name:<26} {stats['mean']:>10.4f} {stats['std']:>10.4f}  "
+            f"[{stats['ci_low']:.4f}, {stats['ci_high']:.4f}]"
+        )
+    pooled = summary["pooled"]
+    lines.append(
+        f"Pooled latency over {pooled['deliveries']} deliveries: "
+        + ", ".join(f"{p} {value:.4f}s" for p, value in pooled["latency"].items())
+    )
+    groups = summary["simulation"]["by_node_count"]
+    if groups:
+        lines.append(
+            f"{'nodes':>8} {'runs':>5} {'sim s/wall s':>13} {'wall s':>10} {'peak RSS':>10}"
+        )
+        for node_count, group in groups.items():
+            speed = group["sim_seconds_per_wall_second"]
+            lines.append(
+                f"{node_count:>8} {group['runs']:>5} "
+                f"{'n/a' if speed is None else f'{speed:.3f}':>13} "
+                f"{group['mean_wall_seconds']:>10.1f} "
+                f"{group['max_peak_rss_bytes'] / 2**30:>7.2f}GiB"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate the analysis of several runs of the same scenario"
+    )
+    parser.add_argument("folders", nargs="+", help="Shadow output folders")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="File to write the aggregate JSON to (default: print only)",
+    )
+    parser.add_argument(
+        "-s",
+        "--skip",
+        type=int,
+        default=0,
+        help="Number of messages to skip from the beginning of every run (default: 0)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="Number of runs analyzed in parallel, 0 uses all CPUs (default: 0)",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=DEFAULT_CONFIDENCE,
+        help=f"Confidence level of the bootstrap intervals (default: {DEFAULT_CONFIDENCE})",
+    )
+    parser.add_argument(
+        "--resamples",
+        type=int,
+        default=DEFAULT_BOOTSTRAP_RESAMPLES,
+        help=f"Number of bootstrap resamples (default: {DEFAULT_BOOTSTRAP_RESAMPLES})",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the bootstrap resampling (default: 0)",
+    )
+    parser.add_argument(
+        "--allow-mixed",
+        action="store_true",
+        help="Aggregate runs with different node counts, e.g. to compare the "
+        "simulation cost of network sizes, instead of failing",
+    )
+    args = parser.parse_args()
+
+    try:
+        summary = aggregate_runs(
+            args.folders,
+            args.skip,
+            args.jobs,
+            args.confidence,
+            args.resamples,
+            args.seed,
+            args.allow_mixed,
+        )
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
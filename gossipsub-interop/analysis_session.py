@@ -0,0 +1,446 @@
+"""
+Analysis state for a single Shadow output directory.
+
+All state derived from parsing an output directory lives on an
+AnalysisSession, so any number of sessions can run back to back or at the
+same time (e.g. in threads) in one long-lived process without affecting each
+other. This module does not import any plotting dependencies.
+"""
+
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from delivery_store import DeliveryStore, DeliveryStoreBuilder
+from experiment import IMPLEMENTATIONS
+from log_ingest import FileParseResult, NodeId, log_node_id, parse_log_files
+
+# Latency percentiles reported in analysis.json
+LATENCY_PERCENTILES = (50, 90, 95, 99, 99.9)
+# Number of points in the reach over time series of analysis.json
+REACH_OVER_TIME_POINTS = 100
+
+
+def parse_node_id_to_network_id(
+    shadow_yaml_path: str,
+) -> Tuple[Dict[NodeId, int], Dict[int, List[NodeId]]]:
+    """
+    Parse shadow.yaml file and return mappings between node_id and network_node_id.
+
+    Args:
+        shadow_yaml_path: Path to the shadow.yaml file
+
+    Returns:
+        Tuple containing:
+        - Dictionary mapping NodeId to network_node_id (int)
+        - Dictionary mapping network_node_id (int) to List[NodeId]
+    """
+    node_to_network_mapping = {}
+    network_to_nodes_mapping = defaultdict(list)
+
+    try:
+        with open(shadow_yaml_path, "r") as f:
+            shadow_config = yaml.safe_load(f)
+
+        if "hosts" in shadow_config:
+            for host_name, host_config in shadow_config["hosts"].items():
+                # Extract node_id from host name (e.g., "node0" -> 0)
+                if host_name.startswith("node"):
+                    try:
+                        node_id_str = host_name[4:]  # Remove "node" prefix
+                        node_id = NodeId(int(node_id_str))
+                        network_node_id = host_config.get("network_node_id")
+                        if network_node_id is not None:
+                            node_to_network_mapping[node_id] = network_node_id
+                            network_to_nodes_mapping[network_node_id].append(node_id)
+                    except ValueError:
+                        # Skip hosts that don't follow the "nodeX" pattern
+                        continue
+
+    except (FileNotFoundError, yaml.YAMLError) as e:
+        print(f"Warning: Could not parse shadow.yaml file: {e}")
+
+    return node_to_network_mapping, dict(network_to_nodes_mapping)
+
+
+def parse_gml_node_labels(gml_file_path: str) -> Dict[int, str]:
+    """
+    Parse a GML file and return a mapping from node ID to label.
+
+    Args:
+        gml_file_path: Path to the GML file
+
+    Returns:
+        Dictionary mapping node ID (int) to label (str)
+    """
+    node_id_to_label = {}
+
+    try:
+        with open(gml_file_path, "r") as f:
+            content = f.read()
+
+        # Find all node blocks using regex
+        node_pattern = r"node\s*\[([^\]]*)\]"
+        node_matches = re.findall(node_pattern, content, re.DOTALL)
+
+        for node_content in node_matches:
+            # Extract id and label from node content
+            id_match = re.search(r"id\s+(\d+)", node_content)
+            label_match = re.search(r'label\s+"([^"]*)"', node_content)
+
+            if id_match and label_match:
+                node_id = int(id_match.group(1))
+                label = label_match.group(1)
+                node_id_to_label[node_id] = label
+
+    except (FileNotFoundError, IOError) as e:
+        print(f"Warning: Could not parse GML file {gml_file_path}: {e}")
+
+    return node_id_to_label
+
+
+def parse_node_implementations(shadow_yaml_path: str) -> Dict[int, str]:
+    """
+    Parse shadow.yaml and return the implementation each node runs.
+
+    The binary path of each host is mapped back to its short name in
+    experiment.IMPLEMENTATIONS. Unknown binaries are named by their path.
+
+    Args:
+        shadow_yaml_path: Path to the shadow.yaml file
+
+    Returns:
+        Dictionary mapping node ID (int) to implementation name (e.g. "go")
+    """
+    path_to_implementation = {
+        os.path.normpath(path): name for name, path in IMPLEMENTATIONS.items()
+    }
+    node_implementations = {}
+    try:
+        with open(shadow_yaml_path, "r") as f:
+            shadow_config = yaml.safe_load(f)
+    except (FileNotFoundError, yaml.YAMLError) as e:
+        print(f"Warning: Could not parse shadow.yaml file: {e}")
+        return node_implementations
+
+    for host_name, host_config in shadow_config.get("hosts", {}).items():
+        if not host_name.startswith("node") or not host_name[4:].isdigit():
+            continue
+        processes = host_config.get("processes") or [{}]
+        path = os.path.normpath(processes[0].get("path", ""))
+        node_implementations[int(host_name[4:])] = path_to_implementation.get(
+            path, path
+        )
+    return node_implementations
+
+
+@dataclass
+class MessageMetrics:
+    """Per-message summary metrics, one entry per message in delivery order."""
+
+    message_ids: List[str]
+    # Seconds from the first to the last delivery
+    time_to_disseminate: np.ndarray
+    # Seconds from the first delivery until half of the receivers had it
+    p50_to_disseminate: np.ndarray
+    avg_duplicates: np.ndarray
+    # Fraction of the non-publishing nodes that received the message
+    reached: np.ndarray
+
+
+class AnalysisSession:
+    """
+    Owns all parse state of one Shadow output directory.
+
+    Logs are parsed lazily on first access and the results are kept on the
+    session, so several analyses of the same directory only parse it once.
+
+    Sent messages and control events are only parsed for analyses that read
+    control_results. Pass control=True when the session will serve such an
+    analysis, so the logs are not parsed a second time.
+    """
+
+    def __init__(
+        self, folder, jobs: int = 1, use_cache: bool = True, control: bool = False
+    ):
+        self.folder = folder
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.control = control
+        self.peer_id_to_node_id: Dict[str, int] = {}
+        self.node_id_to_peer_id: Dict[int, str] = {}
+        self._file_results: Optional[List[FileParseResult]] = None
+        self._store: Optional[DeliveryStore] = None
+        self._lock = threading.Lock()
+
+    def _ingest(self, control: bool = False):
+        with self._lock:
+            if self._store is not None and (self.control or not control):
+                return
+            self.control = self.control or control
+            builder = DeliveryStoreBuilder()
+            file_results = []
+            for result in parse_log_files(
+                self.folder, self.jobs, self.use_cache, self.control
+            ):
+                # Logs without a PeerID take the node of their host directory
+                node_id = log_node_id(result)
+                if node_id is not None and node_id != result.node_id.id:
+                    result.node_id = NodeId(node_id)
+                if result.peer_id is not None:
+                    self.peer_id_to_node_id[result.peer_id] = result.node_id.id
+                    self.node_id_to_peer_id[result.node_id.id] = result.peer_id
+
+                builder.add(
+                    result.node_id.id,
+                    result.message_ids,
+                    result.timestamps_ns,
+                    result.duplicate_counts,
+                )
+                file_results.append(result)
+            self._file_results = file_results
+            self._store = builder.build()
+
+    def feed(self, *consumers):
+        """
+        Pass the parsed result of every log file to each consumer.
+
+        The logs are parsed (or loaded from the parse cache) once per session,
+        and every result goes to all the consumers before the next one, so a
+        reach check, a completion count and the analysis can share one pass
+        over the logs.
+
+        Args:
+            consumers: Objects with an add(result) method, called with each
+                FileParseResult in logfile_iterator order
+        """
+        for result in self.file_results:
+            for consumer in consumers:
+                consumer.add(result)
+
+    @property
+    def file_results(self) -> List[FileParseResult]:
+        """Parsed result of every log file in the directory."""
+        self._ingest()
+        return self._file_results
+
+    @property
+    def control_results(self) -> List[FileParseResult]:
+        """Parsed result of every log file, including sent messages and control events."""
+        self._ingest(control=True)
+        return self._file_results
+
+    @property
+    def store(self) -> DeliveryStore:
+        """Deliveries of every message, ordered by first delivery time."""
+        self._ingest()
+        return self._store
+
+    @property
+    def total_nodes(self) -> int:
+        """Number of nodes that logged their peer ID."""
+        self._ingest()
+        return len(self.node_id_to_peer_id)
+
+    def node_networks(self) -> Dict[int, int]:
+        """Dictionary mapping node ID to its network_node_id in shadow.yaml."""
+        node_to_network_mapping, _ = parse_node_id_to_network_id(
+            f"{self.folder}/shadow.yaml"
+        )
+        return {
+            node_id.id: network_id
+            for node_id, network_id in node_to_network_mapping.items()
+        }
+
+    def node_implementations(self) -> Dict[int, str]:
+        """Dictionary mapping node ID to the implementation it runs."""
+        return parse_node_implementations(f"{self.folder}/shadow.yaml")
+
+    def network_labels(self) -> Dict[int, str]:
+        """Dictionary mapping network_node_id to its label in graph.gml."""
+        return parse_gml_node_labels(f"{self.folder}/graph.gml")
+
+    def message_metrics(self, skip_messages: int = 0) -> MessageMetrics:
+        """
+        Compute the per-message summary metrics.
+
+        Args:
+            skip_messages: Number of (warmup) messages to skip from the beginning
+
+        Returns:
+            MessageMetrics for the remaining messages
+        """
+        store = self.store.skip(skip_messages)
+        total_nodes = self.total_nodes
+
+        delivery_counts = store.delivery_counts()
+        over_delivered = np.flatnonzero(delivery_counts > total_nodes)
+        if len(over_delivered):
+            raise ValueError(
+                f"Message {store.message_ids[over_delivered[0]]} was delivered to more nodes than exist"
+            )
+
+        return MessageMetrics(
+            message_ids=store.message_ids,
+            time_to_disseminate=(store.last_delivery_ns() - store.first_delivery_ns())
+            / 1e9,
+            p50_to_disseminate=store.nth_latency_ns(delivery_counts // 2) / 1e9,
+            avg_duplicates=store.duplicate_counts / total_nodes,
+            # Minus 1 for the original sender. We can overshoot when the
+            # original publisher receives a duplicate of its own message.
+            reached=np.minimum(delivery_counts / (total_nodes - 1), 1.0),
+        )
+
+    def analysis_summary(
+        self, skip_messages: int = 0, reach_points: int = REACH_OVER_TIME_POINTS
+    ) -> dict:
+        """
+        Build the machine-readable analysis of the run, as written to analysis.json.
+
+        Contains the per-message metrics of analysis.txt plus the latency
+        percentiles of every message, run-wide distributions over all
+        deliveries and messages, and the mean and minimum reach over time.
+        All durations are in seconds.
+
+        Args:
+            skip_messages: Number of (warmup) messages to skip from the beginning
+            reach_points: Number of points in the reach over time series
+
+        Returns:
+            JSON-serialisable dictionary
+        """
+        metrics = self.message_metrics(skip_messages)
+        store = self.store.skip(skip_messages)
+        total_nodes = self.total_nodes
+        quantiles = [p / 100 for p in LATENCY_PERCENTILES]
+
+        message_percentiles = store.latency_quantiles_ns(quantiles) / 1e9
+        messages = []
+        for i, message_id in enumerate(metrics.message_ids):
+            messages.append(
+                {
+                    "id": message_id,
+                    "deliveries": int(store.offsets[i + 1] - store.offsets[i]),
+                    "time_to_disseminate": float(metrics.time_to_disseminate[i]),
+                    "avg_duplicates": float(metrics.avg_duplicates[i]),
+                    "reached": float(metrics.reached[i]),
+                    "latency": _percentile_dict(message_percentiles[i]),
+                }
+            )
+
+        # Nearest-rank percentiles over every delivery of every message
+        latencies = np.sort(store.latency_ns())
+        run_latency = {}
+        if len(latencies):
+            positions = np.minimum(
+                (np.array(quantiles) * len(latencies)).astype(np.int64),
+                len(latencies) - 1,
+            )
+            run_latency = _percentile_dict(latencies[positions] / 1e9)
+
+        reach_over_time = {"time": [], "mean": [], "min": []}
+        if len(store):
+            grid_ns = np.linspace(0, latencies[-1], reach_points).astype(np.int64)
+            reach = np.minimum(
+                store.delivered_within_ns(grid_ns) / max(total_nodes - 1, 1), 1.0
+            )
+            reach_over_time = {
+                "time": (grid_ns / 1e9).tolist(),
+                "mean": reach.mean(axis=0).tolist(),
+                "min": reach.min(axis=0).tolist(),
+            }
+
+        return {
+            "folder": str(self.folder),
+            "total_nodes": total_nodes,
+            "skipped_messages": skip_messages,
+            "percentiles": list(LATENCY_PERCENTILES),
+            "run": {
+                "messages": len(store),
+                "deliveries": store.num_deliveries,
+                "latency": run_latency,
+                "time_to_disseminate": _distribution(metrics.time_to_disseminate),
+                "p50_to_disseminate": _distribution(metrics.p50_to_disseminate),
+                "avg_duplicates": _distribution(metrics.avg_duplicates),
+                "reached": _distribution(metrics.reached),
+            },
+            "messages": messages,
+            "reach_over_time": reach_over_time,
+        }
+
+
+def _percentile_dict(values) -> Dict[str, float]:
+    return {f"p{p:g}": float(value) for p, value in zip(LATENCY_PERCENTILES, values)}
+
+
+def _distribution(values: np.ndarray) -> Dict[str, float]:
+    """Mean, extremes and percentiles of a per-message metric."""
+    if not len(values):
+        return {}
+    return {
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        **_percentile_dict(np.percentile(values, LATENCY_PERCENTILES)),
+    }
+
+
+def ratio(numerator: float, denominator: float) -> Optional[float]:
+    """numerator / denominator, or None when the denominator is zero."""
+    return numerator / denominator if denominator else None
+
+
+def add_report_arguments(
+    parser: argparse.ArgumentParser, filename: str, skip: bool = True
+):
+    """
+    Add the arguments shared by the report commands to parser.
+
+    Args:
+        parser: Parser of the report command
+        filename: Name of the file the report writes, for the --output help
+        skip: Whether the report takes -s/--skip
+    """
+    parser.add_argument("folder", help="Shadow output folder")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help=f"Folder to write {filename} to (default: <folder>/plots)",
+    )
+    if skip:
+        parser.add_argument(
+            "-s",
+            "--skip",
+            type=int,
+            default=0,
+            help="Number of messages to skip from the beginning (default: 0)",
+        )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse log files, 0 uses all CPUs (default: 1)",
+    )
+
+
+def report_path(args: argparse.Namespace, filename: str) -> str:
+    """Path of filename in the report's output folder, which is created."""
+    output_folder = args.output or os.path.join(args.folder, "plots")
+    os.makedirs(output_folder, exist_ok=True)
+    return os.path.join(output_folder, filename)
+
+
+def write_json_report(args: argparse.Namespace, filename: str, summary: dict):
+    """Write summary as filename in the report's output folder."""
+    with open(report_path(args, filename), "w") as f:
+        json.dump(summary, f, indent=2)
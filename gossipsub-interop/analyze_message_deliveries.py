@@ -1,261 +1,79 @@
-from collections import defaultdict, OrderedDict
-import json
 import os
 import argparse
-from datetime import datetime
-from typing import Dict, List, Tuple, OrderedDict as OrderedDictType
-from dataclasses import dataclass
-import matplotlib.pyplot as plt
-import yaml
-import re
-
-peer_id_to_node_id = dict()
-node_id_to_peer_id = dict()
-
-
-@dataclass(frozen=True)
-class MessageId:
-    id: str
-
-
-@dataclass(frozen=True)
-class NodeId:
-    id: int
-
-
-@dataclass
-class MessageDelivery:
-    timestamp: datetime
-    node_id: NodeId
-
-
-@dataclass
-class FileParseResult:
-    node_id: NodeId
-    message_deliveries: OrderedDictType[MessageId, List[MessageDelivery]]
-    duplicate_counts: Dict[MessageId, int]
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+from analysis_session import (
+    AnalysisSession,
+    parse_gml_node_labels,  # noqa: F401 (re-exported)
+    parse_node_id_to_network_id,  # noqa: F401 (re-exported)
+)
+from bandwidth import bandwidth_summary
+from control_plane import control_plane_summary
+from dissemination import dissemination_summary
+from event_db import build_event_db
+from implementation_matrix import implementation_summary
+from live_analysis import follow
+from partial_assembly import partial_summary
+from region_latency import region_latency, write_region_latency_csv
+from streaming_analysis import streaming_summary, write_analysis_txt
+from throughput import throughput, write_throughput_csv
+
+# pyplot keeps global state, so concurrent analyses take turns drawing
+_plot_lock = threading.Lock()
+
+# Maximum number of points drawn per message in the delivery CDF
+CDF_POINTS_PER_MESSAGE = 50
 
 
 def nodeIDFromFilename(filename):
     return filename.split(".")[0]
 
 
-def parse_node_id_to_network_id(
-    shadow_yaml_path: str,
-) -> Tuple[Dict[NodeId, int], Dict[int, List[NodeId]]]:
+def downsample_cdf(latencies_ns: np.ndarray, max_points: int = CDF_POINTS_PER_MESSAGE):
     """
-    Parse shadow.yaml file and return mappings between node_id and network_node_id.
+    Reduce the delivery CDF of one message to at most max_points points.
 
-    Args:
-        shadow_yaml_path: Path to the shadow.yaml file
-
-    Returns:
-        Tuple containing:
-        - Dictionary mapping NodeId to network_node_id (int)
-        - Dictionary mapping network_node_id (int) to List[NodeId]
-    """
-    node_to_network_mapping = {}
-    network_to_nodes_mapping = defaultdict(list)
-
-    try:
-        with open(shadow_yaml_path, "r") as f:
-            shadow_config = yaml.safe_load(f)
-
-        if "hosts" in shadow_config:
-            for host_name, host_config in shadow_config["hosts"].items():
-                # Extract node_id from host name (e.g., "node0" -> 0)
-                if host_name.startswith("node"):
-                    try:
-                        node_id_str = host_name[4:]  # Remove "node" prefix
-                        node_id = NodeId(int(node_id_str))
-                        network_node_id = host_config.get("network_node_id")
-                        if network_node_id is not None:
-                            node_to_network_mapping[node_id] = network_node_id
-                            network_to_nodes_mapping[network_node_id].append(node_id)
-                    except ValueError:
-                        # Skip hosts that don't follow the "nodeX" pattern
-                        continue
-
-    except (FileNotFoundError, yaml.YAMLError) as e:
-        print(f"Warning: Could not parse shadow.yaml file: {e}")
-
-    return node_to_network_mapping, dict(network_to_nodes_mapping)
-
-
-def parse_gml_node_labels(gml_file_path: str) -> Dict[int, str]:
-    """
-    Parse a GML file and return a mapping from node ID to label.
+    The first and last deliveries are always kept, the rest are evenly spaced
+    by rank.
 
     Args:
-        gml_file_path: Path to the GML file
+        latencies_ns: Sorted delivery latencies of one message in nanoseconds
+        max_points: Maximum number of points to keep
 
     Returns:
-        Dictionary mapping node ID (int) to label (str)
+        Tuple of (latencies in seconds, number of nodes holding the message)
     """
-    node_id_to_label = {}
-
-    try:
-        with open(gml_file_path, "r") as f:
-            content = f.read()
-
-        # Find all node blocks using regex
-        node_pattern = r"node\s*\[([^\]]*)\]"
-        node_matches = re.findall(node_pattern, content, re.DOTALL)
-
-        for node_content in node_matches:
-            # Extract id and label from node content
-            id_match = re.search(r"id\s+(\d+)", node_content)
-            label_match = re.search(r'label\s+"([^"]*)"', node_content)
-
-            if id_match and label_match:
-                node_id = int(id_match.group(1))
-                label = label_match.group(1)
-                node_id_to_label[node_id] = label
-
-    except (FileNotFoundError, IOError) as e:
-        print(f"Warning: Could not parse GML file {gml_file_path}: {e}")
-
-    return node_id_to_label
-
-
-def logfile_iterator(folder):
-    """
-    Returns a list of all the log files in the folder.
-
-    Special case for shadow data folders by identifying the "hosts" subfolder.
-
-    Otherwise, returns a list of all the files in the folder.
-    """
-    files = os.listdir(folder)
-    if "hosts" in files:
-        for host in os.listdir(os.path.join(folder, "hosts")):
-            for file in os.listdir(os.path.join(folder, "hosts", host)):
-                if file.endswith(".stdout"):
-                    yield os.path.join(folder, "hosts", host, file)
-    else:
-        for file in files:
-            yield os.path.join(folder, file)
-
-
-def plot_msg_delivery_cdf(plt, deliveries, label=None):
-    if not deliveries:
-        return
-
-    # Sort deliveries by timestamp
-    sorted_deliveries = sorted(deliveries, key=lambda x: x.timestamp)
-
-    # Get the initial timestamp as reference point
-    start_time = sorted_deliveries[0].timestamp
-
-    # Calculate time differences from start and cumulative count
-    times = []
-    cumulative_count = []
-
-    for i, delivery in enumerate(sorted_deliveries):
-        time_diff = (delivery.timestamp - start_time).total_seconds()
-        times.append(time_diff)
-        cumulative_count.append(i + 1)
-
-    # Plot the CDF with label
-    plt.plot(times, cumulative_count, marker="o", markersize=2, alpha=0.7, label=label)
-
-
-def parse_log_file(lines) -> FileParseResult:
-    """
-    Parse all lines from a log file iterator and extract relevant information.
-
-    Args:
-        lines: Iterator of log lines from a file
-
-    Returns:
-        FileParseResult containing parsed data from the file
-    """
-    node_id = NodeId(-1)
-    seen_message_ids = set()
-    message_deliveries = defaultdict(list)
-    duplicate_counts = defaultdict(int)
-
-    for line in lines:
-        try:
-            parsed = json.loads(line)
-        except json.JSONDecodeError:
-            continue
-
-        if "msg" not in parsed:
-            continue
-
-        msg_type = parsed["msg"]
-
-        if msg_type == "PeerID":
-            parsed_node_id = parsed.get("node_id", "")
-            peer_id = parsed.get("id", "")
-            node_id = NodeId(parsed_node_id)
-            peer_id_to_node_id[peer_id] = parsed_node_id
-            node_id_to_peer_id[parsed_node_id] = peer_id
-            continue
-
-        if msg_type == "Received Message" and "time" in parsed:
-            timestamp = datetime.fromisoformat(parsed["time"])
-            message_id_str = parsed.get("id", "")
-            if message_id_str:
-                message_id = MessageId(message_id_str)
-                if message_id_str not in seen_message_ids:
-                    seen_message_ids.add(message_id_str)
-                    message_deliveries[message_id].append(
-                        MessageDelivery(timestamp, node_id)
-                    )
-                else:
-                    duplicate_counts[message_id] += 1
-
-    # Sort message_deliveries by first delivery time
-    sorted_message_deliveries = OrderedDict()
-    message_items = list(message_deliveries.items())
-    message_items.sort(key=lambda x: x[1][0].timestamp if x[1] else datetime.max)
-
-    for msg_id, deliveries in message_items:
-        sorted_message_deliveries[msg_id] = deliveries
-
-    return FileParseResult(
-        node_id=node_id,
-        message_deliveries=sorted_message_deliveries,
-        duplicate_counts=dict(duplicate_counts),
-    )
+    ranks = np.arange(len(latencies_ns))
+    if len(latencies_ns) > max_points:
+        ranks = np.unique(
+            np.linspace(0, len(latencies_ns) - 1, max_points).round().astype(np.int64)
+        )
+    return latencies_ns[ranks] / 1e9, ranks + 1
 
 
-def create_node_delivery_times_mapping(
-    ordered_messages: OrderedDict[MessageId, List[MessageDelivery]],
-) -> Dict[NodeId, Dict[MessageId, float]]:
+def plot_msg_delivery_cdf(plt, times: np.ndarray, counts: np.ndarray, label=None):
     """
-    Create a mapping from NodeID to Dict[MessageID, TimeToDeliver(as seconds)].
+    Plot the number of nodes holding a message against time since its first delivery.
 
     Args:
-        ordered_messages: OrderedDict mapping MessageId to list of MessageDelivery
-
-    Returns:
-        Dictionary mapping NodeId to Dict[MessageId, delivery_time_in_seconds]
-        where delivery_time_in_seconds is the time from first delivery to this node's delivery
+        plt: matplotlib.pyplot object
+        times: Delivery latencies of one message in seconds
+        counts: Number of nodes holding the message at each latency
+        label: Legend label for the message
     """
-    node_delivery_times: Dict[NodeId, Dict[MessageId, float]] = defaultdict(dict)
-
-    for msg_id, deliveries in ordered_messages.items():
-        if not deliveries:
-            continue
-
-        # First delivery timestamp for this message
-        first_delivery_time = deliveries[0].timestamp
-
-        # Calculate delivery time for each node
-        for delivery in deliveries:
-            time_to_deliver = (delivery.timestamp - first_delivery_time).total_seconds()
-            node_delivery_times[delivery.node_id][msg_id] = time_to_deliver
+    if not len(times):
+        return
 
-    return dict(node_delivery_times)
+    plt.plot(times, counts, marker="o", markersize=2, alpha=0.7, label=label)
 
 
 def plot_delivery_times_per_network_id(
     plt,
-    network_to_nodes_mapping: Dict[int, List[NodeId]],
-    node_delivery_times: Dict[NodeId, Dict[MessageId, float]],
+    network_delivery_times: Dict[int, np.ndarray],
     network_to_label: Dict[int, str],
 ):
     """
@@ -266,37 +84,23 @@ def plot_delivery_times_per_network_id(
 
     Args:
         plt: matplotlib.pyplot object
-        network_to_nodes_mapping: Dictionary mapping network_id (int) to list of NodeIds in that network
-        node_delivery_times: Dictionary mapping NodeId to Dict[MessageId, delivery_time_in_seconds]
+        network_delivery_times: Dictionary mapping network_id (int) to the delivery
+            latencies (ns) of the nodes in that network
+        network_to_label: Dictionary mapping network_id (int) to its label
     """
-    if not network_to_nodes_mapping or not node_delivery_times:
-        return
-
-    # Collect delivery times for each network ID (geographical/logical network segment)
-    network_delivery_times = {}
-
-    for network_id, nodes_in_network in network_to_nodes_mapping.items():
-        all_delivery_times_for_network = []
-
-        # For each node in this network segment, collect all their delivery times
-        for node_id in nodes_in_network:
-            if node_id in node_delivery_times:
-                # Collect all delivery times for this specific node across all messages
-                for msg_id, delivery_time in node_delivery_times[node_id].items():
-                    all_delivery_times_for_network.append(delivery_time)
-
-        if (
-            all_delivery_times_for_network
-        ):  # Only include networks that have delivery data
-            network_delivery_times[network_id] = all_delivery_times_for_network
-
+    # Only include networks that have delivery data
+    network_delivery_times = {
+        network_id: latencies
+        for network_id, latencies in network_delivery_times.items()
+        if len(latencies)
+    }
     if not network_delivery_times:
         return
 
     # Prepare data for box plot - one box per network ID
-    delivery_data: List[List[float]] = []
+    delivery_data: List[np.ndarray] = []
     for network_id in sorted(network_delivery_times.keys()):
-        delivery_data.append(network_delivery_times[network_id])
+        delivery_data.append(network_delivery_times[network_id] / 1e9)
 
     # Create the box plot
     plt.figure(figsize=(12, 8))
@@ -323,135 +127,331 @@ def plot_delivery_times_per_network_id(
     plt.tight_layout()
 
 
-def analyse_message_deliveries(folder, output_folder="plots", skip_messages=0):
+def analyse_message_deliveries(
+    folder,
+    output_folder="plots",
+    skip_messages=0,
+    jobs: int = 1,
+    use_cache=True,
+    session: AnalysisSession = None,
+    plots: Optional[Sequence[str]] = None,
+    cdf_points: int = CDF_POINTS_PER_MESSAGE,
+    event_db: bool = False,
+    reports: Sequence[str] = (),
+):
+    """
+    Analyse the message deliveries of a Shadow output directory.
+
+    Writes analysis.txt, analysis.json, the selected plots and the selected
+    reports (see REPORTS) to output_folder. Sent messages and control events
+    are only parsed when a report or plot that needs them is selected.
+
+    Args:
+        folder: Shadow output directory
+        output_folder: Folder for the analysis and plots
+        skip_messages: Number of (warmup) messages to skip from the beginning
+        jobs: Number of worker processes used to parse log files, 0 uses all CPUs
+        use_cache: Reuse the parsed log cache in the folder
+        session: Existing session of the folder, to reuse its parsed logs
+        plots: Names of the plots to draw (see PLOTS), None draws DEFAULT_PLOTS
+            and the plots of the selected reports
+        cdf_points: Maximum number of points drawn per message in the CDF plot
+        event_db: Also load the parsed events into events.sqlite in folder
+        reports: Names of the extra reports to write (see REPORTS)
+    """
+    unknown = set(reports) - set(REPORTS)
+    if unknown:
+        raise ValueError(f"Unknown reports {unknown}, expected one of {list(REPORTS)}")
+    if plots is None:
+        plots = list(DEFAULT_PLOTS) + [
+            name for name, report in REPORT_PLOTS.items() if report in reports
+        ]
+    control = bool(CONTROL_REPORTS & set(reports)) or "throughput" in plots or event_db
+    if session is None:
+        session = AnalysisSession(folder, jobs, use_cache, control=control)
+    store = session.store.skip(skip_messages)
+    metrics = session.message_metrics(skip_messages)
+
     analysis_txt = []
-    messages: Dict[MessageId, List[MessageDelivery]] = defaultdict(list)
-    duplicate_count: Dict[MessageId, int] = defaultdict(lambda: 0)
-
-    for file in logfile_iterator(folder):
-        with open(file, "r") as f:
-            result = parse_log_file(f)
-
-            # Add message deliveries to messages dict
-            for msg_id, deliveries in result.message_deliveries.items():
-                for delivery in deliveries:
-                    messages[msg_id].append(delivery)
-
-            # Add duplicate counts to counters
-            for msg_id, count in result.duplicate_counts.items():
-                duplicate_count[msg_id] += count
-
-    # Sort messages by first delivery time
-    ordered_messages: OrderedDict[MessageId, List[MessageDelivery]] = OrderedDict()
-    message_items = list(messages.items())
-    message_items.sort(key=lambda x: x[1][0].timestamp if x[1] else datetime.max)
-
-    for msg_id, deliveries in message_items:
-        deliveries.sort(key=lambda x: x.timestamp)
-        ordered_messages[msg_id] = deliveries
-
-    # Skip the first N messages if requested
-    if skip_messages > 0:
-        ordered_messages_list = list(ordered_messages.items())
-        if skip_messages < len(ordered_messages_list):
-            ordered_messages = OrderedDict(ordered_messages_list[skip_messages:])
-        else:
-            ordered_messages = OrderedDict()
-
-    # Prepare data for plotting
-    msg_ids: List[MessageId] = []
-    time_diffs: List[float] = []
-    avg_duplicates: List[float] = []
-
-    total_nodes = len(node_id_to_peer_id)
-
-    for msgID, deliveries in ordered_messages.items():
-        time_diff = (deliveries[-1].timestamp - deliveries[0].timestamp).total_seconds()
-        p50Idx = len(deliveries) // 2
-        p50 = (deliveries[p50Idx].timestamp - deliveries[0].timestamp).total_seconds()
-
-        msg_ids.append(msgID)
-        time_diffs.append(time_diff)
-        avg_duplicate_count = duplicate_count[msgID] / total_nodes
-        avg_duplicates.append(avg_duplicate_count)
-        # Minus 1 for the original sender
-        reached = len(deliveries) / (total_nodes - 1)
-        if reached > 1.0:
-            if len(deliveries) > total_nodes:
-                raise ValueError(
-                    f"Message {msgID.id} was delivered to more nodes than exist"
-                )
-            # We overshot because the original publisher received a duplicate message
-            reached = 1.0
+    msg_ids = metrics.message_ids
+    time_diffs = metrics.time_to_disseminate.tolist()
+    avg_duplicates = metrics.avg_duplicates.tolist()
+    for msgID, time_diff, p50, avg_duplicate_count, reach in zip(
+        msg_ids,
+        time_diffs,
+        metrics.p50_to_disseminate.tolist(),
+        avg_duplicates,
+        metrics.reached.tolist(),
+    ):
         analysis_txt.append(
-            f"{msgID.id}, {time_diff}s, {p50}s, {avg_duplicate_count}, {reached}"
+            f"{msgID}, {time_diff}s, {p50}s, {avg_duplicate_count}, {reach}"
+        )
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    regions = None
+    if "region-latency" in reports or "regions" in plots:
+        regions = region_latency(session, skip_messages)
+    series = None
+    if "throughput" in reports or "throughput" in plots:
+        # Covers the whole run, warmup messages included
+        series = throughput(session)
+
+    # Only gather the data of the plots that will be drawn
+    plot_tasks = []
+    for name in plots:
+        if name == "delivery-times":
+            args = (msg_ids, time_diffs)
+        elif name == "duplicates":
+            args = (msg_ids, avg_duplicates)
+        elif name == "networks":
+            args = (
+                store.latencies_by_group(session.node_networks()),
+                session.network_labels(),
+            )
+        elif name == "cdf":
+            latencies_ns = store.latency_ns()
+            args = (
+                msg_ids,
+                [
+                    downsample_cdf(
+                        latencies_ns[store.offsets[i] : store.offsets[i + 1]],
+                        cdf_points,
+                    )
+                    for i in range(len(msg_ids))
+                ],
+            )
+        elif name == "regions":
+            args = (regions.regions, regions.percentiles[:, :, 0], regions.link_latency)
+        elif name == "throughput":
+            args = (series,)
+        else:
+            raise ValueError(f"Unknown plot {name}, expected one of {list(PLOTS)}")
+        plot_tasks.append((name, output_folder, args))
+    render_plots(plot_tasks)
+
+    # Print the analysis and save it to a file
+    with open(f"{output_folder}/analysis.txt", "w") as f:
+        f.write(
+            "Message ID, Time to Disseminate, p50 to Disseminate, Avg Duplicate Count, Reached percent\n"
         )
+        for line in analysis_txt:
+            f.write(line + "\n")
+
+    with open(f"{output_folder}/analysis.json", "w") as f:
+        json.dump(session.analysis_summary(skip_messages), f, indent=2)
+
+    if "region-latency" in reports:
+        write_region_latency_csv(f"{output_folder}/region_latency.csv", regions)
+    if "throughput" in reports:
+        write_throughput_csv(f"{output_folder}/throughput.csv", series)
+
+    if "control-plane" in reports:
+        with open(f"{output_folder}/control_plane.json", "w") as f:
+            json.dump(control_plane_summary(session, skip_messages), f, indent=2)
+
+    if "bandwidth" in reports and os.path.exists(f"{folder}/params.json"):
+        with open(f"{output_folder}/bandwidth.json", "w") as f:
+            json.dump(bandwidth_summary(session, skip_messages), f, indent=2)
+
+    if "dissemination" in reports:
+        with open(f"{output_folder}/dissemination.json", "w") as f:
+            json.dump(dissemination_summary(session, skip_messages), f, indent=2)
 
-    # Create the plots
+    if "implementations" in reports:
+        with open(f"{output_folder}/implementations.json", "w") as f:
+            json.dump(implementation_summary(session, skip_messages), f, indent=2)
+
+    if "partial-messages" in reports:
+        partial = partial_summary(session)
+        if partial["run"]["groups"]:
+            with open(f"{output_folder}/partial_messages.json", "w") as f:
+                json.dump(partial, f, indent=2)
+
+    if event_db:
+        build_event_db(session)
+
+
+def _plot_delivery_times(plt, output_folder, msg_ids, time_diffs):
     plt.figure(figsize=(12, 6))
     plt.bar(range(len(msg_ids)), time_diffs)
     plt.xlabel("Message Index")
     plt.ylabel("Delivery Time Difference (seconds)")
     plt.title("Message Delivery Time Differences")
-    plt.xticks(
-        range(len(msg_ids)), [mid.id for mid in msg_ids], rotation=45, ha="right"
-    )
+    plt.xticks(range(len(msg_ids)), msg_ids, rotation=45, ha="right")
     plt.tight_layout()
 
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
     plt.savefig(f"{output_folder}/message_delivery_times.png")
     plt.close()
 
+
+def _plot_duplicates(plt, output_folder, msg_ids, avg_duplicates):
     plt.figure(figsize=(12, 6))
     plt.bar(range(len(msg_ids)), avg_duplicates)
     plt.xlabel("Message Index")
     plt.ylabel("Avg Duplicate Count")
     plt.title("Avg Message Duplicate Differences")
-    plt.xticks(
-        range(len(msg_ids)), [mid.id for mid in msg_ids], rotation=45, ha="right"
-    )
+    plt.xticks(range(len(msg_ids)), msg_ids, rotation=45, ha="right")
     plt.tight_layout()
 
     plt.savefig(f"{output_folder}/avg_msg_duplicate_count.png")
     plt.close()
 
-    _, network_to_nodes_mapping = parse_node_id_to_network_id(f"{folder}/shadow.yaml")
-    node_delivery_times = create_node_delivery_times_mapping(ordered_messages)
-    network_to_label = parse_gml_node_labels(f"{folder}/graph.gml")
-    plot_delivery_times_per_network_id(
-        plt, network_to_nodes_mapping, node_delivery_times, network_to_label
-    )
+
+def _plot_networks(plt, output_folder, network_delivery_times, network_to_label):
+    plot_delivery_times_per_network_id(plt, network_delivery_times, network_to_label)
     plt.savefig(f"{output_folder}/delivery_times_per_network.png")
     plt.close()
 
+
+def _plot_cdf(plt, output_folder, msg_ids, cdfs):
     plt.figure(figsize=(12, 6))
     plt.xlabel("Time since initial publish (seconds)")
     plt.ylabel("Number of Nodes with Message")
     plt.title("Message Delivery CDF")
     plt.xlim(0, 1)
-    for msgID, deliveries in ordered_messages.items():
-        plot_msg_delivery_cdf(plt, deliveries, label=msgID.id)
+    for msgID, (times, counts) in zip(msg_ids, cdfs):
+        plot_msg_delivery_cdf(plt, times, counts, label=msgID)
     plt.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
     plt.tight_layout()
 
     plt.savefig(f"{output_folder}/message_delivery_cdf.png")
     plt.close()
 
-    # Print the analysis and save it to a file
-    with open(f"{output_folder}/analysis.txt", "w") as f:
-        f.write(
-            "Message ID, Time to Disseminate, p50 to Disseminate, Avg Duplicate Count, Reached percent\n"
-        )
-        for line in analysis_txt:
-            f.write(line + "\n")
+
+def _plot_regions(plt, output_folder, regions, p50, link_latency):
+    """Heatmap of the p50 latency from each publisher region to each receiver region."""
+    if not regions:
+        return
+    plt.figure(figsize=(10, 8))
+    plt.imshow(p50 * 1e3, cmap="viridis")
+    plt.colorbar(label="p50 delivery latency since publish (ms)")
+    for i in range(len(regions)):
+        for j in range(len(regions)):
+            if np.isnan(p50[i, j]):
+                continue
+            text = f"{p50[i, j] * 1e3:.0f}"
+            if not np.isnan(link_latency[i, j]):
+                text += f"\n({link_latency[i, j] * 1e3:.0f})"
+            plt.text(j, i, text, ha="center", va="center", color="w", fontsize=8)
+    plt.xticks(range(len(regions)), regions, rotation=45, ha="right")
+    plt.yticks(range(len(regions)), regions)
+    plt.xlabel("Receiver region")
+    plt.ylabel("Publisher region")
+    plt.title("p50 Delivery Latency by Region (link latency in parentheses)")
+    plt.tight_layout()
+
+    plt.savefig(f"{output_folder}/region_latency.png")
+    plt.close()
+
+
+def _plot_throughput(plt, output_folder, series):
+    """Throughput series on a shared timeline, with a line at every publish."""
+    if not len(series.start):
+        return
+    panels = [
+        (series.deliveries_per_second, "Deliveries/s"),
+        (series.duplicates_per_second, "Duplicates/s"),
+        (series.control_per_second, "Control msgs/s"),
+        (series.bytes_in_flight / 1e6, "MB in flight"),
+    ]
+    fig, axes = plt.subplots(len(panels), 1, sharex=True, figsize=(12, 10))
+    for ax, (values, label) in zip(axes, panels):
+        ax.step(series.start, values, where="post", linewidth=0.8)
+        for publish in series.publish_times:
+            ax.axvline(publish, color="gray", alpha=0.3, linewidth=0.5)
+        ax.set_ylabel(label)
+        ax.grid(True, alpha=0.3)
+    axes[-1].set_xlabel("Simulated time (s)")
+    axes[0].set_title(
+        f"Network Throughput ({series.bucket_seconds:g}s buckets, publishes in gray)"
+    )
+    fig.tight_layout()
+
+    fig.savefig(f"{output_folder}/throughput.png")
+    plt.close(fig)
+
+
+# Plots drawn by the analyzer, by name
+PLOTS = {
+    "delivery-times": _plot_delivery_times,
+    "duplicates": _plot_duplicates,
+    "networks": _plot_networks,
+    "cdf": _plot_cdf,
+    "regions": _plot_regions,
+    "throughput": _plot_throughput,
+}
+
+# Plots drawn when no plots are selected
+DEFAULT_PLOTS = ("delivery-times", "duplicates", "networks", "cdf")
+
+# Extra reports the analyzer writes on request, and the file each one writes
+REPORTS = {
+    "region-latency": "region_latency.csv",
+    "throughput": "throughput.csv",
+    "control-plane": "control_plane.json",
+    "bandwidth": "bandwidth.json",
+    "dissemination": "dissemination.json",
+    "implementations": "implementations.json",
+    "partial-messages": "partial_messages.json",
+}
+
+# Reports that need the sent messages and control events of every log
+CONTROL_REPORTS = {"throughput", "control-plane", "bandwidth"}
+
+# Plots drawn by default along with the report of the same data
+REPORT_PLOTS = {"regions": "region-latency", "throughput": "throughput"}
+
+
+def _use_agg_backend():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _render_plot(name, output_folder, args):
+    import matplotlib.pyplot as plt
+
+    PLOTS[name](plt, output_folder, *args)
+
+
+def render_plots(plot_tasks):
+    """
+    Draw plots, each in its own worker process when there is more than one.
+
+    pyplot is only imported when a plot is drawn, so analyses without plots
+    never load matplotlib.
+
+    Args:
+        plot_tasks: List of (plot name, output folder, plot arguments) tuples
+    """
+    if len(plot_tasks) <= 1:
+        with _plot_lock:
+            for task in plot_tasks:
+                # Select the backend before _render_plot imports pyplot
+                _use_agg_backend()
+                _render_plot(*task)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(len(plot_tasks), os.cpu_count() or 1),
+        initializer=_use_agg_backend,
+    ) as executor:
+        for future in [executor.submit(_render_plot, *task) for task in plot_tasks]:
+            future.result()
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Analyze message deliveries from gossipsub logs"
     )
-    parser.add_argument("folder", help="Folder containing log files")
+    parser.add_argument(
+        "folders",
+        nargs="+",
+        metavar="folder",
+        help="Folder containing log files. With several folders each one is "
+        "analyzed in turn, writing into a subfolder of the output folder",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -465,9 +465,120 @@ def main():
         default=0,
         help="Number of messages to skip from the beginning (default: 0)",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse log files, 0 uses all CPUs (default: 1)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-parse every log file instead of using the parsed log cache in the folder",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Tail the logs of a running simulation and print a rolling summary "
+        "until they stop growing, then run the full analysis",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between summaries in --follow mode (default: 5)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=60.0,
+        help="Stop following after this many seconds without new log output (default: 60)",
+    )
+
+    parser.add_argument(
+        "--plots",
+        type=lambda value: value.split(",") if value else [],
+        default=None,
+        help=f"Comma separated plots to draw, out of {','.join(PLOTS)} "
+        f"(default: {','.join(DEFAULT_PLOTS)} and the plots of the selected reports)",
+    )
+    parser.add_argument(
+        "--no-plots",
+        action="store_true",
+        help="Do not draw any plot. analysis.txt, analysis.json and the reports "
+        "selected with --reports are still written",
+    )
+    parser.add_argument(
+        "--reports",
+        type=lambda value: value.split(",") if value else [],
+        default=[],
+        help=f"Comma separated extra reports to write, out of {','.join(REPORTS)} "
+        "(default: none)",
+    )
+    parser.add_argument(
+        "--all-reports",
+        action="store_true",
+        help="Write every extra report, same as --reports with all of them",
+    )
+    parser.add_argument(
+        "--cdf-points",
+        type=int,
+        default=CDF_POINTS_PER_MESSAGE,
+        help="Maximum number of points drawn per message in the delivery CDF "
+        f"(default: {CDF_POINTS_PER_MESSAGE})",
+    )
+    parser.add_argument(
+        "--event-db",
+        action="store_true",
+        help="Also load the parsed events into events.sqlite in the log folder, "
+        "for queries with event_db.py",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Analyze in bounded memory for very large runs. Only writes "
+        "analysis.txt and analysis.json, with sketched latency percentiles",
+    )
 
     args = parser.parse_args()
-    analyse_message_deliveries(args.folder, args.output, args.skip)
+    plots = [] if args.no_plots else args.plots
+    unknown = set(plots or []) - set(PLOTS)
+    if unknown:
+        parser.error(
+            f"unknown plots {', '.join(sorted(unknown))}, expected {','.join(PLOTS)}"
+        )
+    reports = list(REPORTS) if args.all_reports else args.reports
+    unknown = set(reports) - set(REPORTS)
+    if unknown:
+        parser.error(
+            f"unknown reports {', '.join(sorted(unknown))}, expected {','.join(REPORTS)}"
+        )
+    for folder in args.folders:
+        output_folder = args.output
+        if len(args.folders) > 1:
+            name = os.path.basename(os.path.normpath(folder))
+            output_folder = os.path.join(args.output, name)
+        if args.follow:
+            follow(folder, args.interval, args.idle_timeout)
+        if args.streaming:
+            summary = streaming_summary(folder, args.skip, args.jobs)
+            os.makedirs(output_folder, exist_ok=True)
+            write_analysis_txt(f"{output_folder}/analysis.txt", summary)
+            with open(f"{output_folder}/analysis.json", "w") as f:
+                json.dump(summary, f, indent=2)
+            continue
+        analyse_message_deliveries(
+            folder,
+            output_folder,
+            args.skip,
+            args.jobs,
+            not args.no_cache,
+            plots=plots,
+            cdf_points=args.cdf_points,
+            event_db=args.event_db,
+            reports=reports,
+        )
 
 
 if __name__ == "__main__":
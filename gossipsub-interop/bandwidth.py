@@ -0,0 +1,193 @@
+"""
+Bandwidth accounting of the full messages of a Shadow run.
+
+Joins the messageSizeBytes of every Publish instruction in params.json with the
+"Received Message" events of every node to get the bytes each message put on
+the wire, its amplification over an ideal one copy per receiver, and the
+upload (attributed to the "from" peer) and download of every node. Totals are
+broken down by the NodeType of each node's network (supernode or fullnode).
+Protocol framing and control messages are not counted, see control_plane.py
+for those.
+"""
+
+import argparse
+from collections import defaultdict
+from typing import Dict
+
+import experiment
+import network_graph
+from analysis_session import (
+    AnalysisSession,
+    add_report_arguments,
+    ratio,
+    write_json_report,
+)
+
+
+def node_types_by_node(session: AnalysisSession) -> Dict[int, str]:
+    """Dictionary mapping node ID to the NodeType name of its network."""
+    labels = session.network_labels()
+    return {
+        node_id: labels[network_id].rsplit("-", 1)[-1]
+        for node_id, network_id in session.node_networks().items()
+        if network_id in labels
+    }
+
+
+def bandwidth_summary(session: AnalysisSession, skip_messages: int = 0) -> dict:
+    """
+    Build the bandwidth report of a run, as written to bandwidth.json.
+
+    "amplification" is wire bytes / (payload bytes x expected receivers), so 1
+    means every receiver got exactly one copy. "traced_sent" counts the "Sent
+    Message" events, which only go-libp2p logs. For every node type
+    "max_upload_busy" and "max_download_busy" are the seconds its busiest node
+    would need to upload (or download) its total at the NodeType link capacity.
+
+    Args:
+        session: Session of the Shadow output directory
+        skip_messages: Number of (warmup) messages to leave out, matching
+            analysis.txt
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    expected = {
+        message.message_id: message
+        for message in experiment.expected_messages(
+            experiment.load_params(f"{session.folder}/params.json"),
+            session.total_nodes,
+        )
+    }
+    message_ids = [
+        message_id
+        for message_id in session.store.skip(skip_messages).message_ids
+        if message_id in expected
+    ]
+    sizes = {
+        message_id: expected[message_id].message_size_bytes
+        for message_id in message_ids
+    }
+
+    peer_to_node = session.peer_id_to_node_id
+    receptions: Dict[str, int] = defaultdict(int)
+    traced_sent: Dict[str, int] = defaultdict(int)
+    upload: Dict[int, int] = defaultdict(int)
+    download: Dict[int, int] = defaultdict(int)
+    for result in session.control_results:
+        node_id = result.node_id.id
+        for message_id, size in sizes.items():
+            traced_sent[message_id] += result.sent_message_counts.get(message_id, 0)
+            for sender, count in result.received_from.get(message_id, {}).items():
+                receptions[message_id] += count
+                download[node_id] += count * size
+                if sender in peer_to_node:
+                    upload[peer_to_node[sender]] += count * size
+
+    messages = {}
+    for message_id, size in sizes.items():
+        wire_bytes = receptions[message_id] * size
+        messages[message_id] = {
+            "payload_bytes": size,
+            "receivers": expected[message_id].receivers,
+            "receptions": receptions[message_id],
+            "traced_sent": traced_sent[message_id],
+            "wire_bytes": wire_bytes,
+            "amplification": ratio(wire_bytes, size * expected[message_id].receivers),
+        }
+
+    node_types = node_types_by_node(session)
+    nodes = {}
+    for node_id in sorted(session.node_id_to_peer_id):
+        nodes[str(node_id)] = {
+            "node_type": node_types.get(node_id),
+            "upload_bytes": upload[node_id],
+            "download_bytes": download[node_id],
+        }
+
+    capacities = {node_type.name: node_type for node_type in network_graph.node_types}
+    by_node_type = {}
+    for name in sorted(set(node_types.values())):
+        members = [node_id for node_id, t in node_types.items() if t == name]
+        uploads = [upload[node_id] for node_id in members]
+        downloads = [download[node_id] for node_id in members]
+        stats = {
+            "nodes": len(members),
+            "upload_bytes": sum(uploads),
+            "download_bytes": sum(downloads),
+            "mean_upload_bytes": sum(uploads) / len(members),
+            "mean_download_bytes": sum(downloads) / len(members),
+            "max_upload_bytes": max(uploads),
+            "max_download_bytes": max(downloads),
+        }
+        node_type = capacities.get(name)
+        if node_type is not None:
+            stats["upload_mbit"] = node_type.upload_bw
+            stats["download_mbit"] = node_type.download_bw
+            stats["max_upload_busy"] = max(uploads) * 8 / (node_type.upload_bw * 1e6)
+            stats["max_download_busy"] = (
+                max(downloads) * 8 / (node_type.download_bw * 1e6)
+            )
+        by_node_type[name] = stats
+
+    payload_bytes = sum(
+        size * expected[message_id].receivers for message_id, size in sizes.items()
+    )
+    wire_bytes = sum(message["wire_bytes"] for message in messages.values())
+    return {
+        "folder": str(session.folder),
+        "totals": {
+            "messages": len(messages),
+            "payload_bytes": payload_bytes,
+            "wire_bytes": wire_bytes,
+            "amplification": ratio(wire_bytes, payload_bytes),
+        },
+        "messages": messages,
+        "nodes": nodes,
+        "node_types": by_node_type,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Render the run-wide totals and node type breakdown of a bandwidth report."""
+    totals = summary["totals"]
+    amplification = totals["amplification"]
+    lines = [
+        (
+            f"{totals['messages']} messages, {totals['wire_bytes'] / 1e6:.1f} MB on the wire "
+            f"for {totals['payload_bytes'] / 1e6:.1f} MB of payload to receivers, "
+            f"amplification {'n/a' if amplification is None else f'{amplification:.2f}'}"
+        )
+    ]
+    for name, stats in summary["node_types"].items():
+        line = (
+            f"  {name} ({stats['nodes']} nodes): mean upload "
+            f"{stats['mean_upload_bytes'] / 1e6:.1f} MB, max "
+            f"{stats['max_upload_bytes'] / 1e6:.1f} MB, mean download "
+            f"{stats['mean_download_bytes'] / 1e6:.1f} MB"
+        )
+        if "max_upload_busy" in stats:
+            line += (
+                f", busiest uplink {stats['max_upload_busy']:.2f}s at "
+                f"{stats['upload_mbit']} Mbit"
+            )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report per-message and per-node bandwidth of a gossipsub run"
+    )
+    add_report_arguments(parser, "bandwidth.json")
+    args = parser.parse_args()
+
+    session = AnalysisSession(args.folder, args.jobs, control=True)
+    summary = bandwidth_summary(session, args.skip)
+
+    write_json_report(args, "bandwidth.json", summary)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""Evaluate a file of declarative assertions against a Shadow run.
+
+A rules file (YAML or JSON) lists pass/fail rules over the parsed events of a
+run, for example:
+
+    skip: 4
+    rules:
+      - name: every message reaches every node
+        metric: reached
+        op: ">="
+        value: 1.0
+      - name: p99 delivery latency
+        metric: latency
+        aggregate: p99
+        op: "<"
+        value: 800ms
+      - metric: all_parts_received
+        op: ">="
+        value: 16
+        skip: 0
+
+Without an aggregate a rule must hold for every message, delivery or node of
+its metric, otherwise it compares the min, max, mean, sum or nearest-rank
+percentile (p50, p99, p99.9, ...) of the metric. Durations are in seconds and
+may carry a unit ("800ms"). skip drops that many (warmup) messages from the
+message and latency metrics, per file or per rule.
+
+All rules are evaluated from one pass over the parsed logs, and the results
+are written as a JUnit XML report.
+"""
+
+from __future__ import annotations
+
+import argparse
+import operator
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from analysis_session import AnalysisSession  # noqa: E402
+from run_stats import parse_shadow_time  # noqa: E402
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Metric name -> what it is measured over
+METRIC_SCOPES = {
+    # Per message, as in analysis.txt
+    "reached": "message",
+    "time_to_disseminate": "message",
+    "p50_to_disseminate": "message",
+    "avg_duplicates": "message",
+    "deliveries": "message",
+    # Seconds from the first delivery of a message to each of its deliveries
+    "latency": "delivery",
+    # Per node log
+    "all_parts_received": "node",
+    "messages_received": "node",
+    "duplicates_received": "node",
+    # Whole run, a single value
+    "nodes": "run",
+    "messages": "run",
+}
+
+_SCOPE_PLURALS = {
+    "message": "messages",
+    "delivery": "deliveries",
+    "node": "nodes",
+    "run": "runs",
+}
+
+AGGREGATES = ("min", "max", "mean", "sum")
+_PERCENTILE_AGGREGATE = re.compile(r"p(\d+(?:\.\d+)?)")
+
+# Offenders listed in the failure message of a rule
+MAX_LISTED_FAILURES = 5
+
+
+@dataclass
+class Rule:
+    name: str
+    metric: str
+    op: str
+    value: float
+    aggregate: Optional[str] = None
+    skip: int = 0
+
+    @property
+    def scope(self) -> str:
+        return METRIC_SCOPES[self.metric]
+
+    def describe(self) -> str:
+        subject = f"{self.aggregate} {self.metric}" if self.aggregate else self.metric
+        return f"{subject} {self.op} {self.value:g}"
+
+
+@dataclass
+class RuleResult:
+    rule: Rule
+    passed: bool
+    detail: str
+    # Set when the rule could not be evaluated, e.g. no messages to check
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+def parse_value(value) -> float:
+    """Return a rule value as a number, converting durations such as "800ms" to seconds."""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid value {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_shadow_time(value)
+
+
+def load_rules(path: Path) -> list[Rule]:
+    """
+    Load and validate the rules of a YAML or JSON assertions file.
+
+    Raises:
+        ValueError: If the file or one of its rules is invalid
+    """
+    with path.open() as f:
+        spec = yaml.safe_load(f)
+    if not isinstance(spec, dict) or not isinstance(spec.get("rules"), list):
+        raise ValueError(f"{path}: expected a mapping with a list of rules")
+    default_skip = int(spec.get("skip", 0))
+
+    rules = []
+    for index, entry in enumerate(spec["rules"]):
+        where = f"{path}: rule {index + 1}"
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where}: expected a mapping")
+        unknown = set(entry) - {"name", "metric", "aggregate", "op", "value", "skip"}
+        if unknown:
+            raise ValueError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+        metric = entry.get("metric")
+        if metric not in METRIC_SCOPES:
+            raise ValueError(
+                f"{where}: unknown metric {metric!r}, expected one of {', '.join(METRIC_SCOPES)}"
+            )
+        op = entry.get("op")
+        if op not in OPERATORS:
+            raise ValueError(
+                f"{where}: unknown op {op!r}, expected one of {' '.join(OPERATORS)}"
+            )
+        if "value" not in entry:
+            raise ValueError(f"{where}: missing value")
+        aggregate = entry.get("aggregate")
+        if aggregate is not None:
+            aggregate = str(aggregate)
+            if METRIC_SCOPES[metric] == "run":
+                raise ValueError(f"{where}: {metric} is a single value, drop aggregate")
+            if aggregate not in AGGREGATES and not _PERCENTILE_AGGREGATE.fullmatch(
+                aggregate
+            ):
+                raise ValueError(
+                    f"{where}: unknown aggregate {aggregate!r}, expected "
+                    f"{', '.join(AGGREGATES)} or a percentile such as p99"
+                )
+        try:
+            value = parse_value(entry["value"])
+        except ValueError as e:
+            raise ValueError(f"{where}: {e}") from None
+        rule = Rule(
+            name="",
+            metric=metric,
+            op=op,
+            value=value,
+            aggregate=aggregate,
+            skip=int(entry.get("skip", default_skip)),
+        )
+        rule.name = str(entry.get("name") or rule.describe())
+        rules.append(rule)
+    return rules
+
+
+class NodeCounts:
+    """Session consumer collecting the per-node metrics of every log.
+
+    Values are kept per log file, so logs that never name their node do not
+    overwrite each other.
+    """
+
+    def __init__(self):
+        # metric -> log path -> value
+        self.values: dict[str, dict[str, int]] = {
+            metric: {} for metric, scope in METRIC_SCOPES.items() if scope == "node"
+        }
+        # Logs without a PeerID line
+        self.missing_peer_id: list[str] = []
+
+    def add(self, result) -> None:
+        path = result.path
+        if result.peer_id is None:
+            self.missing_peer_id.append(path)
+        self.values["all_parts_received"][path] = result.all_parts_received
+        self.values["messages_received"][path] = len(result.message_ids)
+        self.values["duplicates_received"][path] = sum(result.duplicate_counts.values())
+
+
+def _aggregate(values: np.ndarray, aggregate: str) -> float:
+    if aggregate in AGGREGATES:
+        return float(getattr(np, aggregate)(values))
+    quantile = float(_PERCENTILE_AGGREGATE.fullmatch(aggregate).group(1)) / 100
+    # Nearest rank, as the percentiles of analysis.json
+    ordered = np.sort(values)
+    return float(ordered[min(int(quantile * len(ordered)), len(ordered) - 1)])
+
+
+class RuleEvaluator:
+    """Evaluates rules against one session, sharing the work between rules."""
+
+    def __init__(self, session: AnalysisSession, node_counts: NodeCounts):
+        self.session = session
+        self.node_counts = node_counts
+        self._metrics = {}
+
+    def _message_metrics(self, skip: int):
+        if skip not in self._metrics:
+            self._metrics[skip] = self.session.message_metrics(skip)
+        return self._metrics[skip]
+
+    def values(self, rule: Rule) -> tuple[list[str], np.ndarray]:
+        """Labels and values of the metric of a rule, one per message, delivery or node."""
+        if rule.scope == "run":
+            if rule.metric == "nodes":
+                value = self.session.total_nodes
+            else:
+                value = len(self.session.store.skip(rule.skip))
+            return [rule.metric], np.array([value], dtype=float)
+        if rule.scope == "node":
+            values = self.node_counts.values[rule.metric]
+            paths = sorted(values)
+            return [
+                os.path.relpath(path, self.session.folder) for path in paths
+            ], np.array([values[path] for path in paths], dtype=float)
+        if rule.scope == "delivery":
+            store = self.session.store.skip(rule.skip)
+            counts = store.delivery_counts()
+            labels = np.repeat(
+                np.asarray([f"message {m}" for m in store.message_ids], dtype=object),
+                counts,
+            )
+            return list(labels), store.latency_ns() / 1e9
+
+        metrics = self._message_metrics(rule.skip)
+        if rule.metric == "deliveries":
+            values = self.session.store.skip(rule.skip).delivery_counts()
+        else:
+            values = getattr(metrics, rule.metric)
+        return list(metrics.message_ids), np.asarray(values, dtype=float)
+
+    def evaluate(self, rule: Rule) -> RuleResult:
+        started = time.monotonic()
+        try:
+            result = self._evaluate(rule)
+        except ValueError as e:
+            result = RuleResult(rule, False, str(e), error=str(e))
+        result.seconds = time.monotonic() - started
+        return result
+
+    def _evaluate(self, rule: Rule) -> RuleResult:
+        labels, values = self.values(rule)
+        if not len(values):
+            items = _SCOPE_PLURALS[rule.scope] + (
+                f" after skipping {rule.skip} messages" if rule.skip else ""
+            )
+            raise ValueError(f"no {items} to check {rule.metric} on")
+        compare = OPERATORS[rule.op]
+
+        if rule.aggregate or rule.scope == "run":
+            observed = _aggregate(values, rule.aggregate or "min")
+            passed = compare(observed, rule.value)
+            subject = (
+                f"{rule.aggregate} {rule.metric}" if rule.aggregate else rule.metric
+            )
+            return RuleResult(
+                rule,
+                passed,
+                f"{subject} = {observed:.6g} (expected {rule.op} {rule.value:g})",
+            )
+
+        failing = np.flatnonzero(~compare(values, rule.value))
+        if not len(failing):
+            return RuleResult(
+                rule,
+                True,
+                f"all {len(values)} {_SCOPE_PLURALS[rule.scope]} have {rule.describe()}",
+            )
+        listed = ", ".join(
+            f"{labels[i]}: {values[i]:.6g}" for i in failing[:MAX_LISTED_FAILURES]
+        )
+        more = len(failing) - MAX_LISTED_FAILURES
+        return RuleResult(
+            rule,
+            False,
+            f"{len(failing)}/{len(values)} {_SCOPE_PLURALS[rule.scope]} do not have "
+            f"{rule.describe()} ({listed}{f', {more} more' if more > 0 else ''})",
+        )
+
+
+def evaluate_rules(
+    session: AnalysisSession,
+    rules: list[Rule],
+    node_counts: Optional[NodeCounts] = None,
+) -> list[RuleResult]:
+    """
+    Evaluate every rule against a run.
+
+    The logs are parsed once and feed the per-node counts, while the message
+    and latency metrics come from the delivery store of the same parse.
+
+    Args:
+        session: Session of the Shadow output directory
+        rules: Rules to evaluate
+        node_counts: Consumer to collect the per-node metrics into, to inspect
+            them afterwards
+
+    Returns:
+        One RuleResult per rule, in order
+    """
+    node_counts = node_counts or NodeCounts()
+    session.feed(node_counts)
+    evaluator = RuleEvaluator(session, node_counts)
+    return [evaluator.evaluate(rule) for rule in rules]
+
+
+def junit_report(
+    suite_name: str,
+    results: list[RuleResult],
+    seconds: float,
+    properties: Optional[dict[str, str]] = None,
+) -> ET.ElementTree:
+    """Build a JUnit XML report with one test case per rule, plus suite properties."""
+    failures = sum(1 for r in results if not r.passed and r.error is None)
+    errors = sum(1 for r in results if r.error is not None)
+    suites = ET.Element(
+        "testsuites",
+        tests=str(len(results)),
+        failures=str(failures),
+        errors=str(errors),
+        time=f"{seconds:.3f}",
+    )
+    suite = ET.SubElement(
+        suites,
+        "testsuite",
+        name=suite_name,
+        tests=str(len(results)),
+        failures=str(failures),
+        errors=str(errors),
+        time=f"{seconds:.3f}",
+    )
+    if properties:
+        suite_properties = ET.SubElement(suite, "properties")
+        for name, value in properties.items():
+            ET.SubElement(suite_properties, "property", name=name, value=value)
+    for result in results:
+        case = ET.SubElement(
+            suite,
+            "testcase",
+            classname=suite_name,
+            name=result.rule.name,
+            time=f"{result.seconds:.3f}",
+        )
+        if result.error is not None:
+            ET.SubElement(case, "error", message=result.error)
+        elif not result.passed:
+            ET.SubElement(case, "failure", message=result.detail)
+        else:
+            ET.SubElement(case, "system-out").text = result.detail
+    ET.indent(suites)
+    return ET.ElementTree(suites)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Evaluate the rules of a YAML or JSON assertions file against a "
+            "Shadow run and write a JUnit XML report."
+        )
+    )
+    parser.add_argument(
+        "shadow_output",
+        help="Path to the Shadow output directory (the one containing the hosts/ folder).",
+    )
+    parser.add_argument(
+        "rules",
+        help="Path to the assertions file, e.g. checks/rules/subnet-blob-msg.yaml.",
+    )
+    parser.add_argument(
+        "--junit",
+        default=None,
+        help="Path of the JUnit XML report (default: <shadow_output>/plots/<rules name>.junit.xml).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse log files, 0 uses all CPUs (default: 1).",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    base_dir = Path(args.shadow_output).expanduser().resolve()
+    if not base_dir.exists():
+        print(f"shadow output directory does not exist: {base_dir}", file=sys.stderr)
+        return 1
+
+    hosts_dir = base_dir / "hosts"
+    if not hosts_dir.is_dir():
+        print(f"hosts directory not found under: {base_dir}", file=sys.stderr)
+        return 1
+
+    rules_path = Path(args.rules)
+    try:
+        rules = load_rules(rules_path)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"invalid assertions file: {e}", file=sys.stderr)
+        return 1
+
+    started = time.monotonic()
+    node_counts = NodeCounts()
+    results = evaluate_rules(AnalysisSession(base_dir, args.jobs), rules, node_counts)
+    seconds = time.monotonic() - started
+    missing_peer_id = sorted(
+        os.path.relpath(path, base_dir) for path in node_counts.missing_peer_id
+    )
+
+    suite_name = rules_path.stem
+    junit_path = (
+        Path(args.junit)
+        if args.junit
+        else base_dir / "plots" / f"{suite_name}.junit.xml"
+    )
+    junit_path.parent.mkdir(parents=True, exist_ok=True)
+    properties = {"logs_without_peer_id": str(len(missing_peer_id))}
+    junit_report(suite_name, results, seconds, properties).write(
+        junit_path, encoding="utf-8", xml_declaration=True
+    )
+
+    print(f"Run: {base_dir}")
+    print(f"Rules: {rules_path} ({len(rules)} rules)")
+    if missing_peer_id:
+        print(f"Logs without a PeerID: {len(missing_peer_id)}")
+        for path in missing_peer_id:
+            print(f"  - {path}")
+    print()
+    for result in results:
+        status = (
+            "ERROR" if result.error is not None else "OK" if result.passed else "FAIL"
+        )
+        print(f"  [{status}] {result.rule.name}: {result.detail}")
+    print()
+    print(f"JUnit report: {junit_path}")
+
+    failed = [r for r in results if not r.passed]
+    if failed:
+        print(f"FAILED: {len(failed)}/{len(results)} rules.", file=sys.stderr)
+        return 1
+    print(f"PASSED: all {len(results)} rules.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
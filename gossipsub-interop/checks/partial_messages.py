@@ -4,8 +4,18 @@
 from __future__ import annotations
 
 import argparse
+import mmap
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from live_analysis import SHADOW_START_NS  # noqa: E402
+from log_ingest import json_loads, timestamp_to_ns  # noqa: E402
 
 MESSAGE_SUBSTRING = '"msg":"All parts received"'
 
@@ -27,6 +37,13 @@ def parse_args() -> argparse.Namespace:
         default=1,
         help="Minimum number of times each stdout log must contain the target message (default: 1).",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="Number of worker processes scanning the logs, 0 uses all CPUs (default: 0).",
+    )
     return parser.parse_args()
 
 
@@ -37,15 +54,84 @@ def iter_stdout_logs(hosts_dir: Path):
             yield stdout_file
 
 
-def count_occurrences(path: Path, needle: str) -> int:
-    """Count how many times the string appears inside the file."""
+@dataclass
+class Completions:
+    """Occurrences of the target message in one stdout log."""
+
+    path: Path
+    count: int = 0
+    # Time of each counted occurrence in nanoseconds since the epoch, in log
+    # order (None if its line has no timestamp)
+    times_ns: list[Optional[int]] = field(default_factory=list)
+
+
+def scan_completions(
+    path: Path, needle: bytes, limit: Optional[int] = None
+) -> Completions:
+    """Count the occurrences of needle in a file, stopping once limit is reached.
+
+    The file is memory mapped and searched for the raw bytes, so only the
+    lines holding the needle are decoded, for their timestamp.
+
+    Args:
+        path: Log file to scan
+        needle: Byte string to look for
+        limit: Stop after this many occurrences, None scans the whole file
+
+    Returns:
+        Completions with the number and times of the occurrences found
+    """
+    completions = Completions(path)
     if not needle:
-        return 0
-    total = 0
-    with path.open("r", encoding="utf-8", errors="replace") as handle:
-        for line in handle:
-            total += line.count(needle)
-    return total
+        return completions
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return completions
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            hit = data.find(needle)
+            while hit >= 0 and (limit is None or completions.count < limit):
+                start = data.rfind(b"\n", 0, hit) + 1
+                end = data.find(b"\n", hit)
+                if end < 0:
+                    end = len(data)
+                completions.count += 1
+                completions.times_ns.append(_line_time_ns(data[start:end]))
+                hit = data.find(needle, hit + len(needle))
+    return completions
+
+
+def _line_time_ns(line: bytes) -> Optional[int]:
+    """Timestamp of a log line, None if it has none or it cannot be decoded."""
+    try:
+        timestamp = json_loads(line).get("time")
+        return None if timestamp is None else timestamp_to_ns(timestamp)
+    except (ValueError, TypeError, AttributeError):
+        # ValueError covers json.JSONDecodeError and malformed timestamps
+        return None
+
+
+def count_occurrences(path: Path, needle: str, limit: Optional[int] = None) -> int:
+    """Count how many times the string appears inside the file, up to limit."""
+    return scan_completions(path, needle.encode(), limit).count
+
+
+def scan_logs(
+    paths: list[Path], needle: bytes, limit: Optional[int], jobs: int
+) -> list[Completions]:
+    """Scan each log for needle, spread across `jobs` worker processes (0: all CPUs)."""
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    scan = partial(scan_completions, needle=needle, limit=limit)
+    if jobs <= 1 or len(paths) <= 1:
+        return list(map(scan, paths))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        return list(pool.map(scan, paths))
+
+
+def _format_seconds(timestamp_ns: Optional[int]) -> str:
+    if timestamp_ns is None:
+        return "n/a"
+    return f"{(timestamp_ns - SHADOW_START_NS) / 1e9:.3f}s"
 
 
 def main() -> int:
@@ -65,11 +151,25 @@ def main() -> int:
         print(f"no stdout logs found under: {hosts_dir}", file=sys.stderr)
         return 1
 
-    missing = []
-    for log_path in stdout_logs:
-        occurrences = count_occurrences(log_path, MESSAGE_SUBSTRING)
-        if occurrences < args.count:
-            missing.append((log_path, occurrences))
+    # Each scan stops as soon as its log holds the required count, so large
+    # trace level logs are only read up to their last needed completion.
+    results = scan_logs(stdout_logs, MESSAGE_SUBSTRING.encode(), args.count, args.jobs)
+    missing = [(r.path, r.count) for r in results if r.count < args.count]
+
+    print("Completion times (since simulation start):")
+    for result in results:
+        rel_path = result.path.relative_to(base_dir)
+        if result.count < args.count:
+            print(f"  [FAIL] {rel_path}: {result.count}/{args.count} completions")
+            continue
+        times = result.times_ns
+        print(
+            f"  [OK] {rel_path}: first {_format_seconds(times[0])}, "
+            f"reached {args.count} at {_format_seconds(times[args.count - 1])}"
+            if times
+            else f"  [OK] {rel_path}"
+        )
+    print()
 
     if missing:
         print(
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Compare a run against a baseline analysis.json and fail on performance regressions."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from analysis_session import AnalysisSession  # noqa: E402
+from bandwidth import bandwidth_summary  # noqa: E402
+
+# Per-message metrics where higher is worse, as (name, description)
+HIGHER_IS_WORSE = [
+    ("p50", "p50 time to disseminate"),
+    ("p99", "p99 time to disseminate"),
+    ("avg_duplicates", "avg duplicates"),
+    ("amplification", "bandwidth amplification"),
+]
+
+# A metric with a zero baseline median regresses once its new median exceeds this
+ZERO_BASELINE_EPSILON = 1e-6
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the message deliveries of a Shadow run with a baseline "
+            "analysis.json and exit non-zero on a statistically significant regression."
+        )
+    )
+    parser.add_argument(
+        "shadow_output",
+        help="Path to the Shadow output directory (the one containing the hosts/ folder).",
+    )
+    parser.add_argument(
+        "--baseline",
+        required=True,
+        help=(
+            "Baseline analysis.json, or a folder containing it (directly or in plots/). "
+            "A bandwidth.json next to it is compared too."
+        ),
+    )
+    parser.add_argument(
+        "--skip",
+        type=int,
+        default=4,
+        help="Number of initial (warmup) messages to skip in the new run (default: 4).",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.01,
+        help="Significance level of the one-sided Mann-Whitney U test (default: 0.01).",
+    )
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed relative increase of the median p50/p99 latency (default: 0.1).",
+    )
+    parser.add_argument(
+        "--duplicates-tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed relative increase of the median duplicate count and amplification (default: 0.1).",
+    )
+    parser.add_argument(
+        "--reach-tolerance",
+        type=float,
+        default=0.0,
+        help="Allowed absolute drop of the minimum reach (default: 0.0).",
+    )
+    return parser.parse_args()
+
+
+def mann_whitney_greater(baseline: np.ndarray, new: np.ndarray) -> float:
+    """One-sided Mann-Whitney U test that `new` tends to be greater than `baseline`.
+
+    Uses the normal approximation with tie and continuity corrections, which
+    is adequate from about 8 samples per side.
+
+    Returns:
+        p-value
+    """
+    n1, n2 = len(baseline), len(new)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    values = np.concatenate([baseline, new])
+    # Average ranks (1-based), ties share the mean of their ranks
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    ranks = (ends - (counts - 1) / 2)[inverse]
+
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2
+    mean = n1 * n2 / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - (counts**3 - counts).sum() / (n * (n - 1)))
+    if variance <= 0:
+        # All values are equal
+        return 1.0
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def find_baseline(path: Path) -> Path:
+    for candidate in (path, path / "analysis.json", path / "plots" / "analysis.json"):
+        if candidate.is_file():
+            return candidate
+    raise FileNotFoundError(f"no analysis.json found at {path}")
+
+
+def per_message(analysis: dict, bandwidth: dict | None) -> dict[str, np.ndarray]:
+    """Extract the per-message samples compared by the regression test."""
+    messages = analysis["messages"]
+    samples = {
+        "p50": np.array([m["latency"]["p50"] for m in messages]),
+        "p99": np.array([m["latency"]["p99"] for m in messages]),
+        "avg_duplicates": np.array([m["avg_duplicates"] for m in messages]),
+        "reached": np.array([m["reached"] for m in messages]),
+    }
+    if bandwidth is not None:
+        samples["amplification"] = np.array(
+            [
+                m["amplification"]
+                for m in bandwidth["messages"].values()
+                if m["amplification"] is not None
+            ]
+        )
+    return samples
+
+
+def main() -> int:
+    args = parse_args()
+    base_dir = Path(args.shadow_output).expanduser().resolve()
+    if not base_dir.exists():
+        print(f"shadow output directory does not exist: {base_dir}", file=sys.stderr)
+        return 1
+
+    hosts_dir = base_dir / "hosts"
+    if not hosts_dir.is_dir():
+        print(f"hosts directory not found under: {base_dir}", file=sys.stderr)
+        return 1
+
+    try:
+        baseline_path = find_baseline(Path(args.baseline).expanduser().resolve())
+    except FileNotFoundError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    with baseline_path.open() as f:
+        baseline_analysis = json.load(f)
+    baseline_bandwidth = None
+    if (baseline_path.parent / "bandwidth.json").is_file():
+        with (baseline_path.parent / "bandwidth.json").open() as f:
+            baseline_bandwidth = json.load(f)
+
+    # The bandwidth comparison needs the sent messages of the logs
+    session = AnalysisSession(base_dir, control=baseline_bandwidth is not None)
+    analysis = session.analysis_summary(args.skip)
+    if not analysis["messages"]:
+        print("no messages found in logs", file=sys.stderr)
+        return 1
+    bandwidth = None
+    if baseline_bandwidth is not None and (base_dir / "params.json").is_file():
+        bandwidth = bandwidth_summary(session, args.skip)
+
+    baseline = per_message(baseline_analysis, baseline_bandwidth)
+    if not len(baseline["reached"]):
+        print(f"invalid baseline {baseline_path}: it has no messages", file=sys.stderr)
+        return 1
+    new = per_message(analysis, bandwidth)
+    tolerances = {
+        "p50": args.latency_tolerance,
+        "p99": args.latency_tolerance,
+        "avg_duplicates": args.duplicates_tolerance,
+        "amplification": args.duplicates_tolerance,
+    }
+
+    print(f"Baseline: {baseline_path} ({len(baseline['p50'])} messages)")
+    print(
+        f"New run: {base_dir} ({len(new['p50'])} messages, skipped {args.skip} warmup)"
+    )
+    print()
+
+    regressions = []
+    for name, description in HIGHER_IS_WORSE:
+        if name not in baseline or name not in new:
+            continue
+        old_median = float(np.median(baseline[name]))
+        new_median = float(np.median(new[name]))
+        if old_median:
+            change = (new_median - old_median) / old_median
+        else:
+            # No relative change from zero, any increase beyond noise regresses
+            change = math.inf if new_median > ZERO_BASELINE_EPSILON else 0.0
+        p_value = mann_whitney_greater(baseline[name], new[name])
+        regressed = p_value < args.alpha and change > tolerances[name]
+        status = "FAIL" if regressed else "OK"
+        print(
+            f"  [{status}] {description}: median {old_median:.4f} -> {new_median:.4f} "
+            f"({change:+.1%}, tolerance {tolerances[name]:.0%}), p={p_value:.4g}"
+        )
+        if regressed:
+            regressions.append(description)
+
+    old_reach = float(baseline["reached"].min())
+    new_reach = float(new["reached"].min())
+    reach_regressed = new_reach < old_reach - args.reach_tolerance
+    status = "FAIL" if reach_regressed else "OK"
+    print(
+        f"  [{status}] min reach: {old_reach:.1%} -> {new_reach:.1%} "
+        f"(tolerance {args.reach_tolerance:.1%})"
+    )
+    if reach_regressed:
+        regressions.append("min reach")
+
+    print()
+    if regressions:
+        print(
+            f"FAILED: {len(regressions)} metrics regressed against the baseline: "
+            f"{', '.join(regressions)}.",
+            file=sys.stderr,
+        )
+        return 1
+
+    print(f"No regressions against {baseline_path} (alpha {args.alpha}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,14 @@
 from __future__ import annotations
 
 import argparse
-import json
 import sys
 from collections import defaultdict
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from analysis_session import AnalysisSession  # noqa: E402
+from log_ingest import log_node_id  # noqa: E402
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -36,56 +39,54 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def iter_stdout_logs(hosts_dir: Path):
-    """Yield all stdout log files under the given hosts directory."""
-    for stdout_file in sorted(hosts_dir.rglob("*.stdout")):
-        if stdout_file.is_file():
-            yield stdout_file
+class MessageReach:
+    """Session consumer collecting the nodes each message was delivered to."""
+
+    def __init__(self):
+        # message_id -> set of node_ids (the log path for unknown nodes)
+        self.deliveries: dict[str, set[int | str]] = defaultdict(set)
+        # message_id -> earliest delivery in nanoseconds (for ordering)
+        self.first_seen: dict[str, int] = {}
+        self.node_ids: set[int | str] = set()
+
+    def add(self, result) -> None:
+        if result.peer_id is None and not result.message_ids:
+            return
+        nid = log_node_id(result)
+        if nid is None:
+            # Keep logs of unknown nodes apart instead of merging them
+            nid = result.path
+        self.node_ids.add(nid)
+
+        for mid, ts in zip(result.message_ids, result.timestamps_ns):
+            self.deliveries[mid].add(nid)
+            if mid not in self.first_seen or ts < self.first_seen[mid]:
+                self.first_seen[mid] = ts
 
+    def ordered_ids(self) -> list[str]:
+        """Message ids ordered by first delivery time across nodes."""
+        return sorted(self.deliveries.keys(), key=lambda m: self.first_seen[m])
 
-def parse_logs(hosts_dir: Path):
+
+def parse_logs(base_dir: Path, session: AnalysisSession | None = None):
     """Parse all stdout logs and return per-message delivery sets and total node count.
 
+    Logs are read through the parsed log cache in the output directory, so only
+    files that changed since the last analysis are parsed again.
+
+    Args:
+        base_dir: Shadow output directory
+        session: Session to read the parsed logs from, so other consumers can
+            share its single pass over the logs
+
     Returns:
-        (message_deliveries, node_count) where message_deliveries maps
-        message_id -> set of node_ids that received it, ordered by first
-        delivery time across nodes.
+        (message_deliveries, ordered_ids, node_count) where message_deliveries
+        maps message_id -> set of node_ids that received it, and ordered_ids
+        lists message ids ordered by first delivery time across nodes.
     """
-    # message_id -> set of node_ids
-    deliveries: dict[str, set[str]] = defaultdict(set)
-    # message_id -> earliest timestamp string (for ordering)
-    first_seen: dict[str, str] = {}
-    node_ids: set[str] = set()
-
-    for log_path in iter_stdout_logs(hosts_dir):
-        node_name = log_path.parent.name  # e.g. "node0"
-        current_node_id: str | None = None
-
-        with log_path.open("r", encoding="utf-8", errors="replace") as fh:
-            for line in fh:
-                try:
-                    entry = json.loads(line)
-                except (json.JSONDecodeError, ValueError):
-                    continue
-
-                msg = entry.get("msg")
-                if msg == "PeerID":
-                    current_node_id = str(entry.get("node_id", node_name))
-                    node_ids.add(current_node_id)
-                elif msg == "Received Message":
-                    mid = entry.get("id", "")
-                    if not mid:
-                        continue
-                    nid = current_node_id or node_name
-                    node_ids.add(nid)
-                    deliveries[mid].add(nid)
-                    ts = entry.get("time", "")
-                    if mid not in first_seen or ts < first_seen[mid]:
-                        first_seen[mid] = ts
-
-    # Order messages by first delivery time
-    ordered_ids = sorted(deliveries.keys(), key=lambda m: first_seen.get(m, ""))
-    return deliveries, ordered_ids, len(node_ids)
+    reach = MessageReach()
+    (session or AnalysisSession(base_dir)).feed(reach)
+    return reach.deliveries, reach.ordered_ids(), len(reach.node_ids)
 
 
 def main() -> int:
@@ -100,7 +101,7 @@ def main() -> int:
         print(f"hosts directory not found under: {base_dir}", file=sys.stderr)
         return 1
 
-    deliveries, ordered_ids, node_count = parse_logs(hosts_dir)
+    deliveries, ordered_ids, node_count = parse_logs(base_dir)
 
     if not ordered_ids:
         print("no messages found in logs", file=sys.stderr)
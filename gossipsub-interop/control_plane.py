@@ -0,0 +1,276 @@
+"""
+Control-plane overhead of a Shadow run.
+
+Counts the GRAFT, PRUNE, IHAVE, IWANT and IDONTWANT events logged by the
+go-libp2p tracer per node, per message and per heartbeat window. Relates them
+to the full messages sent, and finds deliveries that only happened after the
+receiving node asked for the message with an IWANT. Implementations that do
+not trace control messages (currently everything but go-libp2p) are left out
+of the per-node ratios.
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from analysis_session import (
+    AnalysisSession,
+    add_report_arguments,
+    ratio,
+    write_json_report,
+)
+from live_analysis import SHADOW_START_NS
+from log_ingest import CONTROL_EVENTS
+
+# Default gossipsub heartbeat interval of the implementations
+DEFAULT_HEARTBEAT_INTERVAL_NS = 1_000_000_000
+
+CONTROL_EVENT_NAMES = tuple(
+    f"{direction} {kind}"
+    for direction in ("Sent", "Received")
+    for kind in CONTROL_EVENTS
+)
+
+
+def heartbeat_interval_ns(params_path: str) -> int:
+    """
+    Return the HeartbeatInterval configured in params.json.
+
+    Falls back to DEFAULT_HEARTBEAT_INTERVAL_NS if the file is missing or no
+    node sets the interval.
+    """
+    try:
+        with open(params_path, "r") as f:
+            script = json.load(f).get("script", [])
+    except (OSError, ValueError):
+        return DEFAULT_HEARTBEAT_INTERVAL_NS
+
+    for instruction in script:
+        if instruction.get("type") == "ifNodeIDEquals":
+            instruction = instruction.get("instruction", {})
+        if instruction.get("type") != "initGossipSub":
+            continue
+        interval = (instruction.get("gossipSubParams") or {}).get("HeartbeatInterval")
+        if interval:
+            return int(interval)
+    return DEFAULT_HEARTBEAT_INTERVAL_NS
+
+
+def _message_ids_sent(counts: Dict[str, Dict[str, int]]) -> int:
+    return sum(
+        sum(counts.get(f"Sent {kind}", {}).values())
+        for kind in ("Ihave", "Iwant", "Idontwant")
+    )
+
+
+def control_plane_summary(
+    session: AnalysisSession,
+    skip_messages: int = 0,
+    interval_ns: Optional[int] = None,
+) -> dict:
+    """
+    Build the control-plane report of a run, as written to control_plane.json.
+
+    "control_to_data" is the number of control events sent per full message
+    sent, and "control_ids_to_data" the number of message IDs sent in IHAVE,
+    IWANT and IDONTWANT events per full message sent.
+
+    Args:
+        session: Session of the Shadow output directory
+        skip_messages: Number of (warmup) messages left out of the per-message
+            report, matching analysis.txt
+        interval_ns: Heartbeat window length, by default the HeartbeatInterval
+            of params.json
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    if interval_ns is None:
+        interval_ns = heartbeat_interval_ns(f"{session.folder}/params.json")
+    store = session.store.skip(skip_messages)
+    first_delivery_ns = dict(zip(store.message_ids, store.first_delivery_ns().tolist()))
+
+    totals: Dict[str, int] = defaultdict(int)
+    per_node = {}
+    per_message = {
+        message_id: {"iwant_deliveries": 0, "iwant_latencies_ns": []}
+        for message_id in store.message_ids
+    }
+    for message in per_message.values():
+        message.update({event: 0 for event in CONTROL_EVENT_NAMES})
+    window_times: Dict[str, List[np.ndarray]] = defaultdict(list)
+    traced_nodes = 0
+
+    for result in session.control_results:
+        if not result.control_times_ns:
+            continue
+        traced_nodes += 1
+        counts = {
+            event: len(result.control_times_ns.get(event, []))
+            for event in CONTROL_EVENT_NAMES
+        }
+        sent_messages = len(result.sent_message_times_ns)
+        received_messages = len(result.message_ids) + sum(
+            result.duplicate_counts.values()
+        )
+        sent_control = sum(counts[f"Sent {kind}"] for kind in CONTROL_EVENTS)
+        per_node[result.node_id.id] = {
+            **counts,
+            "sent_messages": sent_messages,
+            "received_messages": received_messages,
+            "control_to_data": ratio(sent_control, sent_messages),
+            "control_ids_to_data": ratio(
+                _message_ids_sent(result.control_message_ids), sent_messages
+            ),
+        }
+        for event, count in counts.items():
+            totals[event] += count
+        totals["sent_messages"] += sent_messages
+        totals["received_messages"] += received_messages
+        totals["sent_message_ids"] += _message_ids_sent(result.control_message_ids)
+
+        for event, times in result.control_times_ns.items():
+            window_times[event].append(np.asarray(times, dtype=np.int64))
+        window_times["Sent Message"].append(
+            np.asarray(result.sent_message_times_ns, dtype=np.int64)
+        )
+
+        for event, message_counts in result.control_message_ids.items():
+            for message_id, count in message_counts.items():
+                if message_id in per_message:
+                    per_message[message_id][event] += count
+
+        # A first delivery that follows this node's IWANT for the message came
+        # from gossip rather than from a mesh peer pushing it
+        for message_id, timestamp_ns in zip(result.message_ids, result.timestamps_ns):
+            iwant_ns = result.iwant_sent_ns.get(message_id)
+            if iwant_ns is None or iwant_ns > timestamp_ns:
+                continue
+            message = per_message.get(message_id)
+            if message is not None:
+                message["iwant_deliveries"] += 1
+                message["iwant_latencies_ns"].append(
+                    timestamp_ns - first_delivery_ns[message_id]
+                )
+
+    sent_control = sum(totals[f"Sent {kind}"] for kind in CONTROL_EVENTS)
+    all_iwant_latencies = []
+    for message in per_message.values():
+        latencies = message.pop("iwant_latencies_ns")
+        all_iwant_latencies.extend(latencies)
+        message["iwant_mean_latency"] = (
+            float(np.mean(latencies)) / 1e9 if latencies else None
+        )
+
+    iwant_deliveries = sum(m["iwant_deliveries"] for m in per_message.values())
+    return {
+        "folder": str(session.folder),
+        "traced_nodes": traced_nodes,
+        "heartbeat_interval": interval_ns / 1e9,
+        "totals": {
+            **{event: totals[event] for event in CONTROL_EVENT_NAMES},
+            "sent_messages": totals["sent_messages"],
+            "received_messages": totals["received_messages"],
+            "control_to_data": ratio(sent_control, totals["sent_messages"]),
+            "control_ids_to_data": ratio(
+                totals["sent_message_ids"], totals["sent_messages"]
+            ),
+            "iwant_deliveries": iwant_deliveries,
+            "iwant_delivery_fraction": ratio(iwant_deliveries, store.num_deliveries),
+            "iwant_mean_latency": (
+                float(np.mean(all_iwant_latencies)) / 1e9
+                if all_iwant_latencies
+                else None
+            ),
+            "mean_latency": (
+                float(store.latency_ns().mean()) / 1e9 if store.num_deliveries else None
+            ),
+        },
+        "nodes": {str(node_id): stats for node_id, stats in sorted(per_node.items())},
+        "messages": per_message,
+        "heartbeats": _heartbeat_windows(window_times, interval_ns),
+    }
+
+
+def _heartbeat_windows(
+    window_times: Dict[str, List[np.ndarray]], interval_ns: int
+) -> dict:
+    """Count events per heartbeat window since the start of the simulation."""
+    events = {
+        event: np.concatenate(times) for event, times in window_times.items() if times
+    }
+    windows = {
+        event: (times - SHADOW_START_NS) // interval_ns
+        for event, times in events.items()
+        if len(times)
+    }
+    if not windows:
+        return {"start": []}
+    first = min(int(w.min()) for w in windows.values())
+    last = max(int(w.max()) for w in windows.values())
+    length = last - first + 1
+
+    heartbeats = {
+        "start": (np.arange(first, last + 1) * interval_ns / 1e9).tolist(),
+    }
+    for event in CONTROL_EVENT_NAMES + ("Sent Message",):
+        if event in windows:
+            heartbeats[event] = np.bincount(
+                windows[event] - first, minlength=length
+            ).tolist()
+        else:
+            heartbeats[event] = [0] * length
+    return heartbeats
+
+
+def format_summary(summary: dict) -> str:
+    """Render the run-wide totals of a control-plane report."""
+    totals = summary["totals"]
+    lines = [f"Control plane of {summary['traced_nodes']} traced nodes"]
+    for event in CONTROL_EVENT_NAMES:
+        lines.append(f"  {event}: {totals[event]}")
+    lines.append(f"  Sent Message: {totals['sent_messages']}")
+
+    def fmt(value, suffix=""):
+        return "n/a" if value is None else f"{value:.3f}{suffix}"
+
+    lines.append(f"Control events per message sent: {fmt(totals['control_to_data'])}")
+    lines.append(
+        f"Control message IDs per message sent: {fmt(totals['control_ids_to_data'])}"
+    )
+    lines.append(
+        f"Deliveries after an IWANT: {totals['iwant_deliveries']} "
+        f"({fmt(totals['iwant_delivery_fraction'])} of all), mean latency "
+        f"{fmt(totals['iwant_mean_latency'], 's')} vs {fmt(totals['mean_latency'], 's')} overall"
+    )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze gossipsub control-plane overhead from tracer logs"
+    )
+    add_report_arguments(parser, "control_plane.json")
+    parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        default=None,
+        help="Heartbeat window in seconds (default: HeartbeatInterval from params.json, or 1s)",
+    )
+    args = parser.parse_args()
+
+    interval_ns = None
+    if args.heartbeat_interval is not None:
+        interval_ns = int(args.heartbeat_interval * 1e9)
+    session = AnalysisSession(args.folder, args.jobs, control=True)
+    summary = control_plane_summary(session, args.skip, interval_ns)
+
+    write_json_report(args, "control_plane.json", summary)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Columnar storage of the parsed deliveries of a run.
+
+DeliveryStore keeps one row per first delivery in the parallel msg_index,
+node_index and timestamp_ns arrays, grouped by message, with offsets[i] the
+first row of message i. DeliveryStoreBuilder fills it from the parsed logs.
+"""
+
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+@dataclass
+class DeliveryStore:
+    """
+    Columnar store of the first delivery of every message to every node.
+
+    Messages are ordered by their first delivery, and the deliveries of each
+    message are ordered by timestamp. The deliveries of the message at index i
+    are the rows offsets[i]:offsets[i + 1] of the delivery columns.
+    """
+
+    message_ids: List[str]
+    # Row offsets per message, len(message_ids) + 1 entries
+    offsets: np.ndarray
+    # Delivery columns, one row per delivery
+    msg_index: np.ndarray  # int32
+    node_index: np.ndarray  # int32
+    timestamp_ns: np.ndarray  # int64, nanoseconds since the epoch
+    # Duplicate receptions per message
+    duplicate_counts: np.ndarray  # int64
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    @property
+    def num_deliveries(self) -> int:
+        return len(self.timestamp_ns)
+
+    def delivery_counts(self) -> np.ndarray:
+        """Number of nodes each message was delivered to."""
+        return np.diff(self.offsets)
+
+    def first_delivery_ns(self) -> np.ndarray:
+        return self.timestamp_ns[self.offsets[:-1]]
+
+    def last_delivery_ns(self) -> np.ndarray:
+        return self.timestamp_ns[self.offsets[1:] - 1]
+
+    def latency_ns(self) -> np.ndarray:
+        """Time from the first delivery of its message, for every delivery."""
+        return self.timestamp_ns - np.repeat(
+            self.first_delivery_ns(), self.delivery_counts()
+        )
+
+    def nth_latency_ns(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Latency of the delivery at the given position within each message.
+
+        Args:
+            positions: Index into each message's sorted deliveries, one per message
+
+        Returns:
+            Array of latencies in nanoseconds, one per message
+        """
+        return (
+            self.timestamp_ns[self.offsets[:-1] + positions] - self.first_delivery_ns()
+        )
+
+    def latency_quantiles_ns(self, quantiles: Iterable[float]) -> np.ndarray:
+        """
+        Per-message delivery latency at each quantile of the message's receivers.
+
+        Uses the same nearest-rank definition as the p50 in analysis.txt: the
+        quantile q of a message delivered to n nodes is the latency of its
+        delivery at position min(floor(q * n), n - 1).
+
+        Args:
+            quantiles: Quantiles in [0, 1]
+
+        Returns:
+            Array of latencies in nanoseconds, shape (messages, quantiles)
+        """
+        quantiles = np.asarray(list(quantiles), dtype=np.float64)
+        counts = self.delivery_counts()
+        positions = np.minimum(
+            np.floor(np.outer(counts, quantiles)).astype(np.int64), counts[:, None] - 1
+        )
+        return (
+            self.timestamp_ns[self.offsets[:-1, None] + positions]
+            - self.first_delivery_ns()[:, None]
+        )
+
+    def delivered_within_ns(self, latencies_ns: np.ndarray) -> np.ndarray:
+        """
+        Number of nodes holding each message at each latency after its first delivery.
+
+        Args:
+            latencies_ns: Sorted latencies in nanoseconds
+
+        Returns:
+            Array of node counts, shape (messages, latencies)
+        """
+        if not len(self):
+            return np.zeros((0, len(latencies_ns)), dtype=np.int64)
+        # Latencies are sorted within each message, so shifting every message
+        # into its own disjoint key range makes the whole column sorted and
+        # lets one searchsorted answer every (message, latency) pair.
+        latency = self.latency_ns()
+        stride = max(int(latency.max()), int(np.max(latencies_ns, initial=0))) + 1
+        keys = self.msg_index.astype(np.int64) * stride + latency
+        queries = (
+            np.arange(len(self), dtype=np.int64)[:, None] * stride
+            + np.asarray(latencies_ns, dtype=np.int64)[None, :]
+        )
+        return np.searchsorted(keys, queries, side="right") - self.offsets[:-1, None]
+
+    def skip(self, count: int) -> "DeliveryStore":
+        """Return a store without the first `count` messages."""
+        count = min(max(count, 0), len(self))
+        start = self.offsets[count]
+        return DeliveryStore(
+            message_ids=self.message_ids[count:],
+            offsets=self.offsets[count:] - start,
+            msg_index=self.msg_index[start:] - count,
+            node_index=self.node_index[start:],
+            timestamp_ns=self.timestamp_ns[start:],
+            duplicate_counts=self.duplicate_counts[count:],
+        )
+
+    def latencies_by_group(
+        self, node_to_group: Dict[int, int]
+    ) -> Dict[int, np.ndarray]:
+        """
+        Group delivery latencies by a per-node key, such as the network ID.
+
+        Deliveries to nodes missing from node_to_group are dropped.
+
+        Args:
+            node_to_group: Dictionary mapping node index to group key
+
+        Returns:
+            Dictionary mapping group key to the latencies (ns) of its deliveries
+        """
+        if not self.num_deliveries:
+            return {}
+        # Resolve the group of each distinct node once, then broadcast
+        nodes, inverse = np.unique(self.node_index, return_inverse=True)
+        node_groups = np.array(
+            [node_to_group.get(int(node), -1) for node in nodes], dtype=np.int64
+        )
+        delivery_groups = node_groups[inverse]
+        latencies = self.latency_ns()
+
+        grouped = {}
+        for group in np.unique(node_groups):
+            if group == -1:
+                continue
+            grouped[int(group)] = latencies[delivery_groups == group]
+        return grouped
+
+
+class DeliveryStoreBuilder:
+    """Accumulates per-node deliveries and builds a DeliveryStore."""
+
+    def __init__(self):
+        self._message_index: Dict[str, int] = {}
+        self._msg_index = array("i")
+        self._node_index = array("i")
+        self._timestamp_ns = array("q")
+        self._duplicate_counts: List[int] = []
+
+    def _intern(self, message_id: str) -> int:
+        index = self._message_index.get(message_id)
+        if index is None:
+            index = len(self._message_index)
+            self._message_index[message_id] = index
+            self._duplicate_counts.append(0)
+        return index
+
+    def add(
+        self,
+        node_id: int,
+        message_ids: Iterable[str],
+        timestamps_ns: Iterable[int],
+        duplicate_counts: Dict[str, int],
+    ):
+        """
+        Add the first deliveries and duplicate counts observed by one node.
+
+        Args:
+            node_id: Node that received the messages
+            message_ids: ID of each delivered message
+            timestamps_ns: First delivery time of each message, in nanoseconds
+            duplicate_counts: Dictionary mapping message ID to duplicate count
+        """
+        for message_id, timestamp_ns in zip(message_ids, timestamps_ns):
+            self._msg_index.append(self._intern(message_id))
+            self._node_index.append(node_id)
+            self._timestamp_ns.append(timestamp_ns)
+        for message_id, count in duplicate_counts.items():
+            self._duplicate_counts[self._intern(message_id)] += count
+
+    def build(self) -> DeliveryStore:
+        msg_index = np.frombuffer(self._msg_index, dtype=np.int32)
+        node_index = np.frombuffer(self._node_index, dtype=np.int32)
+        timestamp_ns = np.frombuffer(self._timestamp_ns, dtype=np.int64)
+        message_ids = list(self._message_index)
+        num_messages = len(message_ids)
+
+        # Messages that only ever arrived as duplicates have no deliveries to
+        # order by, so they are dropped.
+        first_ns = np.full(num_messages, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first_ns, msg_index, timestamp_ns)
+        delivered = np.bincount(msg_index, minlength=num_messages) > 0
+
+        # Order messages by first delivery, keeping first-seen order on ties
+        order = np.argsort(first_ns, kind="stable")
+        order = order[delivered[order]]
+        rank = np.full(num_messages, -1, dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+
+        # Order deliveries by message rank and then time. lexsort is stable,
+        # so ties keep the order the deliveries were added in.
+        new_msg_index = rank[msg_index]
+        rows = np.lexsort((timestamp_ns, new_msg_index))
+        counts = np.bincount(new_msg_index, minlength=len(order))
+
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return DeliveryStore(
+            message_ids=[message_ids[i] for i in order],
+            offsets=offsets,
+            msg_index=new_msg_index[rows],
+            node_index=node_index[rows],
+            timestamp_ns=timestamp_ns[rows],
+            duplicate_counts=np.array(self._duplicate_counts, dtype=np.int64)[order],
+        )
@@ -0,0 +1,262 @@
+"""
+Dissemination trees of the messages of a Shadow run.
+
+Every first delivery names the peer it was received from, so each message's
+first deliveries form a tree rooted at its publisher. This module rebuilds
+those trees and reports hop count distributions, tree depth and the critical
+path to the node that set the p99 delivery latency, with the network of every
+hop. Comparing the hop delays with the number of hops shows whether the tail
+latency comes from mesh degree (many hops) or geography (slow hops).
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import experiment
+from analysis_session import AnalysisSession, add_report_arguments, write_json_report
+from live_analysis import SHADOW_START_NS
+
+# Latency quantile whose critical path is reported
+CRITICAL_PATH_QUANTILE = 0.99
+
+
+def _node_regions(session: AnalysisSession) -> Dict[int, str]:
+    labels = session.network_labels()
+    return {
+        node_id: labels[network_id]
+        for node_id, network_id in session.node_networks().items()
+        if network_id in labels
+    }
+
+
+def message_publishers(session: AnalysisSession) -> Dict[str, Tuple[int, int]]:
+    """Dictionary mapping message ID to its publisher and publish time (ns)."""
+    try:
+        params = experiment.load_params(f"{session.folder}/params.json")
+    except OSError:
+        return {}
+    return {
+        message.message_id: (
+            message.publisher,
+            SHADOW_START_NS + message.publish_seconds * 1_000_000_000,
+        )
+        for message in experiment.expected_messages(params, session.total_nodes)
+    }
+
+
+def _hops(parents: Dict[int, Optional[int]], root: int) -> Dict[int, int]:
+    """Number of hops from the root of every node whose path reaches it."""
+    hops = {root: 0}
+    for node in parents:
+        path = []
+        while node not in hops and node is not None and node not in path:
+            path.append(node)
+            node = parents.get(node)
+        if node not in hops:
+            # The path ends at an unknown peer or loops, it is not in the tree
+            continue
+        depth = hops[node]
+        for child in reversed(path):
+            depth += 1
+            hops[child] = depth
+    return hops
+
+
+def message_tree(
+    deliveries: Dict[int, Tuple[int, Optional[int]]],
+    hops: Dict[int, int],
+    root: int,
+    root_ns: int,
+    regions: Dict[int, str],
+) -> dict:
+    """
+    Summarise the dissemination tree of one message.
+
+    Args:
+        deliveries: Dictionary mapping node ID to its first delivery time (ns)
+            and the node it received the message from (None if unknown)
+        hops: Hops from the root of every node in the tree, as from _hops
+        root: Node that published the message
+        root_ns: Time the message was published
+        regions: Dictionary mapping node ID to its network label
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    # The publisher may receive its own message back, which is not a delivery
+    deliveries = {node: d for node, d in deliveries.items() if node != root}
+    parents = {node: parent for node, (_, parent) in deliveries.items()}
+    hops = {node: h for node, h in hops.items() if node != root}
+    times = {node: timestamp_ns for node, (timestamp_ns, _) in deliveries.items()}
+    times[root] = root_ns
+
+    tree = {
+        "publisher": root,
+        "deliveries": len(deliveries),
+        "orphans": len(deliveries) - len(hops),
+        "depth": max(hops.values(), default=0),
+        "mean_hops": float(np.mean(list(hops.values()))) if hops else None,
+        "hops": {str(h): c for h, c in sorted(Counter(hops.values()).items())},
+        "critical_path": [],
+    }
+    if not hops:
+        return tree
+
+    # Nearest-rank p99 over the nodes in the tree, as in analysis.json
+    ordered = sorted(hops, key=lambda node: times[node])
+    target = ordered[min(int(CRITICAL_PATH_QUANTILE * len(ordered)), len(ordered) - 1)]
+    path = [target]
+    while path[-1] != root:
+        path.append(parents[path[-1]])
+    path.reverse()
+    tree["critical_path"] = [
+        {
+            "node": node,
+            "region": regions.get(node),
+            "latency": (times[node] - root_ns) / 1e9,
+            "hop_delay": (times[node] - times[parent]) / 1e9 if i else 0.0,
+        }
+        for i, (node, parent) in enumerate(zip(path, [None] + path[:-1]))
+    ]
+    return tree
+
+
+def dissemination_summary(session: AnalysisSession, skip_messages: int = 0) -> dict:
+    """
+    Build the dissemination tree report of a run, as written to dissemination.json.
+
+    Latencies are measured from the publish instant in params.json, or from
+    the first delivery when the publisher is unknown. "hop_delay" is the time
+    between the sender's and the receiver's first delivery, grouped by whether
+    both ends are in the same network.
+
+    Args:
+        session: Session of the Shadow output directory
+        skip_messages: Number of (warmup) messages to leave out, matching
+            analysis.txt
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    store = session.store.skip(skip_messages)
+    publishers = message_publishers(session)
+    regions = _node_regions(session)
+    peer_to_node = session.peer_id_to_node_id
+
+    deliveries: Dict[str, Dict[int, Tuple[int, Optional[int]]]] = {
+        message_id: {} for message_id in store.message_ids
+    }
+    for result in session.file_results:
+        for message_id, timestamp_ns, sender in zip(
+            result.message_ids, result.timestamps_ns, result.delivered_from
+        ):
+            if message_id in deliveries:
+                deliveries[message_id][result.node_id.id] = (
+                    timestamp_ns,
+                    peer_to_node.get(sender),
+                )
+
+    messages = {}
+    all_hops: Counter = Counter()
+    latency_by_hops: Dict[int, List[float]] = defaultdict(list)
+    hop_delays: Dict[str, List[float]] = defaultdict(list)
+    for message_id, first_ns in zip(store.message_ids, store.first_delivery_ns()):
+        message_deliveries = deliveries[message_id]
+        if message_id in publishers:
+            root, root_ns = publishers[message_id]
+        else:
+            # Without a script the earliest receiver stands in for the publisher
+            root = min(message_deliveries, key=lambda n: message_deliveries[n][0])
+            root_ns = int(first_ns)
+        parents = {
+            node: parent
+            for node, (_, parent) in message_deliveries.items()
+            if node != root
+        }
+        hops = _hops(parents, root)
+        tree = message_tree(message_deliveries, hops, root, root_ns, regions)
+        messages[message_id] = tree
+
+        for h, count in tree["hops"].items():
+            all_hops[int(h)] += count
+        for node, h in hops.items():
+            if node == root:
+                continue
+            timestamp_ns, parent = message_deliveries[node]
+            latency_by_hops[h].append((timestamp_ns - root_ns) / 1e9)
+            parent_ns = root_ns if parent == root else message_deliveries[parent][0]
+            region = regions.get(node)
+            same = region is not None and region == regions.get(parent)
+            hop_delays["same_network" if same else "cross_network"].append(
+                (timestamp_ns - parent_ns) / 1e9
+            )
+
+    return {
+        "folder": str(session.folder),
+        "run": {
+            "hops": {str(h): c for h, c in sorted(all_hops.items())},
+            "mean_depth": (
+                float(np.mean([m["depth"] for m in messages.values()]))
+                if messages
+                else None
+            ),
+            "max_depth": max((m["depth"] for m in messages.values()), default=0),
+            "mean_latency_by_hops": {
+                str(h): float(np.mean(latencies))
+                for h, latencies in sorted(latency_by_hops.items())
+            },
+            "hop_delay": {
+                kind: {
+                    "hops": len(delays),
+                    "mean": float(np.mean(delays)),
+                    "p99": float(np.percentile(delays, 99)),
+                }
+                for kind, delays in sorted(hop_delays.items())
+            },
+        },
+        "messages": messages,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Render the run-wide hop distribution and hop delays of a report."""
+    run = summary["run"]
+    mean_depth = run["mean_depth"]
+    lines = [
+        (
+            f"Tree depth: mean {'n/a' if mean_depth is None else f'{mean_depth:.2f}'}, "
+            f"max {run['max_depth']}"
+        ),
+        "Hops: "
+        + ", ".join(
+            f"{h}: {count} ({run['mean_latency_by_hops'][h]:.3f}s)"
+            for h, count in run["hops"].items()
+        ),
+    ]
+    for kind, stats in run["hop_delay"].items():
+        lines.append(
+            f"{kind} hop delay: mean {stats['mean']:.3f}s, p99 {stats['p99']:.3f}s "
+            f"over {stats['hops']} hops"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the dissemination tree of every gossipsub message"
+    )
+    add_report_arguments(parser, "dissemination.json")
+    args = parser.parse_args()
+
+    session = AnalysisSession(args.folder, args.jobs)
+    summary = dissemination_summary(session, args.skip)
+
+    write_json_report(args, "dissemination.json", summary)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
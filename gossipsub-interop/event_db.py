@@ -0,0 +1,389 @@
+"""
+SQLite store of the parsed events of a Shadow run, for ad-hoc queries.
+
+Loads the first deliveries, duplicate receptions and control events of every
+node, plus the node to region and node to implementation maps, into
+events.sqlite in the output directory. The database is built from the parse
+cache, so querying a large run never re-parses its logs. Times are in
+nanoseconds since the start of the simulation.
+
+Tables:
+    nodes(node_id, peer_id, network, region, implementation)
+    messages(msg_id, publisher, publish_ns, size_bytes, first_delivery_ns)
+    deliveries(msg_id, node_id, time_ns, latency_ns, from_node)
+    duplicates(msg_id, node_id, time_ns, from_node)
+    control_events(node_id, event, time_ns)
+    control_message_ids(node_id, event, msg_id, count)
+
+latency_ns is measured from the publish instant in params.json, or from the
+first delivery when the message has no known publisher. from_node is NULL
+when the sending peer is unknown. Control events only carry their message IDs
+as per-node counts, see control_message_ids.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+import experiment
+from analysis_session import AnalysisSession
+from dissemination import message_publishers
+from live_analysis import SHADOW_START_NS
+from log_ingest import CACHE_VERSION, log_file_keys
+from region_latency import node_regions
+
+EVENT_DB_FILE = "events.sqlite"
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE nodes (
+    node_id INTEGER PRIMARY KEY,
+    peer_id TEXT,
+    network TEXT,
+    region TEXT,
+    implementation TEXT
+);
+CREATE TABLE messages (
+    msg_id TEXT PRIMARY KEY,
+    publisher INTEGER,
+    publish_ns INTEGER,
+    size_bytes INTEGER,
+    first_delivery_ns INTEGER
+);
+CREATE TABLE deliveries (
+    msg_id TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    time_ns INTEGER NOT NULL,
+    latency_ns INTEGER NOT NULL,
+    from_node INTEGER
+);
+CREATE TABLE duplicates (
+    msg_id TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    time_ns INTEGER NOT NULL,
+    from_node INTEGER
+);
+CREATE TABLE control_events (
+    node_id INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    time_ns INTEGER NOT NULL
+);
+CREATE TABLE control_message_ids (
+    node_id INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    msg_id TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+"""
+
+# Created after the bulk inserts, which is faster than maintaining them
+_INDEXES = """
+CREATE INDEX deliveries_msg ON deliveries (msg_id, time_ns);
+CREATE INDEX deliveries_node ON deliveries (node_id, time_ns);
+CREATE INDEX deliveries_time ON deliveries (time_ns);
+CREATE INDEX duplicates_msg ON duplicates (msg_id, time_ns);
+CREATE INDEX duplicates_node ON duplicates (node_id, time_ns);
+CREATE INDEX duplicates_time ON duplicates (time_ns);
+CREATE INDEX control_events_node ON control_events (node_id, time_ns);
+CREATE INDEX control_events_time ON control_events (time_ns);
+CREATE INDEX control_message_ids_msg ON control_message_ids (msg_id);
+"""
+
+
+def event_db_path(folder) -> str:
+    return os.path.join(folder, EVENT_DB_FILE)
+
+
+def build_event_db(session: AnalysisSession, path: str = None) -> str:
+    """
+    Load the parsed events of a session into a new SQLite database.
+
+    The database is written next to its final path and renamed into place,
+    so readers never see a partial database.
+
+    Args:
+        session: Session of the Shadow output directory
+        path: Database file, defaults to events.sqlite in the output directory
+
+    Returns:
+        Path of the database
+    """
+    path = path or event_db_path(session.folder)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    store = session.store
+    peer_to_node = session.peer_id_to_node_id
+    publishers = message_publishers(session)
+    sizes = {}
+    if publishers:
+        params = experiment.load_params(f"{session.folder}/params.json")
+        sizes = {
+            message.message_id: message.message_size_bytes
+            for message in experiment.expected_messages(params, session.total_nodes)
+        }
+    first_ns = dict(zip(store.message_ids, store.first_delivery_ns().tolist()))
+    # Latency origin of every message
+    origin_ns = {
+        message_id: publishers[message_id][1] if message_id in publishers else first
+        for message_id, first in first_ns.items()
+    }
+    # Size and mtime of the logs the database is built from
+    logs = log_file_keys(session.folder)
+    labels = session.network_labels()
+    networks = session.node_networks()
+    regions = node_regions(session)
+    implementations = session.node_implementations()
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(
+            "PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + _SCHEMA
+        )
+        with connection:
+            connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [
+                    ("folder", str(session.folder)),
+                    ("cache_version", str(CACHE_VERSION)),
+                    ("shadow_start_ns", str(SHADOW_START_NS)),
+                    ("logs", _logs_meta(logs)),
+                ],
+            )
+            connection.executemany(
+                "INSERT INTO nodes VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        node_id,
+                        peer_id,
+                        labels.get(networks.get(node_id)),
+                        regions.get(node_id),
+                        implementations.get(node_id),
+                    )
+                    for node_id, peer_id in _node_peer_ids(session).items()
+                ),
+            )
+            connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        message_id,
+                        publishers.get(message_id, (None, None))[0],
+                        _since_start(publishers.get(message_id, (None, None))[1]),
+                        sizes.get(message_id),
+                        first - SHADOW_START_NS,
+                    )
+                    for message_id, first in first_ns.items()
+                ),
+            )
+            for result in session.control_results:
+                _insert_node_events(connection, result, peer_to_node, origin_ns)
+        connection.executescript(_INDEXES)
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def _node_peer_ids(session: AnalysisSession) -> dict:
+    """
+    Peer ID of every node with a log, None if it logged none.
+
+    Several logs can belong to one node, e.g. logs of unknown nodes (-1), so
+    each node gets a single row.
+    """
+    peer_ids = {}
+    for result in session.control_results:
+        node_id = result.node_id.id
+        if peer_ids.get(node_id) is None:
+            peer_ids[node_id] = result.peer_id
+    return peer_ids
+
+
+def _logs_meta(logs) -> str:
+    return json.dumps({path: list(key) for path, key in sorted(logs.items())})
+
+
+def _since_start(timestamp_ns):
+    return None if timestamp_ns is None else timestamp_ns - SHADOW_START_NS
+
+
+def _insert_node_events(connection, result, peer_to_node, origin_ns):
+    node_id = result.node_id.id
+    connection.executemany(
+        "INSERT INTO deliveries VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                message_id,
+                node_id,
+                timestamp_ns - SHADOW_START_NS,
+                timestamp_ns - origin_ns[message_id],
+                peer_to_node.get(sender),
+            )
+            for message_id, timestamp_ns, sender in zip(
+                result.message_ids, result.timestamps_ns, result.delivered_from
+            )
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO duplicates VALUES (?, ?, ?, ?)",
+        (
+            (
+                message_id,
+                node_id,
+                timestamp_ns - SHADOW_START_NS,
+                peer_to_node.get(sender),
+            )
+            for message_id, timestamp_ns, sender in zip(
+                result.duplicate_message_ids,
+                result.duplicate_times_ns,
+                result.duplicate_from,
+            )
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO control_events VALUES (?, ?, ?)",
+        (
+            (node_id, event, timestamp_ns - SHADOW_START_NS)
+            for event, times in result.control_times_ns.items()
+            for timestamp_ns in times
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO control_message_ids VALUES (?, ?, ?, ?)",
+        (
+            (node_id, event, message_id, count)
+            for event, counts in result.control_message_ids.items()
+            for message_id, count in counts.items()
+        ),
+    )
+
+
+def open_event_db(folder, jobs: int = 1, rebuild: bool = False) -> sqlite3.Connection:
+    """
+    Open the event database of an output directory, building it if needed.
+
+    The database is rebuilt when it was built from an older parse cache
+    format, or from logs that changed since (by size and mtime).
+
+    Args:
+        folder: Shadow output directory
+        jobs: Number of worker processes used to parse log files, if the
+            parse cache is missing too
+        rebuild: Always rebuild the database
+
+    Returns:
+        Connection to the database
+    """
+    path = event_db_path(folder)
+    if not rebuild and os.path.exists(path):
+        connection = sqlite3.connect(path)
+        try:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            meta = {}
+        if meta.get("cache_version") == str(CACHE_VERSION) and meta.get(
+            "logs"
+        ) == _logs_meta(log_file_keys(folder)):
+            return connection
+        connection.close()
+    build_event_db(AnalysisSession(folder, jobs, control=True), path)
+    return sqlite3.connect(path)
+
+
+def write_rows(cursor: sqlite3.Cursor, out=sys.stdout, delimiter: str = "\t"):
+    """Write the column names and rows of an executed query."""
+    writer = csv.writer(out, delimiter=delimiter, lineterminator="\n")
+    if cursor.description is None:
+        return
+    writer.writerow(column[0] for column in cursor.description)
+    writer.writerows(cursor)
+
+
+# Canned queries of the CLI
+SEEN_AFTER_QUERY = """
+SELECT d.node_id, n.region, n.implementation, d.latency_ns / 1e9 AS latency,
+       d.from_node
+FROM deliveries d JOIN nodes n USING (node_id)
+WHERE d.msg_id = ? AND d.latency_ns > ?
+ORDER BY d.latency_ns
+"""
+
+TABLE_COUNTS_QUERY = " UNION ALL ".join(
+    f"SELECT '{table}' AS name, COUNT(*) AS rows FROM {table}"
+    for table in (
+        "nodes",
+        "messages",
+        "deliveries",
+        "duplicates",
+        "control_events",
+        "control_message_ids",
+    )
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Query the parsed events of a run with SQL. Builds events.sqlite in "
+            "the output folder on first use."
+        ),
+        epilog=__doc__.split("Tables:", 1)[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("folder", help="Shadow output folder")
+    parser.add_argument(
+        "sql",
+        nargs="?",
+        help="SQL query to run (default: print the number of rows per table)",
+    )
+    parser.add_argument(
+        "--seen-after",
+        nargs=2,
+        metavar=("MESSAGE_ID", "SECONDS"),
+        help="List the nodes that got MESSAGE_ID more than SECONDS after its publish",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Rebuild the database from the parse cache",
+    )
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="Write comma separated rows instead of tab separated",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse log files, 0 uses all CPUs (default: 1)",
+    )
+    args = parser.parse_args()
+    if args.sql and args.seen_after:
+        parser.error("give either a SQL query or --seen-after")
+
+    connection = open_event_db(args.folder, args.jobs, args.rebuild)
+    try:
+        if args.seen_after:
+            message_id, seconds = args.seen_after
+            cursor = connection.execute(
+                SEEN_AFTER_QUERY, (message_id, int(float(seconds) * 1e9))
+            )
+        else:
+            cursor = connection.execute(args.sql or TABLE_COUNTS_QUERY)
+        write_rows(cursor, delimiter="," if args.csv else "\t")
+    except sqlite3.Error as e:
+        print(f"Query failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
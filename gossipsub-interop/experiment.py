@@ -1,9 +1,12 @@
+import json
 import random
 from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import timedelta
 from typing import Dict, List, Set
 
+from pydantic import TypeAdapter
+
 import script_instruction
 from script_instruction import GossipSubParams, NodeID, ScriptInstruction
 
@@ -19,6 +22,153 @@ class ExperimentParams:
     script: List[ScriptInstruction] = field(default_factory=list)
 
 
+@dataclass
+class ExpectedMessage:
+    message_id: str
+    topic: str
+    publisher: NodeID
+    # Seconds since the start of the experiment at which it is published
+    publish_seconds: int
+    # Number of subscribers, excluding the publisher, that should receive it
+    receivers: int
+    message_size_bytes: int = 0
+
+
+@dataclass
+class ExpectedPartialGroup:
+    group_id: int
+    topic: str
+    # Seconds since the start of the experiment of its first PublishPartial
+    publish_seconds: int
+    publishers: List[NodeID]
+    # Parts bitmap given to each node with AddPartialMessage
+    parts: Dict[NodeID, int]
+    subscribers: Set[NodeID]
+
+
+def load_params(path: str) -> ExperimentParams:
+    """Load the ExperimentParams written to params.json by run.py."""
+    with open(path, "r") as f:
+        d = json.load(f)
+    return ExperimentParams(
+        script=TypeAdapter(List[ScriptInstruction]).validate_python(d["script"])
+    )
+
+
+def expected_messages(
+    params: ExperimentParams, node_count: int
+) -> List[ExpectedMessage]:
+    """
+    Return every message published by the script along with its expected reach.
+
+    Subscriptions and publishes are either run by all nodes (top level) or by a
+    single node (wrapped in IfNodeIDEquals).
+    """
+    subscribers: Dict[str, Set[NodeID]] = defaultdict(set)
+    publishes = []
+    elapsed_seconds = 0
+    for instruction in params.script:
+        node_ids = list(range(node_count))
+        if isinstance(instruction, script_instruction.IfNodeIDEquals):
+            node_ids = [instruction.nodeID]
+            instruction = instruction.instruction
+
+        match instruction:
+            case script_instruction.WaitUntil(elapsedSeconds=seconds):
+                elapsed_seconds = seconds
+            case script_instruction.SubscribeToTopic(topicID=topic):
+                subscribers[topic].update(node_ids)
+            case script_instruction.Publish(
+                messageID=message_id, topicID=topic, messageSizeBytes=size
+            ):
+                for node_id in node_ids:
+                    publishes.append(
+                        (str(message_id), topic, node_id, elapsed_seconds, size)
+                    )
+
+    return [
+        ExpectedMessage(
+            message_id=message_id,
+            topic=topic,
+            publisher=publisher,
+            publish_seconds=publish_seconds,
+            receivers=len(subscribers[topic] - {publisher}),
+            message_size_bytes=size,
+        )
+        for message_id, topic, publisher, publish_seconds, size in publishes
+    ]
+
+
+def expected_partial_groups(
+    params: ExperimentParams, node_count: int
+) -> List[ExpectedPartialGroup]:
+    """
+    Return every partial message group published by the script.
+
+    Like expected_messages, instructions are either run by all nodes or by a
+    single node wrapped in IfNodeIDEquals.
+    """
+    subscribers: Dict[str, Set[NodeID]] = defaultdict(set)
+    parts: Dict[int, Dict[NodeID, int]] = defaultdict(dict)
+    groups: Dict[int, ExpectedPartialGroup] = {}
+    elapsed_seconds = 0
+    for instruction in params.script:
+        node_ids = list(range(node_count))
+        if isinstance(instruction, script_instruction.IfNodeIDEquals):
+            node_ids = [instruction.nodeID]
+            instruction = instruction.instruction
+
+        match instruction:
+            case script_instruction.WaitUntil(elapsedSeconds=seconds):
+                elapsed_seconds = seconds
+            case script_instruction.SubscribeToTopic(topicID=topic, partial=True):
+                subscribers[topic].update(node_ids)
+            case script_instruction.AddPartialMessage(groupID=group_id, parts=bits):
+                for node_id in node_ids:
+                    parts[group_id][node_id] = parts[group_id].get(node_id, 0) | bits
+            case script_instruction.PublishPartial(topicID=topic, groupID=group_id):
+                if group_id not in groups:
+                    groups[group_id] = ExpectedPartialGroup(
+                        group_id=group_id,
+                        topic=topic,
+                        publish_seconds=elapsed_seconds,
+                        publishers=[],
+                        parts=parts[group_id],
+                        subscribers=subscribers[topic],
+                    )
+                groups[group_id].publishers.extend(node_ids)
+
+    return list(groups.values())
+
+
+def connections(params: ExperimentParams, node_count: int) -> Dict[NodeID, Set[NodeID]]:
+    """Return the (bidirectional) links made by the Connect instructions."""
+    links: Dict[NodeID, Set[NodeID]] = defaultdict(set)
+    for instruction in params.script:
+        node_ids = list(range(node_count))
+        if isinstance(instruction, script_instruction.IfNodeIDEquals):
+            node_ids = [instruction.nodeID]
+            instruction = instruction.instruction
+        if isinstance(instruction, script_instruction.Connect):
+            for node_id in node_ids:
+                for peer in instruction.connectTo:
+                    links[node_id].add(peer)
+                    links[peer].add(node_id)
+    return links
+
+
+def script_duration_seconds(params: ExperimentParams) -> int:
+    """Seconds since the start of the experiment at which the script finishes."""
+    return max(
+        (
+            instruction.elapsedSeconds
+            for instruction in params.script
+            if isinstance(instruction, script_instruction.WaitUntil)
+        ),
+        default=0,
+    )
+
+
 def spread_heartbeat_delay(
     node_count: int, template_gs_params: GossipSubParams
 ) -> List[ScriptInstruction]:
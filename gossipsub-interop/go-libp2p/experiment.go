@@ -74,7 +74,7 @@ func (m *partialMsgManager) run() {
 	for {
 		select {
 		case rpc := <-m.incomingRPC:
-			m.Info("Received partial RPC")
+			m.Info("Received partial RPC", "groupID", hex.EncodeToString(rpc.GroupID))
 			m.handleRPC(rpc)
 		case req := <-m.add:
 			m.Info("Adding partial message")
@@ -0,0 +1,189 @@
+"""
+Delivery latency and duplicates per implementation pair of a mixed Shadow run.
+
+Every node is mapped to the implementation it runs (from the binary paths in
+shadow.yaml), and every reception to the implementation of the peer it came
+from. Reports are grouped per receiving implementation and per (sender,
+receiver) pair, so a slow or chatty stack stands out in a mixed
+--composition run.
+"""
+
+import argparse
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from analysis_session import AnalysisSession, add_report_arguments, write_json_report
+from dissemination import message_publishers
+
+UNKNOWN_IMPLEMENTATION = "unknown"
+
+
+def _latency_stats(latencies_ns: List[int]) -> dict:
+    if not latencies_ns:
+        return {}
+    latencies = np.sort(np.asarray(latencies_ns, dtype=np.int64))
+    positions = np.minimum(
+        (np.array([0.5, 0.99]) * len(latencies)).astype(np.int64), len(latencies) - 1
+    )
+    p50, p99 = latencies[positions] / 1e9
+    return {"mean": float(latencies.mean() / 1e9), "p50": float(p50), "p99": float(p99)}
+
+
+def implementation_summary(session: AnalysisSession, skip_messages: int = 0) -> dict:
+    """
+    Build the implementation report of a run, as written to implementations.json.
+
+    "latency" is measured from the first delivery of the message, as in
+    analysis.txt. "hop_delay" is the time from the sender's own first delivery
+    (or publish) to the receiver's first delivery, so it captures how quickly
+    the sending implementation forwards plus the link latency. "duplicates"
+    counts receptions from the pair beyond the first delivery.
+
+    Args:
+        session: Session of the Shadow output directory
+        skip_messages: Number of (warmup) messages to leave out, matching
+            analysis.txt
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    store = session.store.skip(skip_messages)
+    first_ns = dict(zip(store.message_ids, store.first_delivery_ns().tolist()))
+    implementations = session.node_implementations()
+    peer_to_node = session.peer_id_to_node_id
+
+    def implementation(node_id) -> str:
+        return implementations.get(node_id, UNKNOWN_IMPLEMENTATION)
+
+    # Time each node first held each message, including its publisher
+    held_ns: Dict[str, Dict[int, int]] = defaultdict(dict)
+    for message_id, (publisher, publish_ns) in message_publishers(session).items():
+        if message_id in first_ns:
+            held_ns[message_id][publisher] = publish_ns
+    for result in session.file_results:
+        for message_id, timestamp_ns in zip(result.message_ids, result.timestamps_ns):
+            if message_id in first_ns:
+                held_ns[message_id].setdefault(result.node_id.id, timestamp_ns)
+
+    receivers = defaultdict(lambda: {"nodes": 0, "latencies": [], "duplicates": 0})
+    pairs = defaultdict(
+        lambda: {"first": 0, "receptions": 0, "latencies": [], "hop_delays": []}
+    )
+    for result in session.file_results:
+        node_id = result.node_id.id
+        receiver = implementation(node_id)
+        receivers[receiver]["nodes"] += 1
+
+        for message_id, timestamp_ns, sender_peer in zip(
+            result.message_ids, result.timestamps_ns, result.delivered_from
+        ):
+            if message_id not in first_ns:
+                continue
+            sender_node = peer_to_node.get(sender_peer)
+            pair = pairs[(implementation(sender_node), receiver)]
+            latency_ns = timestamp_ns - first_ns[message_id]
+            receivers[receiver]["latencies"].append(latency_ns)
+            pair["first"] += 1
+            pair["latencies"].append(latency_ns)
+            sender_ns = held_ns[message_id].get(sender_node)
+            if sender_ns is not None and sender_node != node_id:
+                pair["hop_delays"].append(timestamp_ns - sender_ns)
+
+        for message_id, senders in result.received_from.items():
+            if message_id not in first_ns:
+                continue
+            for sender_peer, count in senders.items():
+                sender = implementation(peer_to_node.get(sender_peer))
+                pairs[(sender, receiver)]["receptions"] += count
+            receivers[receiver]["duplicates"] += result.duplicate_counts.get(
+                message_id, 0
+            )
+
+    messages = max(len(store), 1)
+    return {
+        "folder": str(session.folder),
+        "nodes": {
+            str(node_id): implementations.get(node_id, UNKNOWN_IMPLEMENTATION)
+            for node_id in sorted(session.node_id_to_peer_id)
+        },
+        "receivers": {
+            name: {
+                "nodes": stats["nodes"],
+                "deliveries": len(stats["latencies"]),
+                "latency": _latency_stats(stats["latencies"]),
+                "avg_duplicates": stats["duplicates"] / (stats["nodes"] * messages),
+            }
+            for name, stats in sorted(receivers.items())
+        },
+        "pairs": {
+            f"{sender}->{receiver}": {
+                "sender": sender,
+                "receiver": receiver,
+                "first_deliveries": stats["first"],
+                "receptions": stats["receptions"],
+                "duplicates": stats["receptions"] - stats["first"],
+                "duplicate_ratio": (
+                    (stats["receptions"] - stats["first"]) / stats["receptions"]
+                    if stats["receptions"]
+                    else None
+                ),
+                "latency": _latency_stats(stats["latencies"]),
+                "hop_delay": _latency_stats(stats["hop_delays"]),
+            }
+            for (sender, receiver), stats in sorted(pairs.items())
+        },
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Render the per-receiver stats and the sender x receiver hop delay matrix."""
+    lines = ["Receiving implementation: nodes, mean/p99 latency, avg duplicates"]
+    for name, stats in summary["receivers"].items():
+        latency = stats["latency"]
+        if latency:
+            lines.append(
+                f"  {name}: {stats['nodes']} nodes, {latency['mean']:.3f}s / "
+                f"{latency['p99']:.3f}s, {stats['avg_duplicates']:.2f}"
+            )
+        else:
+            lines.append(f"  {name}: {stats['nodes']} nodes, no deliveries")
+
+    names = sorted(
+        {p["sender"] for p in summary["pairs"].values()}
+        | {p["receiver"] for p in summary["pairs"].values()}
+    )
+    lines.append(
+        "Mean hop delay (ms) / duplicate ratio, sender rows x receiver columns"
+    )
+    lines.append(" " * 10 + "".join(f"{name:>18}" for name in names))
+    for sender in names:
+        row = f"{sender:<10}"
+        for receiver in names:
+            pair = summary["pairs"].get(f"{sender}->{receiver}")
+            if not pair or not pair["hop_delay"]:
+                row += f"{'-':>18}"
+                continue
+            ratio = pair["duplicate_ratio"] or 0.0
+            row += f"{pair['hop_delay']['mean'] * 1e3:>11.1f} / {ratio:.2f}"
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report delivery latency and duplicates per implementation pair"
+    )
+    add_report_arguments(parser, "implementations.json")
+    args = parser.parse_args()
+
+    session = AnalysisSession(args.folder, args.jobs)
+    summary = implementation_summary(session, args.skip)
+
+    write_json_report(args, "implementations.json", summary)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
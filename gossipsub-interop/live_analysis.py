@@ -0,0 +1,281 @@
+"""
+Live analysis of a Shadow output directory while the simulation is running.
+
+Tails every host stdout log as Shadow writes it and keeps per-message reach
+and latency statistics up to date, so bad runs can be spotted (and aborted)
+long before the simulation finishes.
+"""
+
+import bisect
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from log_ingest import (
+    LOG_EVENT_MARKERS,
+    LogFileParser,
+    iter_marked_lines,
+    json_loads,
+    log_node_id,
+    timestamp_to_ns,
+)
+
+# Shadow starts every simulation at 2000-01-01T00:00:00Z
+SHADOW_START_NS = 946_684_800 * 1_000_000_000
+
+
+@dataclass
+class LiveMessageStats:
+    # Sorted first delivery times (ns), one per node that received the message
+    delivery_times_ns: List[int] = field(default_factory=list)
+    # Nodes the message was delivered to, where known
+    nodes: Set[int] = field(default_factory=set)
+    duplicates: int = 0
+
+    def latency_ns(self, quantile: float) -> int:
+        """Time from the first delivery until `quantile` of the receivers had the message."""
+        times = self.delivery_times_ns
+        index = min(int(quantile * len(times)), len(times) - 1)
+        return times[index] - times[0]
+
+
+class LiveDeliveryStats:
+    """Per-message reach and latency, updated one delivery at a time."""
+
+    def __init__(self):
+        self.messages: Dict[str, LiveMessageStats] = {}
+        self.nodes = set()
+        self.latest_ns = 0
+
+    def add_node(self, node_id: int):
+        self.nodes.add(node_id)
+
+    def add_delivery(
+        self, message_id: str, timestamp_ns: int, node_id: Optional[int] = None
+    ):
+        stats = self.messages.setdefault(message_id, LiveMessageStats())
+        bisect.insort(stats.delivery_times_ns, timestamp_ns)
+        if node_id is not None:
+            stats.nodes.add(node_id)
+        self.latest_ns = max(self.latest_ns, timestamp_ns)
+
+    def add_duplicates(self, message_id: str, count: int):
+        self.messages.setdefault(message_id, LiveMessageStats()).duplicates += count
+
+    def reach(self, message_id: str) -> float:
+        # Minus 1 for the original sender, which may also receive a duplicate
+        receivers = max(len(self.nodes) - 1, 1)
+        stats = self.messages[message_id]
+        return min(len(stats.delivery_times_ns) / receivers, 1.0)
+
+    def ordered_message_ids(self) -> List[str]:
+        """Message IDs ordered by first delivery, ignoring duplicate-only messages."""
+        delivered = [
+            (stats.delivery_times_ns[0], message_id)
+            for message_id, stats in self.messages.items()
+            if stats.delivery_times_ns
+        ]
+        return [message_id for _, message_id in sorted(delivered)]
+
+    def summary(self, last_messages: int = 5) -> str:
+        """Render a short summary of the run so far and the most recent messages."""
+        message_ids = self.ordered_message_ids()
+        latest = datetime.fromtimestamp(self.latest_ns / 1e9, tz=timezone.utc)
+        lines = [
+            (
+                f"[live] nodes {len(self.nodes)}, messages {len(message_ids)}, "
+                f"latest delivery at {latest:%H:%M:%S} simulated"
+            )
+        ]
+        node_count = max(len(self.nodes), 1)
+        for message_id in message_ids[-last_messages:]:
+            stats = self.messages[message_id]
+            lines.append(
+                f"  {message_id}: reach {self.reach(message_id):.1%}, "
+                f"p50 {stats.latency_ns(0.5) / 1e9:.3f}s, "
+                f"p99 {stats.latency_ns(0.99) / 1e9:.3f}s, "
+                f"avg duplicates {stats.duplicates / node_count:.2f}"
+            )
+        return "\n".join(lines)
+
+    def propagation_complete(
+        self,
+        expected_receivers: Dict[str, int],
+        min_reach: float = 1.0,
+        publishers: Optional[Dict[str, int]] = None,
+    ) -> bool:
+        """
+        Whether every expected message reached `min_reach` of its receivers.
+
+        Args:
+            expected_receivers: Dictionary mapping message ID to the number of
+                nodes, excluding its publisher, expected to receive it
+            min_reach: Fraction of the expected receivers that must have it
+            publishers: Dictionary mapping message ID to the node ID of its
+                publisher. A copy the publisher logs receiving does not count
+                towards the receivers.
+        """
+        publishers = publishers or {}
+        for message_id, receivers in expected_receivers.items():
+            stats = self.messages.get(message_id)
+            delivered = 0
+            if stats:
+                delivered = len(stats.delivery_times_ns)
+                if publishers.get(message_id) in stats.nodes:
+                    delivered -= 1
+            if delivered < receivers * min_reach:
+                return False
+        return True
+
+
+class _TailedLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.partial_line = b""
+        self.parser = LogFileParser(path)
+        # Parser state already forwarded to the live stats
+        self.reported_deliveries = 0
+        self.reported_duplicates: Dict[str, int] = {}
+        self.reported_node = False
+
+
+class LogFollower:
+    """
+    Tails the host stdout logs of a (possibly still running) Shadow simulation.
+
+    Each call to poll() reads what was appended to every log since the previous
+    call, parses only complete lines, and folds new events into `stats`.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.stats = LiveDeliveryStats()
+        # Latest timestamp of any log line, i.e. how far the simulation has got
+        self.latest_log_ns = 0
+        self._logs: Dict[str, _TailedLog] = {}
+
+    def _discover(self):
+        hosts_dir = os.path.join(self.folder, "hosts")
+        try:
+            hosts = os.listdir(hosts_dir)
+        except FileNotFoundError:
+            # Shadow has not started any host yet
+            return
+        for host in hosts:
+            try:
+                files = os.listdir(os.path.join(hosts_dir, host))
+            except FileNotFoundError:
+                continue
+            for file in files:
+                path = os.path.join(hosts_dir, host, file)
+                if file.endswith(".stdout") and path not in self._logs:
+                    self._logs[path] = _TailedLog(path)
+
+    def poll(self) -> int:
+        """
+        Read and parse everything appended to the logs since the last poll.
+
+        Returns:
+            Number of new bytes read
+        """
+        self._discover()
+        read = 0
+        for log in self._logs.values():
+            try:
+                if os.path.getsize(log.path) <= log.offset:
+                    continue
+                with open(log.path, "rb") as f:
+                    f.seek(log.offset)
+                    chunk = f.read()
+            except FileNotFoundError:
+                continue
+            log.offset += len(chunk)
+            read += len(chunk)
+
+            # Only parse complete lines, keep the rest for the next poll
+            data = log.partial_line + chunk
+            end = data.rfind(b"\n") + 1
+            log.partial_line = data[end:]
+            for line in iter_marked_lines(data[:end], LOG_EVENT_MARKERS):
+                log.parser.feed(line)
+            self._report(log)
+            if end:
+                self._observe_time(data[data.rfind(b"\n", 0, end - 1) + 1 : end])
+        self.latest_log_ns = max(self.latest_log_ns, self.stats.latest_ns)
+        return read
+
+    def _observe_time(self, line: bytes):
+        try:
+            timestamp_ns = timestamp_to_ns(json_loads(line)["time"])
+        except (ValueError, TypeError, KeyError, IndexError):
+            return
+        self.latest_log_ns = max(self.latest_log_ns, timestamp_ns)
+
+    def _report(self, log: _TailedLog):
+        result = log.parser.result
+        if result.peer_id is not None and not log.reported_node:
+            self.stats.add_node(result.node_id.id)
+            log.reported_node = True
+
+        node_id = log_node_id(result)
+        for message_id, timestamp_ns in zip(
+            result.message_ids[log.reported_deliveries :],
+            result.timestamps_ns[log.reported_deliveries :],
+        ):
+            self.stats.add_delivery(message_id, timestamp_ns, node_id)
+        log.reported_deliveries = len(result.message_ids)
+
+        for message_id, count in result.duplicate_counts.items():
+            new = count - log.reported_duplicates.get(message_id, 0)
+            if new:
+                self.stats.add_duplicates(message_id, new)
+                log.reported_duplicates[message_id] = count
+
+
+def follow(
+    folder,
+    interval: float = 5.0,
+    idle_timeout: Optional[float] = 60.0,
+    should_stop: Callable[[LogFollower], bool] = lambda follower: False,
+    verbose: bool = True,
+) -> LogFollower:
+    """
+    Follow the logs of a Shadow output directory, printing a rolling summary.
+
+    Args:
+        folder: Shadow output directory, which may not exist yet
+        interval: Seconds between polls and printed summaries
+        idle_timeout: Stop after this many seconds without new log output.
+            None follows until should_stop returns True.
+        should_stop: Called after every poll; following stops when it returns True
+        verbose: Print the rolling summary after every poll with new output
+
+    Returns:
+        The LogFollower, holding the final statistics
+    """
+    follower = LogFollower(folder)
+    last_output = time.monotonic()
+    try:
+        while True:
+            if follower.poll():
+                last_output = time.monotonic()
+                if verbose:
+                    print(follower.stats.summary(), flush=True)
+            if should_stop(follower):
+                break
+            if (
+                idle_timeout is not None
+                and time.monotonic() - last_output > idle_timeout
+            ):
+                print(f"[live] no new log output for {idle_timeout}s, stopping")
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    # Pick up whatever was written since the last poll
+    follower.poll()
+    print(follower.stats.summary(), flush=True)
+    return follower
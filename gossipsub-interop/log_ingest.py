@@ -0,0 +1,605 @@
+"""
+Parsing of node stdout logs from Shadow output directories.
+
+This module is shared by the analyzer and the checks, and deliberately avoids
+importing any plotting dependencies.
+"""
+
+import fnmatch
+import json
+import mmap
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+try:
+    # orjson is optional. Its JSONDecodeError subclasses json.JSONDecodeError.
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Control messages logged by the go-libp2p tracer as "Sent <kind>" and
+# "Received <kind>" events. Ihave, Iwant and Idontwant carry message IDs.
+CONTROL_EVENTS = ("Graft", "Prune", "Ihave", "Iwant", "Idontwant")
+
+# Only lines containing one of these substrings can hold an event the analysis
+# uses. Everything else (debug output) is skipped unparsed.
+LOG_EVENT_MARKERS = (
+    b"PeerID",
+    b"Received Message",
+    b"All parts received",
+    # Partial message publishes and receptions, see PARTIAL_PUBLISH_EVENTS
+    b"artial message",
+    b"Partial called",
+    b"Received partial RPC",
+)
+# Sent messages and control events make up most of the event lines of a log,
+# so they are only decoded when parsing with control=True, for the analyses
+# that use them (control plane, bandwidth, throughput and the event database).
+CONTROL_EVENT_MARKERS = (b"Sent Message",) + tuple(
+    kind.encode() for kind in CONTROL_EVENTS
+)
+
+# Publish of a partial message group by go-libp2p and rust-libp2p
+PARTIAL_PUBLISH_EVENTS = ("publishing partial message", "Publish Partial called")
+# rust-libp2p logs partial message receptions with the group in the message
+RUST_PARTIAL_RECEIVED_PREFIX = "Received partial message for topic "
+
+# Parsed results are cached in the output directory, keyed by each log file's
+# relative path, size and mtime. Bump CACHE_VERSION whenever FileParseResult
+# or the parsing logic changes.
+CACHE_FILE_NAME = "parsed_logs.cache"
+CACHE_VERSION = 9
+
+# Files the tooling writes into an output directory, never yielded as logs of
+# a folder without a hosts/ subfolder: the parse cache and its temporary
+# files, the event database, run and experiment metadata, and the reports
+NON_LOG_FILES = (
+    f"{CACHE_FILE_NAME}*",
+    "events.sqlite*",
+    "run_stats.json",
+    "params.json",
+    "shadow.yaml",
+    "graph.gml",
+    "*.json",
+    "*.csv",
+    "*.png",
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class NodeId:
+    id: int
+
+
+@dataclass
+class FileParseResult:
+    node_id: NodeId
+    # First delivery of each message to this node, in log order
+    message_ids: List[str] = field(default_factory=list)
+    timestamps_ns: List[int] = field(default_factory=list)
+    # Peer each first delivery was received from ("" if not logged)
+    delivered_from: List[str] = field(default_factory=list)
+    duplicate_counts: Dict[str, int] = field(default_factory=dict)
+    # Every duplicate reception in log order: time, message and sending peer
+    duplicate_times_ns: List[int] = field(default_factory=list)
+    duplicate_message_ids: List[str] = field(default_factory=list)
+    duplicate_from: List[str] = field(default_factory=list)
+    peer_id: Optional[str] = None
+    # Number of "All parts received" events (partial message scenarios)
+    all_parts_received: int = 0
+    # First completion and first publish time of each partial message group
+    partial_completed_ns: Dict[int, int] = field(default_factory=dict)
+    partial_published_ns: Dict[int, int] = field(default_factory=dict)
+    # Time of every partial message RPC received, per group
+    partial_rpc_times_ns: Dict[int, List[int]] = field(default_factory=dict)
+    # Number of receptions (first and duplicate) of each message from each peer
+    received_from: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # Time of every full message this node sent to a peer
+    sent_message_times_ns: List[int] = field(default_factory=list)
+    # Number of times this node sent each message to a peer
+    sent_message_counts: Dict[str, int] = field(default_factory=dict)
+    # Whether sent messages and control events were parsed (control=True),
+    # the fields above and below are empty otherwise
+    control: bool = False
+    # Time of every control event, keyed by event name (e.g. "Sent Ihave")
+    control_times_ns: Dict[str, List[int]] = field(default_factory=dict)
+    # Number of times each message ID was carried by each control event name
+    control_message_ids: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # First time this node sent an IWANT for each message ID
+    iwant_sent_ns: Dict[str, int] = field(default_factory=dict)
+    # Path of the log file this result was parsed from
+    path: str = ""
+
+
+def logfile_iterator(folder):
+    """
+    Returns a list of all the log files in the folder.
+
+    Special case for shadow data folders by identifying the "hosts" subfolder.
+
+    Otherwise, returns a list of all the files in the folder, except the ones
+    matching NON_LOG_FILES.
+    """
+    files = os.listdir(folder)
+    if "hosts" in files:
+        for host in os.listdir(os.path.join(folder, "hosts")):
+            for file in os.listdir(os.path.join(folder, "hosts", host)):
+                if file.endswith(".stdout"):
+                    yield os.path.join(folder, "hosts", host, file)
+    else:
+        for file in files:
+            path = os.path.join(folder, file)
+            if os.path.isfile(path) and not any(
+                fnmatch.fnmatch(file, pattern) for pattern in NON_LOG_FILES
+            ):
+                yield path
+
+
+def iter_marked_lines(data, markers=LOG_EVENT_MARKERS) -> Iterator[bytes]:
+    """
+    Yield, in file order, every line of data that contains one of the markers.
+
+    Searching for the markers with bytes.find lets us jump over irrelevant lines
+    without splitting or decoding them, which dominates the cost of parsing
+    debug level logs.
+
+    Args:
+        data: bytes-like log contents supporting find/rfind (bytes or mmap)
+        markers: Byte substrings identifying interesting lines
+
+    Returns:
+        Iterator of raw lines, without the trailing newline
+    """
+    next_hits = {marker: data.find(marker) for marker in markers}
+    while True:
+        hits = [hit for hit in next_hits.values() if hit >= 0]
+        if not hits:
+            return
+        hit = min(hits)
+        start = data.rfind(b"\n", 0, hit) + 1
+        end = data.find(b"\n", hit)
+        if end < 0:
+            end = len(data)
+        yield data[start:end]
+
+        # Several markers may match the same line, so look for the next
+        # occurrence of any marker found before the end of this one.
+        for marker, marker_hit in next_hits.items():
+            if 0 <= marker_hit <= end:
+                next_hits[marker] = data.find(marker, end + 1)
+
+
+def _parse_timestamp_ns(timestamp: str) -> int:
+    """Convert any ISO-8601 timestamp to nanoseconds since the epoch, assuming UTC if naive."""
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - EPOCH) // timedelta(microseconds=1) * 1_000
+
+
+class TimestampDecoder:
+    """
+    Decodes RFC 3339 log timestamps to integer nanoseconds since the epoch.
+
+    All implementations log "YYYY-MM-DDTHH:MM:SS[.fraction](Z|+HH:MM)" with a
+    fraction of up to nanosecond precision. Within a run the date, hour, minute,
+    second and offset only change once a second, so the epoch time of that
+    prefix is cached and only the fraction is parsed for each timestamp. Any
+    other format falls back to datetime.fromisoformat, which truncates to
+    microseconds.
+    """
+
+    # Bound the cache in case of very long runs. One entry per simulated second.
+    MAX_CACHED_PREFIXES = 1 << 16
+
+    def __init__(self):
+        self._prefix_ns: Dict[str, int] = {}
+
+    def __call__(self, timestamp: str) -> int:
+        if timestamp[-1:] == "Z":
+            fraction_end = len(timestamp) - 1
+        elif timestamp[-6:-5] in ("+", "-") and timestamp[-3:-2] == ":":
+            fraction_end = len(timestamp) - 6
+        else:
+            return _parse_timestamp_ns(timestamp)
+
+        if fraction_end > 19 and timestamp[19] != ".":
+            return _parse_timestamp_ns(timestamp)
+
+        # Whole seconds and offset, e.g. "2000-01-01T00:02:00+00:00"
+        prefix = timestamp[:19] + timestamp[fraction_end:]
+        prefix_ns = self._prefix_ns.get(prefix)
+        if prefix_ns is None:
+            if len(self._prefix_ns) >= self.MAX_CACHED_PREFIXES:
+                self._prefix_ns.clear()
+            prefix_ns = self._prefix_ns[prefix] = _parse_timestamp_ns(prefix)
+
+        fraction = timestamp[20:fraction_end]
+        if not fraction:
+            return prefix_ns
+        if not fraction.isdigit():
+            return _parse_timestamp_ns(timestamp)
+        # Pad or truncate the fraction to nanoseconds
+        return prefix_ns + int(fraction[:9].ljust(9, "0"))
+
+
+timestamp_to_ns = TimestampDecoder()
+
+
+class LogFileParser:
+    """
+    Incrementally parses the lines of one log file into a FileParseResult.
+
+    Lines can be fed as they are written, which lets the live analysis follow
+    logs of a running simulation.
+    """
+
+    def __init__(self, path: str = "", control: bool = False):
+        self.result = FileParseResult(node_id=NodeId(-1), path=path, control=control)
+        self._seen_message_ids = set()
+        # Group of the last partial message received, for completions that
+        # do not log their group
+        self._last_partial_group: Optional[int] = None
+
+    def feed(self, line):
+        """Parse one log line (str or bytes). Lines that are not events are ignored."""
+        try:
+            parsed = json_loads(line)
+        except json.JSONDecodeError:
+            return
+
+        if "msg" not in parsed:
+            return
+
+        msg_type = parsed["msg"]
+        result = self.result
+
+        if msg_type == "PeerID":
+            result.peer_id = parsed.get("id", "")
+            # Some implementations log the node ID as a string
+            try:
+                result.node_id = NodeId(int(parsed.get("node_id", "")))
+            except ValueError:
+                result.node_id = NodeId(-1)
+            return
+
+        if msg_type == "All parts received":
+            result.all_parts_received += 1
+            group = parse_group_id(parsed.get("group id", parsed.get("group_id")))
+            if group is None:
+                group = self._last_partial_group
+            if group is not None and "time" in parsed:
+                result.partial_completed_ns.setdefault(
+                    group, timestamp_to_ns(parsed["time"])
+                )
+            return
+
+        if "time" in parsed and self._feed_partial(msg_type, parsed):
+            return
+
+        if msg_type == "Sent Message" and "time" in parsed and result.control:
+            result.sent_message_times_ns.append(timestamp_to_ns(parsed["time"]))
+            message_id = parsed.get("id", "")
+            if message_id:
+                result.sent_message_counts[message_id] = (
+                    result.sent_message_counts.get(message_id, 0) + 1
+                )
+            return
+
+        direction, _, kind = msg_type.partition(" ")
+        if (
+            kind in CONTROL_EVENTS
+            and direction in ("Sent", "Received")
+            and "time" in parsed
+        ):
+            if not result.control:
+                return
+            self._feed_control(msg_type, parsed)
+            return
+
+        if msg_type == "Received Message" and "time" in parsed:
+            message_id = parsed.get("id", "")
+            if message_id:
+                senders = result.received_from.setdefault(message_id, {})
+                sender = parsed.get("from", "")
+                senders[sender] = senders.get(sender, 0) + 1
+                if message_id not in self._seen_message_ids:
+                    self._seen_message_ids.add(message_id)
+                    result.message_ids.append(message_id)
+                    result.timestamps_ns.append(timestamp_to_ns(parsed["time"]))
+                    result.delivered_from.append(sender)
+                else:
+                    result.duplicate_counts[message_id] = (
+                        result.duplicate_counts.get(message_id, 0) + 1
+                    )
+                    result.duplicate_times_ns.append(timestamp_to_ns(parsed["time"]))
+                    result.duplicate_message_ids.append(message_id)
+                    result.duplicate_from.append(sender)
+
+    def _feed_partial(self, msg_type: str, parsed: dict) -> bool:
+        """Record partial message publishes and receptions. True if it was one."""
+        result = self.result
+        if msg_type in PARTIAL_PUBLISH_EVENTS:
+            group = parse_group_id(parsed.get("groupID", parsed.get("group_id")))
+            if group is not None:
+                result.partial_published_ns.setdefault(
+                    group, timestamp_to_ns(parsed["time"])
+                )
+            return True
+
+        if msg_type == "Received partial RPC":
+            group = parse_group_id(parsed.get("groupID"))
+        elif msg_type.startswith(RUST_PARTIAL_RECEIVED_PREFIX):
+            group = parse_group_id(msg_type.rpartition(" and group ")[2])
+        else:
+            return False
+        if group is not None:
+            self._last_partial_group = group
+            result.partial_rpc_times_ns.setdefault(group, []).append(
+                timestamp_to_ns(parsed["time"])
+            )
+        return True
+
+    def _feed_control(self, event: str, parsed: dict):
+        result = self.result
+        timestamp_ns = timestamp_to_ns(parsed["time"])
+        result.control_times_ns.setdefault(event, []).append(timestamp_ns)
+
+        message_ids = parse_message_id_list(parsed.get("ids", ""))
+        if not message_ids:
+            return
+        counts = result.control_message_ids.setdefault(event, {})
+        for message_id in message_ids:
+            counts[message_id] = counts.get(message_id, 0) + 1
+        if event == "Sent Iwant":
+            for message_id in message_ids:
+                result.iwant_sent_ns.setdefault(message_id, timestamp_ns)
+
+
+def log_node_id(result: FileParseResult) -> Optional[int]:
+    """
+    Node ID of a parsed log file.
+
+    This is the node_id logged with the PeerID. If the log has no PeerID, it is
+    the N of the nodeN host directory Shadow wrote the log to.
+
+    Returns:
+        The node ID, None if neither is known
+    """
+    if result.node_id.id >= 0:
+        return result.node_id.id
+    host = os.path.basename(os.path.dirname(result.path))
+    match = re.fullmatch(r"node(\d+)", host)
+    return int(match.group(1)) if match else None
+
+
+def parse_message_id_list(ids: str) -> List[str]:
+    """Split a tracer message ID list such as "[1, 2]" into its IDs."""
+    ids = ids.strip().strip("[]")
+    return [message_id.strip() for message_id in ids.split(",") if message_id.strip()]
+
+
+def parse_group_id(value) -> Optional[int]:
+    """
+    Parse a partial message group ID as logged by the implementations.
+
+    go-libp2p logs it as an integer or a hex string of its 8 big-endian
+    bytes, rust-libp2p as the list of those bytes, e.g. "[0, 0, 0, 0, 0, 0, 0, 5]".
+    """
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        if value.startswith("["):
+            group_bytes = [int(b) for b in value.strip("[]").split(",") if b.strip()]
+            return int.from_bytes(bytes(group_bytes), "big") if group_bytes else None
+        return int(value, 16)
+    except ValueError:
+        return None
+
+
+def parse_log_file(lines, control: bool = False) -> FileParseResult:
+    """
+    Parse all lines from a log file iterator and extract relevant information.
+
+    Args:
+        lines: Iterator of log lines (str or bytes) from a file
+        control: Also parse sent messages and control events
+
+    Returns:
+        FileParseResult containing parsed data from the file
+    """
+    parser = LogFileParser(control=control)
+    for line in lines:
+        parser.feed(line)
+    return parser.result
+
+
+def parse_log_path(path: str, control: bool = False) -> FileParseResult:
+    """
+    Open and parse a single log file.
+
+    The file is memory mapped and only lines containing LOG_EVENT_MARKERS (and
+    CONTROL_EVENT_MARKERS with control) are decoded. This is a module level
+    function so it can be sent to worker processes.
+    """
+    markers = (
+        LOG_EVENT_MARKERS + CONTROL_EVENT_MARKERS if control else LOG_EVENT_MARKERS
+    )
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            result = parse_log_file([], control)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                result = parse_log_file(iter_marked_lines(data, markers), control)
+    result.path = path
+    return result
+
+
+def log_peer_id(path: str) -> Optional[str]:
+    """
+    PeerID logged in a log file, None if it has none.
+
+    Only the lines up to the PeerID are decoded, so this is much cheaper than
+    parsing the file when the PeerID is logged first, as it usually is.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            parser = LogFileParser(path)
+            for line in iter_marked_lines(data, (b"PeerID",)):
+                parser.feed(line)
+                if parser.result.peer_id is not None:
+                    return parser.result.peer_id
+    return None
+
+
+def _parse_log_paths(
+    paths: List[str], jobs: int, control: bool = False
+) -> Iterator[FileParseResult]:
+    """Parse the given files in order, spread across `jobs` worker processes."""
+    parse = partial(parse_log_path, control=control)
+    if jobs <= 1 or len(paths) <= 1:
+        yield from map(parse, paths)
+        return
+
+    # Hand out several files per task to amortize the IPC overhead, while
+    # leaving enough tasks to balance uneven log sizes across workers.
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        yield from pool.map(parse, paths, chunksize=chunksize)
+
+
+def _file_cache_key(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def log_file_keys(folder) -> Dict[str, Tuple[int, int]]:
+    """Dictionary mapping each log path (relative to folder) to its (size, mtime) key."""
+    return {
+        os.path.relpath(path, folder): _file_cache_key(path)
+        for path in logfile_iterator(folder)
+    }
+
+
+def load_parse_cache(folder) -> Dict[str, Tuple[Tuple[int, int], FileParseResult]]:
+    """
+    Load the parsed log cache of an output directory.
+
+    Returns:
+        Dictionary mapping log path (relative to folder) to the (size, mtime)
+        key the file had when parsed and its FileParseResult. Empty if there is
+        no usable cache.
+    """
+    try:
+        with open(os.path.join(folder, CACHE_FILE_NAME), "rb") as f:
+            version, entries = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+    if version != CACHE_VERSION:
+        return {}
+    return entries
+
+
+def save_parse_cache(
+    folder, entries: Dict[str, Tuple[Tuple[int, int], FileParseResult]]
+):
+    """Atomically write the parsed log cache of an output directory."""
+    cache_path = os.path.join(folder, CACHE_FILE_NAME)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((CACHE_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write parsed log cache {cache_path}: {e}")
+
+
+def load_cached_results(folder) -> Dict[str, FileParseResult]:
+    """
+    Return the cached results that are still valid, without parsing anything.
+
+    Returns:
+        Dictionary mapping log path (as yielded by logfile_iterator) to its
+        cached FileParseResult, for every log file unchanged since it was cached
+    """
+    entries = load_parse_cache(folder)
+    fresh = {}
+    for path in logfile_iterator(folder):
+        entry = entries.get(os.path.relpath(path, folder))
+        if entry is not None and entry[0] == _file_cache_key(path):
+            entry[1].path = path
+            fresh[path] = entry[1]
+    return fresh
+
+
+def parse_log_files(
+    folder, jobs: int = 1, use_cache: bool = True, control: bool = False
+) -> Iterator[FileParseResult]:
+    """
+    Parse every log file in the folder, optionally spread across a process pool.
+
+    Results are yielded in logfile_iterator order regardless of the number of
+    jobs, so merging them gives the same output as parsing serially.
+
+    When use_cache is set, files unchanged since the last parse are loaded from
+    the cache in the folder, and the cache is updated with any re-parsed files.
+    A cached result parsed with control also serves requests without it, the
+    other way around the file is parsed again.
+
+    Args:
+        folder: Folder containing log files
+        jobs: Number of worker processes. 1 parses in the current process and
+            0 uses one worker per CPU.
+        use_cache: Whether to read and update the parsed log cache
+        control: Also parse sent messages and control events
+
+    Returns:
+        Iterator of FileParseResult, one per log file
+    """
+    files = list(logfile_iterator(folder))
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if not use_cache:
+        yield from _parse_log_paths(files, jobs, control)
+        return
+
+    entries = load_parse_cache(folder)
+    keys = {path: _file_cache_key(path) for path in files}
+    relpaths = {path: os.path.relpath(path, folder) for path in files}
+    stale = [
+        path
+        for path in files
+        if entries.get(relpaths[path], (None,))[0] != keys[path]
+        or (control and not entries[relpaths[path]][1].control)
+    ]
+    parsed = dict(zip(stale, _parse_log_paths(stale, jobs, control)))
+
+    # Rebuild the entries so logs that no longer exist are dropped
+    updated = {}
+    for path in files:
+        if path in parsed:
+            result = parsed[path]
+        else:
+            result = entries[relpaths[path]][1]
+            result.path = path
+        updated[relpaths[path]] = (keys[path], result)
+    if stale or len(updated) != len(entries):
+        save_parse_cache(folder, updated)
+
+    for path in files:
+        yield updated[relpaths[path]][1]
@@ -0,0 +1,269 @@
+"""
+Assembly latency of the partial messages of a Shadow run.
+
+For the partial message scenarios every node logs "All parts received" once it
+holds all the parts of a group. This module measures the time from the
+group's PublishPartial in params.json to each node's completion, the order in
+which nodes complete relative to how many hops they are from the parts they
+lack (along the Connect links of the script, e.g. the chain scenario), and the
+partial message RPCs each group took.
+"""
+
+import argparse
+import os
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+import experiment
+from analysis_session import AnalysisSession, add_report_arguments, write_json_report
+from live_analysis import SHADOW_START_NS
+
+PARTIAL_PERCENTILES = (50, 90, 99)
+# Parts of a group, one bit each in the AddPartialMessage bitmap
+PARTS_PER_GROUP = 8
+
+
+def _percentiles(values_ns: List[int]) -> Dict[str, float]:
+    if not values_ns:
+        return {}
+    values = np.sort(np.asarray(values_ns, dtype=np.int64))
+    quantiles = np.array(PARTIAL_PERCENTILES) / 100
+    positions = np.minimum((quantiles * len(values)).astype(np.int64), len(values) - 1)
+    stats = {
+        f"p{p}": float(value / 1e9)
+        for p, value in zip(PARTIAL_PERCENTILES, values[positions])
+    }
+    stats["max"] = float(values[-1] / 1e9)
+    return stats
+
+
+def _distances(links: Dict[int, Set[int]], sources: Iterable[int]) -> Dict[int, int]:
+    """Hops from the nearest source to every node reachable from them."""
+    distances = {source: 0 for source in sources}
+    queue = deque(distances)
+    while queue:
+        node = queue.popleft()
+        for peer in links.get(node, ()):
+            if peer not in distances:
+                distances[peer] = distances[node] + 1
+                queue.append(peer)
+    return distances
+
+
+def required_hops(
+    parts: Dict[int, int], links: Dict[int, Set[int]], nodes: Iterable[int]
+) -> Dict[int, int]:
+    """
+    Hops each node is from the farthest part it has to fetch.
+
+    For every part held by some node, a node needs at least as many hops as
+    separate it from the nearest holder of that part, so the maximum over the
+    parts bounds how early it can complete.
+
+    Args:
+        parts: Parts bitmap given to each node
+        links: Connections between nodes
+        nodes: Nodes to compute the hops of
+
+    Returns:
+        Dictionary mapping node ID to hops, nodes that cannot reach every part
+        are left out
+    """
+    per_part = []
+    for bit in range(PARTS_PER_GROUP):
+        holders = [node for node, bits in parts.items() if bits & (1 << bit)]
+        if holders:
+            per_part.append(_distances(links, holders))
+    hops = {}
+    for node in nodes:
+        distances = [d.get(node) for d in per_part]
+        if per_part and None not in distances:
+            hops[node] = max(distances)
+    return hops
+
+
+def _rank_correlation(x: List[float], y: List[float]) -> Optional[float]:
+    """Spearman rank correlation, ties get the mean of their ranks."""
+    if len(x) < 2:
+        return None
+
+    def ranks(values):
+        _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+        return (np.cumsum(counts) - (counts - 1) / 2)[inverse]
+
+    rx, ry = ranks(np.asarray(x)), ranks(np.asarray(y))
+    if rx.std() == 0 or ry.std() == 0:
+        return None
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+
+def partial_summary(session: AnalysisSession) -> dict:
+    """
+    Build the partial message report of a run, as written to partial_messages.json.
+
+    Without params.json the groups, their publish instant (the earliest logged
+    publish) and the expected nodes (every node) come from the logs only, and
+    hop counts are not available. Nodes that hold every part before the
+    publish (e.g. the fanout publisher) count as "initial" and are left out of
+    the latencies.
+
+    Args:
+        session: Session of the Shadow output directory
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    results = session.file_results
+    completed = defaultdict(dict)
+    published_ns: Dict[int, int] = {}
+    rpc_times = defaultdict(dict)
+    for result in results:
+        node_id = result.node_id.id
+        for group, timestamp_ns in result.partial_completed_ns.items():
+            completed[group][node_id] = timestamp_ns
+        for group, timestamp_ns in result.partial_published_ns.items():
+            published_ns[group] = min(
+                published_ns.get(group, timestamp_ns), timestamp_ns
+            )
+        for group, times in result.partial_rpc_times_ns.items():
+            rpc_times[group][node_id] = times
+
+    expected = {}
+    links: Dict[int, Set[int]] = {}
+    params_path = f"{session.folder}/params.json"
+    if os.path.exists(params_path):
+        params = experiment.load_params(params_path)
+        expected = {
+            group.group_id: group
+            for group in experiment.expected_partial_groups(params, session.total_nodes)
+        }
+        links = experiment.connections(params, session.total_nodes)
+    all_nodes = {result.node_id.id for result in results}
+
+    groups = {}
+    all_latencies = []
+    latency_by_hops = defaultdict(list)
+    for group in sorted(set(expected) | set(completed) | set(published_ns)):
+        if group in expected:
+            publish_ns = (
+                SHADOW_START_NS + expected[group].publish_seconds * 1_000_000_000
+            )
+            nodes = set(expected[group].subscribers) or all_nodes
+            hops = required_hops(expected[group].parts, links, nodes) if links else {}
+        else:
+            publish_ns = published_ns.get(group)
+            nodes = all_nodes
+            hops = {}
+        completions = completed.get(group, {})
+        if publish_ns is None:
+            publish_ns = min(completions.values())
+
+        initial = {n for n, t in completions.items() if t <= publish_ns}
+        latencies = {
+            n: t - publish_ns for n, t in completions.items() if n not in initial
+        }
+        all_latencies.extend(latencies.values())
+        order = sorted(latencies, key=lambda n: latencies[n])
+        for node in order:
+            if node in hops:
+                latency_by_hops[hops[node]].append(latencies[node] / 1e9)
+
+        rpcs = rpc_times.get(group, {})
+        received = sum(len(times) for times in rpcs.values())
+        after_complete = sum(
+            sum(1 for t in times if node in completions and t > completions[node])
+            for node, times in rpcs.items()
+        )
+        with_hops = [n for n in order if n in hops]
+        groups[str(group)] = {
+            "publish": (publish_ns - SHADOW_START_NS) / 1e9,
+            "expected_nodes": len(nodes),
+            "completed": len(completions),
+            "initial": len(initial),
+            "missing": sorted(nodes - set(completions)),
+            "latency": _percentiles(list(latencies.values())),
+            "completion_order": order,
+            "hops": {str(n): hops[n] for n in sorted(hops)},
+            "hops_latency_correlation": _rank_correlation(
+                [hops[n] for n in with_hops], [latencies[n] for n in with_hops]
+            ),
+            "rpcs_received": received,
+            "rpcs_after_complete": after_complete,
+            "rpcs_per_completion": received / len(latencies) if latencies else None,
+        }
+
+    return {
+        "folder": str(session.folder),
+        "run": {
+            "groups": len(groups),
+            "incomplete_groups": sum(1 for g in groups.values() if g["missing"]),
+            "latency": _percentiles(all_latencies),
+            "mean_latency_by_hops": {
+                str(h): float(np.mean(latencies))
+                for h, latencies in sorted(latency_by_hops.items())
+            },
+            "rpcs_received": sum(g["rpcs_received"] for g in groups.values()),
+            "rpcs_after_complete": sum(
+                g["rpcs_after_complete"] for g in groups.values()
+            ),
+        },
+        "groups": groups,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Render the per-group completion and latency of a report."""
+    run = summary["run"]
+    if not run["groups"]:
+        return "No partial message groups found"
+
+    def fmt(latency):
+        if not latency:
+            return "n/a"
+        return ", ".join(f"{name} {value:.3f}s" for name, value in latency.items())
+
+    lines = [
+        (
+            f"{run['groups']} groups, {run['incomplete_groups']} incomplete, "
+            f"{run['rpcs_received']} partial RPCs received "
+            f"({run['rpcs_after_complete']} after completion)"
+        ),
+        f"Time to complete since publish: {fmt(run['latency'])}",
+    ]
+    if run["mean_latency_by_hops"]:
+        lines.append(
+            "Mean time to complete by hops to the farthest missing part: "
+            + ", ".join(
+                f"{h}: {latency:.3f}s"
+                for h, latency in run["mean_latency_by_hops"].items()
+            )
+        )
+    for group, stats in summary["groups"].items():
+        correlation = stats["hops_latency_correlation"]
+        lines.append(
+            f"  group {group} @ {stats['publish']:.1f}s: "
+            f"{stats['completed']}/{stats['expected_nodes']} complete, "
+            f"{fmt(stats['latency'])}, {stats['rpcs_received']} RPCs"
+            + ("" if correlation is None else f", hops rank corr {correlation:.2f}")
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the assembly latency of the partial message groups of a run"
+    )
+    add_report_arguments(parser, "partial_messages.json", skip=False)
+    args = parser.parse_args()
+
+    session = AnalysisSession(args.folder, args.jobs)
+    summary = partial_summary(session)
+
+    write_json_report(args, "partial_messages.json", summary)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
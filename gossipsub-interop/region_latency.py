@@ -0,0 +1,159 @@
+"""
+Source region x destination region delivery latency of a Shadow run.
+
+Each delivery is attributed to the region (network_graph Location) of the
+message's publisher and of the receiving node, using the network_node_id of
+every host in shadow.yaml and the labels in graph.gml. Latency is measured
+from the publish instant in params.json. Comparing each cell with the link
+latency in network_graph.edges shows the protocol overhead on top of the
+propagation delay per link class.
+"""
+
+import csv
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import network_graph
+from analysis_session import AnalysisSession
+from dissemination import message_publishers
+
+REGION_PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class RegionLatency:
+    """Delivery latency percentiles per (source region, destination region)."""
+
+    regions: List[str]
+    # Seconds, shape (len(regions), len(regions), len(REGION_PERCENTILES)),
+    # NaN for pairs without deliveries
+    percentiles: np.ndarray
+    # Number of deliveries per pair
+    deliveries: np.ndarray
+    # One way link latency in seconds from network_graph.edges, NaN if unknown
+    link_latency: np.ndarray
+
+    def rows(self) -> List[dict]:
+        """One row per region pair with deliveries, as written to the CSV."""
+        rows = []
+        for i, source in enumerate(self.regions):
+            for j, destination in enumerate(self.regions):
+                if not self.deliveries[i, j]:
+                    continue
+                row = {
+                    "source": source,
+                    "destination": destination,
+                    "deliveries": int(self.deliveries[i, j]),
+                }
+                for k, p in enumerate(REGION_PERCENTILES):
+                    row[f"p{p}"] = float(self.percentiles[i, j, k])
+                link = float(self.link_latency[i, j])
+                row["link_latency"] = None if np.isnan(link) else link
+                row["p50_overhead"] = None if np.isnan(link) else row["p50"] - link
+                rows.append(row)
+        return rows
+
+
+def node_regions(session: AnalysisSession) -> Dict[int, str]:
+    """Dictionary mapping node ID to its region, the label without the NodeType."""
+    labels = session.network_labels()
+    return {
+        node_id: labels[network_id].rsplit("-", 1)[0]
+        for node_id, network_id in session.node_networks().items()
+        if network_id in labels
+    }
+
+
+def _link_latencies() -> Dict[Tuple[str, str], float]:
+    return {
+        (edge.src.name, edge.dst.name): edge.latency / 1e3
+        for edge in network_graph.edges
+    }
+
+
+def region_latency(session: AnalysisSession, skip_messages: int = 0) -> RegionLatency:
+    """
+    Compute the region x region delivery latency percentiles of a run.
+
+    Messages without a known publisher, nodes without a region and publishers
+    receiving their own message back are left out.
+
+    Args:
+        session: Session of the Shadow output directory
+        skip_messages: Number of (warmup) messages to leave out, matching
+            analysis.txt
+
+    Returns:
+        RegionLatency with regions in network_graph.locations order
+    """
+    store = session.store.skip(skip_messages)
+    regions_by_node = node_regions(session)
+    publishers = message_publishers(session)
+
+    known = [location.name for location in network_graph.locations]
+    present = set(regions_by_node.values())
+    regions = [r for r in known if r in present] + sorted(present - set(known))
+    region_index = {region: i for i, region in enumerate(regions)}
+
+    # Source region and publish time per message, -1 when unknown
+    source = np.full(len(store), -1, dtype=np.int64)
+    publish_ns = np.zeros(len(store), dtype=np.int64)
+    publisher = np.full(len(store), -1, dtype=np.int64)
+    for i, message_id in enumerate(store.message_ids):
+        if message_id in publishers:
+            publisher[i], publish_ns[i] = publishers[message_id]
+            source[i] = region_index.get(regions_by_node.get(int(publisher[i])), -1)
+
+    # Destination region per delivery, via each distinct node once
+    nodes, inverse = np.unique(store.node_index, return_inverse=True)
+    node_region = np.array(
+        [region_index.get(regions_by_node.get(int(n)), -1) for n in nodes],
+        dtype=np.int64,
+    )
+    destination = node_region[inverse] if len(nodes) else np.zeros(0, np.int64)
+    delivery_source = source[store.msg_index]
+    latency_ns = store.timestamp_ns - publish_ns[store.msg_index]
+
+    valid = (
+        (delivery_source >= 0)
+        & (destination >= 0)
+        & (store.node_index != publisher[store.msg_index])
+    )
+    pair = delivery_source[valid] * len(regions) + destination[valid]
+    latency_ns = latency_ns[valid]
+    order = np.lexsort((latency_ns, pair))
+    pair, latency_ns = pair[order], latency_ns[order]
+
+    size = len(regions)
+    percentiles = np.full((size, size, len(REGION_PERCENTILES)), np.nan)
+    deliveries = np.zeros((size, size), dtype=np.int64)
+    counts = np.bincount(pair, minlength=size * size)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    quantiles = np.array(REGION_PERCENTILES) / 100
+    for cell in np.flatnonzero(counts):
+        start, count = starts[cell], counts[cell]
+        positions = np.minimum((quantiles * count).astype(np.int64), count - 1)
+        percentiles[cell // size, cell % size] = latency_ns[start + positions] / 1e9
+        deliveries[cell // size, cell % size] = count
+
+    links = _link_latencies()
+    link_latency = np.array(
+        [[links.get((src, dst), np.nan) for dst in regions] for src in regions],
+        dtype=np.float64,
+    ).reshape(size, size)
+    return RegionLatency(regions, percentiles, deliveries, link_latency)
+
+
+def write_region_latency_csv(path: str, matrix: RegionLatency):
+    """Write one row per region pair with deliveries."""
+    fields = (
+        ["source", "destination", "deliveries"]
+        + [f"p{p}" for p in REGION_PERCENTILES]
+        + ["link_latency", "p50_overhead"]
+    )
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(matrix.rows())
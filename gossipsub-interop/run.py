@@ -3,12 +3,15 @@ import argparse
 import json
 import os
 import random
+import signal
 import subprocess
 from dataclasses import asdict
 
 import experiment
 from analyze_message_deliveries import analyse_message_deliveries
+from live_analysis import SHADOW_START_NS, LogFollower, follow
 from network_graph import generate_graph
+from run_stats import ShadowProcess, shadow_stop_seconds, write_run_stats
 
 params_file_name = "params.json"
 
@@ -38,6 +41,17 @@ def main():
         "Nodes are split evenly across them.",
     )
     parser.add_argument("--output_dir", type=str, required=False)
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Print a rolling summary of message deliveries while Shadow runs",
+    )
+    parser.add_argument(
+        "--early_stop",
+        action="store_true",
+        help="Stop Shadow once every published message reached all its subscribers, "
+        "or once the simulation passes the end of the script",
+    )
     args = parser.parse_args()
 
     shadow_outputs_dir = os.path.join(os.getcwd(), "shadow-outputs")
@@ -99,14 +113,62 @@ def main():
 
     subprocess.run(["make", "binaries"], check=True)
 
-    subprocess.run(
-        ["shadow", "--progress", "true", "-d", args.output_dir, "shadow.yaml"],
-    )
+    shadow_cmd = ["shadow", "--progress", "true", "-d", args.output_dir, "shadow.yaml"]
+    # Simulated time until Shadow's stop_time, unless stopped early
+    simulated_seconds = shadow_stop_seconds("shadow.yaml")
+    shadow = ShadowProcess(shadow_cmd)
+    if args.live or args.early_stop:
+        expected = experiment.expected_messages(experiment_params, args.node_count)
+        expected_receivers = {
+            message.message_id: message.receivers for message in expected
+        }
+        # Publishers may log receiving their own message, which must not
+        # count as one of the receivers
+        publishers = {message.message_id: message.publisher for message in expected}
+        deadline_ns = (
+            SHADOW_START_NS
+            + experiment.script_duration_seconds(experiment_params) * 1_000_000_000
+        )
+
+        def should_stop(follower: LogFollower) -> bool:
+            if shadow.poll() is not None:
+                return True
+            if not args.early_stop:
+                return False
+            if expected_receivers and follower.stats.propagation_complete(
+                expected_receivers, publishers=publishers
+            ):
+                print("All published messages fully propagated, stopping Shadow")
+            elif follower.latest_log_ns >= deadline_ns:
+                print("Simulation passed the end of the script, stopping Shadow")
+            else:
+                return False
+            shadow.send_signal(signal.SIGINT)
+            stopped_at_ns.append(follower.latest_log_ns)
+            return True
+
+        stopped_at_ns = []
+        follow(
+            args.output_dir,
+            idle_timeout=None,
+            should_stop=should_stop,
+            verbose=args.live,
+        )
+        try:
+            shadow.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            shadow.kill()
+            shadow.wait()
+        if stopped_at_ns:
+            simulated_seconds = (stopped_at_ns[0] - SHADOW_START_NS) / 1e9
+    else:
+        shadow.wait()
 
     # Move files to output_dir
     os.rename("shadow.yaml", os.path.join(args.output_dir, "shadow.yaml"))
     os.rename("graph.gml", os.path.join(args.output_dir, "graph.gml"))
     os.rename("params.json", os.path.join(args.output_dir, "params.json"))
+    write_run_stats(args.output_dir, shadow, args.node_count, simulated_seconds)
 
     link_name = "latest"
     if os.path.islink(link_name) or os.path.exists(link_name):
@@ -114,7 +176,7 @@ def main():
     os.symlink(args.output_dir, link_name)
 
     # Analyse message deliveries. Skip the first 4 as warmup messages
-    analyse_message_deliveries(args.output_dir, f"{args.output_dir}/plots", 4)
+    analyse_message_deliveries(args.output_dir, f"{args.output_dir}/plots", 4, jobs=0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""
+Cost of running a Shadow simulation.
+
+ShadowProcess runs Shadow and records its wall clock time, CPU time (including
+the simulated processes, which Shadow runs as its children) and the peak RSS of
+the largest single process among them.
+write_run_stats stores them with the simulated time and Shadow's own
+sim-stats.json as run_stats.json in the output directory, which aggregate.py
+uses to relate simulation speed to the node count.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import yaml
+
+RUN_STATS_FILE = "run_stats.json"
+# Written by Shadow to its data directory
+SHADOW_STATS_FILE = "sim-stats.json"
+
+# Shadow time units (singular) in seconds
+_TIME_UNITS = {
+    "": 1,
+    "ns": 1e-9,
+    "nanosecond": 1e-9,
+    "us": 1e-6,
+    "microsecond": 1e-6,
+    "ms": 1e-3,
+    "millisecond": 1e-3,
+    "s": 1,
+    "sec": 1,
+    "second": 1,
+    "m": 60,
+    "min": 60,
+    "minute": 60,
+    "h": 3600,
+    "hr": 3600,
+    "hour": 3600,
+}
+
+
+def parse_shadow_time(value) -> float:
+    """
+    Convert a Shadow time value such as "10 min" or 600 to seconds.
+
+    Raises:
+        ValueError: If the unit is unknown
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-z]*)\s*", str(value))
+    if not match:
+        raise ValueError(f"Invalid Shadow time {value!r}")
+    number, unit = match.groups()
+    if unit not in _TIME_UNITS and unit.endswith("s"):
+        unit = unit[:-1]
+    if unit not in _TIME_UNITS:
+        raise ValueError(f"Unknown Shadow time unit in {value!r}")
+    return float(number) * _TIME_UNITS[unit]
+
+
+def shadow_stop_seconds(shadow_yaml_path: str) -> Optional[float]:
+    """Return the general.stop_time of a Shadow config in seconds, if set."""
+    with open(shadow_yaml_path, "r") as f:
+        config = yaml.safe_load(f)
+    stop_time = (config.get("general") or {}).get("stop_time")
+    return None if stop_time is None else parse_shadow_time(stop_time)
+
+
+class ShadowProcess:
+    """
+    Shadow subprocess that records its resource usage when it exits.
+
+    Offers the poll/wait/send_signal/kill subset of subprocess.Popen. The
+    process is reaped with os.wait4, so its CPU time and peak RSS are those of
+    Shadow and the descendants it waited for, not of other children of this
+    process such as the binaries build. The CPU time is summed over these
+    processes, but ru_maxrss is the peak RSS of the largest one of them, not of
+    the whole tree.
+    """
+
+    def __init__(self, cmd: List[str]):
+        self.cmd = cmd
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(cmd)
+        self.wall_seconds: Optional[float] = None
+        self.rusage = None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    def _reap(self, options: int) -> Optional[int]:
+        if self.process.returncode is not None:
+            return self.process.returncode
+        pid, status, rusage = os.wait4(self.process.pid, options)
+        if pid == 0:
+            return None
+        self.wall_seconds = time.monotonic() - self.started
+        self.rusage = rusage
+        # Tell Popen the process is gone so it does not wait for it again
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        return self.process.returncode
+
+    def poll(self) -> Optional[int]:
+        return self._reap(os.WNOHANG)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if timeout is None:
+            return self._reap(0)
+        deadline = time.monotonic() + timeout
+        while self.poll() is None:
+            if time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.cmd, timeout)
+            time.sleep(0.1)
+        return self.process.returncode
+
+    def send_signal(self, sig: int):
+        self.process.send_signal(sig)
+
+    def kill(self):
+        self.process.kill()
+
+    def stats(self) -> dict:
+        """Wall clock time, CPU time and largest process peak RSS of Shadow."""
+        if self.rusage is None:
+            raise RuntimeError("Shadow has not exited yet")
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS. It is the
+        # peak of the largest process, so peak_rss_bytes is a lower bound of
+        # the memory the whole simulation used.
+        rss_unit = 1 if sys.platform == "darwin" else 1024
+        return {
+            "command": self.cmd,
+            "exit_code": self.process.returncode,
+            "wall_seconds": self.wall_seconds,
+            "cpu_user_seconds": self.rusage.ru_utime,
+            "cpu_system_seconds": self.rusage.ru_stime,
+            "cpu_seconds": self.rusage.ru_utime + self.rusage.ru_stime,
+            "peak_rss_bytes": self.rusage.ru_maxrss * rss_unit,
+        }
+
+
+def write_run_stats(
+    output_dir: str,
+    shadow: ShadowProcess,
+    node_count: int,
+    simulated_seconds: Optional[float],
+) -> dict:
+    """
+    Write run_stats.json to a Shadow output directory.
+
+    Args:
+        output_dir: Shadow output directory
+        shadow: The finished Shadow process
+        node_count: Number of simulated nodes
+        simulated_seconds: Simulated time covered by the run, None if unknown
+
+    Returns:
+        The written dictionary
+    """
+    stats = {"node_count": node_count, **shadow.stats()}
+    stats["simulated_seconds"] = simulated_seconds
+    stats["sim_seconds_per_wall_second"] = (
+        simulated_seconds / stats["wall_seconds"]
+        if simulated_seconds and stats["wall_seconds"]
+        else None
+    )
+    stats["shadow_stats"] = None
+    try:
+        with open(os.path.join(output_dir, SHADOW_STATS_FILE), "r") as f:
+            stats["shadow_stats"] = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    with open(os.path.join(output_dir, RUN_STATS_FILE), "w") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+def load_run_stats(output_dir: str) -> Optional[dict]:
+    """Return the run_stats.json of an output directory, None if missing."""
+    try:
+        with open(os.path.join(output_dir, RUN_STATS_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -211,7 +211,7 @@ impl ScriptedNode {
                                             if after_extension == vec![255] {
                                                 info!(self.stdout_logger, "All parts received";
                                                     // "topic" => topic_id,
-                                                    // "group_id" => group_id,
+                                                    "group_id" => format!("{:?}", group_id_array),
                                                     "from" => peer_id.to_string());
                                             }
 
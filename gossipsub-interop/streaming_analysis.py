@@ -0,0 +1,541 @@
+"""
+Bounded-memory analysis of the message deliveries of a Shadow run.
+
+AnalysisSession keeps every delivery of every node in memory, which does not
+fit for 10k+ node runs with high publish rates. StreamingAggregator instead
+folds each log file into bounded per-message state as soon as it is parsed: a
+running first and last delivery time, reach and duplicate counters, and a
+QuantileSketch of the delivery times. Memory is O(messages x sketch buckets +
+nodes) rather than O(deliveries).
+
+The sketch is a DDSketch: values fall into logarithmic buckets so every
+quantile it returns is within a relative error alpha of a value of the exact
+nearest-rank quantile. Delivery times are sketched relative to a reference
+per message, so the absolute error of a latency is at most alpha x the
+distance of the delivery from that reference. The reference is the publish
+instant from params.json, which makes the bound scale with the real latency,
+or else the first delivery in the first file that had the message.
+analysis.json reports that bound for every message, and a looser one for the
+run-wide percentiles.
+"""
+
+import argparse
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+import experiment
+from analysis_session import LATENCY_PERCENTILES
+from live_analysis import SHADOW_START_NS
+from log_ingest import (
+    FileParseResult,
+    log_peer_id,
+    logfile_iterator,
+    parse_log_path,
+)
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Far more than needed for nanosecond latencies (1.02^2048 > 1e17), so
+# collapsing only happens with a very small relative accuracy
+DEFAULT_MAX_BUCKETS = 2048
+# Deliveries buffered before they are folded into the sketches
+FLUSH_DELIVERIES = 1_000_000
+
+
+class QuantileSketch:
+    """
+    Mergeable DDSketch of integer values with a relative accuracy guarantee.
+
+    Buckets are keyed by a signed index: 0 holds zeros, k > 0 holds values in
+    (gamma^(k-2), gamma^(k-1)] and -k the negated range, so keys sort like the
+    values they hold. When there are more than max_buckets, the lowest buckets
+    are collapsed into one and the guarantee no longer holds for the quantiles
+    that fall in it.
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_buckets: int = DEFAULT_MAX_BUCKETS,
+    ):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+        self.collapsed = False
+
+    def keys(self, values: np.ndarray) -> np.ndarray:
+        """Signed bucket key of every value."""
+        values = np.asarray(values, dtype=np.float64)
+        magnitude = np.abs(values)
+        index = np.ceil(np.log(np.maximum(magnitude, 1.0)) / self._log_gamma)
+        return (np.sign(values) * (index + 1)).astype(np.int64)
+
+    def value(self, key: int) -> float:
+        """Representative value of a bucket, within the relative accuracy."""
+        if key == 0:
+            return 0.0
+        magnitude = 2 * self.gamma ** (abs(key) - 1) / (self.gamma + 1)
+        return math.copysign(magnitude, key)
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values)
+        if not len(values):
+            return
+        keys, counts = np.unique(self.keys(values), return_counts=True)
+        self.add_buckets(keys, counts, float(values.min()), float(values.max()))
+
+    def add_buckets(
+        self, keys: np.ndarray, counts: np.ndarray, min_value: float, max_value: float
+    ):
+        """Add pre-bucketed values, as computed with keys()."""
+        buckets = self.buckets
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+        self.count += int(counts.sum())
+        self.min_value = min(self.min_value, min_value)
+        self.max_value = max(self.max_value, max_value)
+        self._collapse()
+
+    def merge(self, other: "QuantileSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different relative accuracy")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.collapsed |= other.collapsed
+        self._collapse()
+
+    def _collapse(self):
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.buckets[target] += self.buckets.pop(key)
+        self.collapsed = True
+
+    def quantiles(self, quantiles) -> List[float]:
+        """
+        Nearest-rank quantiles, the value at index floor(q x count) in sorted order.
+
+        Estimates are clamped to the exact minimum and maximum, so q = 0 and
+        q = 1 are exact.
+        """
+        if not self.count:
+            return [math.nan for _ in quantiles]
+        keys = sorted(self.buckets)
+        cumulative = np.cumsum([self.buckets[key] for key in keys])
+        estimates = []
+        for q in quantiles:
+            rank = min(int(q * self.count), self.count - 1)
+            key = keys[int(np.searchsorted(cumulative, rank, side="right"))]
+            estimates.append(min(max(self.value(key), self.min_value), self.max_value))
+        return estimates
+
+
+def _shifted(sketch: QuantileSketch, shift: int) -> QuantileSketch:
+    """
+    Re-bucket a sketch with every value moved down by shift.
+
+    Each bucket moves as a whole at its representative value, so a value of
+    the result is within alpha x (|value before| + |value after|) of the exact
+    shifted value.
+    """
+    shifted = QuantileSketch(sketch.relative_accuracy, sketch.max_buckets)
+    if not sketch.count:
+        return shifted
+    values = np.array([sketch.value(key) for key in sketch.buckets]) - shift
+    counts = np.array(list(sketch.buckets.values()), dtype=np.int64)
+    keys, inverse = np.unique(shifted.keys(values), return_inverse=True)
+    shifted.add_buckets(
+        keys,
+        np.bincount(inverse, weights=counts).astype(np.int64),
+        sketch.min_value - shift,
+        sketch.max_value - shift,
+    )
+    shifted.collapsed = sketch.collapsed
+    return shifted
+
+
+class StreamingAggregator:
+    """
+    Folds parsed log files into bounded per-message delivery state.
+
+    Files can be added in any order. Deliveries are buffered in fixed-size
+    batches and bucketed with one vectorized pass per batch.
+
+    Args:
+        relative_accuracy: Relative accuracy alpha of the quantile sketches
+        max_buckets: Maximum number of buckets per sketch
+        publish_ns: Dictionary mapping message ID to its publish time (ns),
+            used as the reference of its sketch when known
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_buckets: int = DEFAULT_MAX_BUCKETS,
+        publish_ns: Optional[Dict[str, int]] = None,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.publish_ns = publish_ns or {}
+        self.max_buckets = max_buckets
+        self._keys = QuantileSketch(relative_accuracy, max_buckets)
+        self.message_index: Dict[str, int] = {}
+        self.message_ids: List[str] = []
+        self.reference_ns: List[int] = []
+        self.first_ns: List[int] = []
+        self.last_ns: List[int] = []
+        self.deliveries: List[int] = []
+        self.duplicates: List[int] = []
+        self.sketches: List[QuantileSketch] = []
+        self.nodes = set()
+        self._pending_index: List[np.ndarray] = []
+        self._pending_values: List[np.ndarray] = []
+        self._pending = 0
+
+    def _intern(self, message_id: str, timestamp_ns: int) -> int:
+        index = self.message_index.get(message_id)
+        if index is None:
+            index = len(self.message_ids)
+            self.message_index[message_id] = index
+            self.message_ids.append(message_id)
+            self.reference_ns.append(self.publish_ns.get(message_id, timestamp_ns))
+            self.first_ns.append(timestamp_ns)
+            self.last_ns.append(timestamp_ns)
+            self.deliveries.append(0)
+            self.duplicates.append(0)
+            self.sketches.append(
+                QuantileSketch(self.relative_accuracy, self.max_buckets)
+            )
+        return index
+
+    def add(self, result: FileParseResult):
+        """Fold the deliveries and duplicates of one parsed log file."""
+        if result.peer_id is not None:
+            self.nodes.add(result.node_id.id)
+        indices = np.empty(len(result.message_ids), dtype=np.int64)
+        # Reference of each delivery's message, looked up per delivery rather
+        # than copying the reference of every message for each file
+        references = np.empty(len(result.message_ids), dtype=np.int64)
+        for i, (message_id, timestamp_ns) in enumerate(
+            zip(result.message_ids, result.timestamps_ns)
+        ):
+            index = self._intern(message_id, timestamp_ns)
+            indices[i] = index
+            references[i] = self.reference_ns[index]
+            self.deliveries[index] += 1
+            if timestamp_ns < self.first_ns[index]:
+                self.first_ns[index] = timestamp_ns
+            if timestamp_ns > self.last_ns[index]:
+                self.last_ns[index] = timestamp_ns
+        for message_id, count in result.duplicate_counts.items():
+            index = self.message_index.get(message_id)
+            if index is not None:
+                self.duplicates[index] += count
+
+        if len(indices):
+            timestamps = np.asarray(result.timestamps_ns, dtype=np.int64)
+            self._pending_index.append(indices)
+            self._pending_values.append(timestamps - references)
+            self._pending += len(indices)
+            if self._pending >= FLUSH_DELIVERIES:
+                self.flush()
+
+    def flush(self):
+        """Bucket the buffered deliveries into their message's sketch."""
+        if not self._pending:
+            return
+        indices = np.concatenate(self._pending_index)
+        values = np.concatenate(self._pending_values)
+        self._pending_index, self._pending_values, self._pending = [], [], 0
+
+        # Bucket keys are offset into a range per message, wide enough for the
+        # largest key of the batch whatever the relative accuracy
+        keys = self._keys.keys(values)
+        key_range = 2 * (int(np.abs(keys).max()) + 1)
+        if (len(self.message_ids) + 1) * key_range >= 1 << 63:
+            raise ValueError(
+                f"relative_accuracy {self.relative_accuracy} is too small for "
+                f"{len(self.message_ids)} messages"
+            )
+        combined = indices * key_range + keys + key_range // 2
+        order = np.argsort(combined, kind="stable")
+        combined, values = combined[order], values[order]
+        unique, starts, counts = np.unique(
+            combined, return_index=True, return_counts=True
+        )
+        message_of = unique // key_range
+        keys = unique % key_range - key_range // 2
+        # One slice of buckets per message present in the batch
+        bounds = np.flatnonzero(np.diff(message_of)) + 1
+        for lo, hi in zip(
+            np.concatenate([[0], bounds]), np.concatenate([bounds, [len(unique)]])
+        ):
+            message_values = values[starts[lo] : starts[hi - 1] + counts[hi - 1]]
+            self.sketches[int(message_of[lo])].add_buckets(
+                keys[lo:hi],
+                counts[lo:hi],
+                float(message_values.min()),
+                float(message_values.max()),
+            )
+
+    def summary(self, folder, skip_messages: int = 0) -> dict:
+        """
+        Build analysis.json from the folded state, as AnalysisSession does.
+
+        Messages are ordered by first delivery and the first skip_messages are
+        left out. reach_over_time is not available in streaming mode.
+
+        Raises:
+            ValueError: If a message was delivered to more nodes than exist
+        """
+        self.flush()
+        total_nodes = len(self.nodes)
+        order = sorted(range(len(self.message_ids)), key=lambda i: self.first_ns[i])[
+            skip_messages:
+        ]
+        quantiles = [p / 100 for p in LATENCY_PERCENTILES]
+
+        messages = []
+        run_sketch = QuantileSketch(self.relative_accuracy, self.max_buckets)
+        for i in order:
+            if self.deliveries[i] > total_nodes:
+                raise ValueError(
+                    f"Message {self.message_ids[i]} was delivered to more nodes than exist"
+                )
+            # Latencies are sketched relative to the reference, shift them to
+            # the first delivery
+            shift = self.first_ns[i] - self.reference_ns[i]
+            sketch = self.sketches[i]
+            latency = [
+                max(value - shift, 0) / 1e9 for value in sketch.quantiles(quantiles)
+            ]
+            p50 = max(sketch.quantiles([0.5])[0] - shift, 0) / 1e9
+            error_bound = self.relative_accuracy * max(
+                abs(self.first_ns[i] - self.reference_ns[i]),
+                abs(self.last_ns[i] - self.reference_ns[i]),
+            )
+            messages.append(
+                {
+                    "id": self.message_ids[i],
+                    "deliveries": self.deliveries[i],
+                    "time_to_disseminate": (self.last_ns[i] - self.first_ns[i]) / 1e9,
+                    "p50_to_disseminate": p50,
+                    "avg_duplicates": self.duplicates[i] / total_nodes,
+                    "reached": min(self.deliveries[i] / (total_nodes - 1), 1.0),
+                    "latency": {
+                        f"p{p:g}": value
+                        for p, value in zip(LATENCY_PERCENTILES, latency)
+                    },
+                    "latency_error_bound": error_bound / 1e9,
+                }
+            )
+            run_sketch.merge(_shifted(sketch, shift))
+
+        run_latency = {}
+        if run_sketch.count:
+            run_latency = {
+                f"p{p:g}": max(value, 0) / 1e9
+                for p, value in zip(
+                    LATENCY_PERCENTILES, run_sketch.quantiles(quantiles)
+                )
+            }
+
+        def distribution(name):
+            values = np.array([m[name] for m in messages])
+            if not len(values):
+                return {}
+            return {
+                "mean": float(values.mean()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+            }
+
+        return {
+            "folder": str(folder),
+            "total_nodes": total_nodes,
+            "skipped_messages": skip_messages,
+            "percentiles": list(LATENCY_PERCENTILES),
+            "sketch": {
+                "relative_accuracy": self.relative_accuracy,
+                "max_buckets": self.max_buckets,
+                "collapsed": any(self.sketches[i].collapsed for i in order),
+                "max_latency_error_bound": max(
+                    (m["latency_error_bound"] for m in messages), default=0.0
+                ),
+                # The run percentiles re-bucket every message's sketch after
+                # shifting it, which adds alpha x the latency
+                "run_latency_error_bound": self.relative_accuracy
+                * (1 + self.relative_accuracy)
+                * max(
+                    (
+                        m["latency_error_bound"] / self.relative_accuracy
+                        + m["time_to_disseminate"]
+                        for m in messages
+                    ),
+                    default=0.0,
+                ),
+            },
+            "run": {
+                "messages": len(messages),
+                "deliveries": sum(m["deliveries"] for m in messages),
+                "latency": run_latency,
+                "time_to_disseminate": distribution("time_to_disseminate"),
+                "p50_to_disseminate": distribution("p50_to_disseminate"),
+                "avg_duplicates": distribution("avg_duplicates"),
+                "reached": distribution("reached"),
+            },
+            "messages": messages,
+        }
+
+
+def _iter_parsed(paths: List[str], jobs: int) -> Iterator[FileParseResult]:
+    """Parse files in order, keeping at most 2 x jobs results in flight."""
+    if jobs <= 1 or len(paths) <= 1:
+        yield from map(parse_log_path, paths)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(parse_log_path, path))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _publish_times_ns(folder, node_count: int) -> Dict[str, int]:
+    """Publish time of every message in params.json, empty without one."""
+    try:
+        params = experiment.load_params(f"{folder}/params.json")
+    except OSError:
+        return {}
+    return {
+        message.message_id: SHADOW_START_NS + message.publish_seconds * 1_000_000_000
+        for message in experiment.expected_messages(params, node_count)
+    }
+
+
+def streaming_summary(
+    folder,
+    skip_messages: int = 0,
+    jobs: int = 1,
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+) -> dict:
+    """
+    Analyze a Shadow output directory in bounded memory.
+
+    Every log file is parsed (the parse cache holds every delivery, so it is
+    neither read nor written) and folded into a StreamingAggregator. With a
+    params.json in the folder, latencies are sketched relative to the publish
+    instant of each message.
+
+    Args:
+        folder: Shadow output directory
+        skip_messages: Number of (warmup) messages to skip from the beginning
+        jobs: Number of worker processes used to parse log files, 0 uses all CPUs
+        relative_accuracy: Relative accuracy alpha of the quantile sketches
+
+    Returns:
+        JSON-serialisable dictionary in the analysis.json layout
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    paths = list(logfile_iterator(folder))
+    # Nodes that logged their PeerID, as AnalysisSession.total_nodes counts
+    # them, so params.json resolves to the same messages in both modes
+    node_count = sum(log_peer_id(path) is not None for path in paths)
+    aggregator = StreamingAggregator(
+        relative_accuracy, publish_ns=_publish_times_ns(folder, node_count)
+    )
+    for result in _iter_parsed(paths, jobs):
+        aggregator.add(result)
+    return aggregator.summary(folder, skip_messages)
+
+
+def write_analysis_txt(path: str, summary: dict):
+    """Write analysis.txt, in the layout of analyse_message_deliveries."""
+    with open(path, "w") as f:
+        f.write(
+            "Message ID, Time to Disseminate, p50 to Disseminate, Avg Duplicate Count, Reached percent\n"
+        )
+        for message in summary["messages"]:
+            f.write(
+                f"{message['id']}, {message['time_to_disseminate']}s, "
+                f"{message['p50_to_disseminate']}s, {message['avg_duplicates']}, "
+                f"{message['reached']}\n"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze message deliveries in bounded memory, with sketched percentiles"
+    )
+    parser.add_argument("folder", help="Shadow output folder")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Folder to write analysis.txt and analysis.json to (default: <folder>/plots)",
+    )
+    parser.add_argument(
+        "-s",
+        "--skip",
+        type=int,
+        default=0,
+        help="Number of messages to skip from the beginning (default: 0)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse log files, 0 uses all CPUs (default: 1)",
+    )
+    parser.add_argument(
+        "--relative-accuracy",
+        type=float,
+        default=DEFAULT_RELATIVE_ACCURACY,
+        help=f"Relative accuracy of the latency sketches (default: {DEFAULT_RELATIVE_ACCURACY})",
+    )
+    args = parser.parse_args()
+    if not 0 < args.relative_accuracy < 1:
+        parser.error("--relative-accuracy must be between 0 and 1")
+
+    summary = streaming_summary(
+        args.folder, args.skip, args.jobs, args.relative_accuracy
+    )
+    output_folder = args.output or os.path.join(args.folder, "plots")
+    os.makedirs(output_folder, exist_ok=True)
+    write_analysis_txt(os.path.join(output_folder, "analysis.txt"), summary)
+    with open(os.path.join(output_folder, "analysis.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    sketch = summary["sketch"]
+    print(
+        f"{summary['run']['messages']} messages over {summary['total_nodes']} nodes. "
+        f"Latency percentiles are within {sketch['relative_accuracy']:.1%} relative "
+        f"error of the delivery time since the reference, at most "
+        f"{sketch['max_latency_error_bound'] * 1e3:.3f}ms"
+        + (" (some sketches collapsed)" if sketch["collapsed"] else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
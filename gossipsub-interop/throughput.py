@@ -0,0 +1,233 @@
+"""
+Network-wide throughput of a Shadow run over simulated time.
+
+Buckets every event of the run on one timeline: first deliveries, duplicate
+receptions and sent control messages per second, and the payload bytes still
+in flight (published but not yet delivered to every receiver). Plotted against
+the publish instants of params.json this shows queueing build-up when messages
+are published faster than the mesh drains them.
+"""
+
+import argparse
+import csv
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+import experiment
+from analysis_session import AnalysisSession, add_report_arguments, report_path
+from dissemination import message_publishers
+from live_analysis import SHADOW_START_NS
+from log_ingest import CONTROL_EVENTS
+
+DEFAULT_BUCKET_NS = 100_000_000
+
+SERIES = (
+    "deliveries_per_second",
+    "duplicates_per_second",
+    "control_per_second",
+    "bytes_in_flight",
+)
+
+
+@dataclass
+class Throughput:
+    """Time-bucketed throughput series, one entry per bucket."""
+
+    bucket_seconds: float
+    # Start of every bucket in seconds since the start of the simulation
+    start: np.ndarray
+    deliveries_per_second: np.ndarray
+    duplicates_per_second: np.ndarray
+    # Sent GRAFT, PRUNE, IHAVE, IWANT and IDONTWANT events (go-libp2p only)
+    control_per_second: np.ndarray
+    # Payload bytes not yet delivered at the end of the bucket, counting
+    # every receiver the message has yet to reach
+    bytes_in_flight: np.ndarray
+    # Publish instants from params.json, seconds since the start of the simulation
+    publish_times: np.ndarray
+
+    def rows(self) -> List[dict]:
+        """One row per bucket, as written to the CSV."""
+        return [
+            {
+                "start": float(start),
+                **{name: float(getattr(self, name)[i]) for name in SERIES},
+            }
+            for i, start in enumerate(self.start)
+        ]
+
+
+def throughput(
+    session: AnalysisSession, bucket_ns: int = DEFAULT_BUCKET_NS
+) -> Throughput:
+    """
+    Compute the throughput series of a whole run, warmup messages included.
+
+    Bytes in flight need the messageSizeBytes, publisher and subscribers of
+    every message from params.json, they are zero without it. A message stops
+    counting once its last delivery happened, whether or not it reached every
+    subscriber.
+
+    Args:
+        session: Session of the Shadow output directory
+        bucket_ns: Width of the time buckets in nanoseconds
+
+    Returns:
+        Throughput covering the first to the last event of the run
+    """
+    store = session.store
+    results = session.control_results
+    duplicates_ns = np.concatenate(
+        [np.asarray(r.duplicate_times_ns, dtype=np.int64) for r in results]
+        or [np.zeros(0, np.int64)]
+    )
+    control_ns = np.concatenate(
+        [
+            np.asarray(r.control_times_ns.get(f"Sent {kind}", []), dtype=np.int64)
+            for r in results
+            for kind in CONTROL_EVENTS
+        ]
+        or [np.zeros(0, np.int64)]
+    )
+
+    # Payload size, expected receivers, publisher and publish time per
+    # message, when scripted
+    publishers = message_publishers(session)
+    expected = {}
+    if publishers:
+        params = experiment.load_params(f"{session.folder}/params.json")
+        expected = {
+            message.message_id: message
+            for message in experiment.expected_messages(params, session.total_nodes)
+        }
+    size = np.array(
+        [
+            expected[m].message_size_bytes if m in expected else 0
+            for m in store.message_ids
+        ],
+        dtype=np.int64,
+    )
+    # Subscribers of the message's topic other than its publisher
+    receivers = np.array(
+        [expected[m].receivers if m in expected else 0 for m in store.message_ids],
+        dtype=np.int64,
+    )
+    publisher = np.array(
+        [publishers.get(m, (-1, 0))[0] for m in store.message_ids], dtype=np.int64
+    )
+    publish_ns = np.array(
+        [publishers.get(m, (-1, 0))[1] for m in store.message_ids], dtype=np.int64
+    )
+    publish_times = np.sort(
+        np.array([ns for _, ns in publishers.values()], dtype=np.int64)
+    )
+
+    # The publisher's echo of its own message does not drain anything
+    delivery_size = np.where(
+        store.node_index != publisher[store.msg_index], size[store.msg_index], 0
+    )
+    outstanding = size * receivers - np.bincount(
+        store.msg_index, weights=delivery_size, minlength=len(store)
+    ).astype(np.int64)
+    has_publish = publisher >= 0
+
+    event_ns = [store.timestamp_ns, duplicates_ns, control_ns, publish_times]
+    non_empty = [times for times in event_ns if len(times)]
+    if not non_empty:
+        empty = np.zeros(0)
+        return Throughput(bucket_ns / 1e9, empty, empty, empty, empty, empty, empty)
+    first = (
+        min(int(times.min()) for times in non_empty) - SHADOW_START_NS
+    ) // bucket_ns
+    last = (max(int(times.max()) for times in non_empty) - SHADOW_START_NS) // bucket_ns
+    length = last - first + 1
+
+    def buckets(times_ns: np.ndarray) -> np.ndarray:
+        return (times_ns - SHADOW_START_NS) // bucket_ns - first
+
+    def per_second(times_ns: np.ndarray) -> np.ndarray:
+        counts = np.bincount(buckets(times_ns), minlength=length)
+        return counts / (bucket_ns / 1e9)
+
+    # Bytes in flight as a running sum of +size x receivers at publish, -size
+    # per delivery and -remainder at the last delivery of messages that did
+    # not reach every receiver
+    deltas = np.bincount(
+        buckets(publish_ns[has_publish]),
+        weights=(size * receivers)[has_publish],
+        minlength=length,
+    )
+    deltas -= np.bincount(
+        buckets(store.timestamp_ns), weights=delivery_size, minlength=length
+    )
+    if len(store):
+        deltas -= np.bincount(
+            buckets(store.last_delivery_ns()),
+            weights=np.maximum(outstanding, 0),
+            minlength=length,
+        )
+
+    return Throughput(
+        bucket_seconds=bucket_ns / 1e9,
+        start=(np.arange(first, last + 1) * bucket_ns) / 1e9,
+        deliveries_per_second=per_second(store.timestamp_ns),
+        duplicates_per_second=per_second(duplicates_ns),
+        control_per_second=per_second(control_ns),
+        bytes_in_flight=np.cumsum(deltas),
+        publish_times=(publish_times - SHADOW_START_NS) / 1e9,
+    )
+
+
+def write_throughput_csv(path: str, series: Throughput):
+    """Write one row per time bucket."""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=("start",) + SERIES)
+        writer.writeheader()
+        writer.writerows(series.rows())
+
+
+def format_summary(series: Throughput) -> str:
+    """Render the peak of every series and when it happened."""
+    if not len(series.start):
+        return "No events found"
+    lines = [
+        (
+            f"{len(series.start)} buckets of {series.bucket_seconds:g}s from "
+            f"{series.start[0]:.1f}s to {series.start[-1] + series.bucket_seconds:.1f}s, "
+            f"{len(series.publish_times)} publishes"
+        )
+    ]
+    for name in SERIES:
+        values = getattr(series, name)
+        peak = int(np.argmax(values))
+        lines.append(f"  peak {name}: {values[peak]:.1f} at {series.start[peak]:.1f}s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute the network-wide throughput of a run over simulated time"
+    )
+    add_report_arguments(parser, "throughput.csv", skip=False)
+    parser.add_argument(
+        "-b",
+        "--bucket",
+        type=float,
+        default=DEFAULT_BUCKET_NS / 1e9,
+        help=f"Width of the time buckets in seconds (default: {DEFAULT_BUCKET_NS / 1e9:g})",
+    )
+    args = parser.parse_args()
+    if args.bucket <= 0:
+        parser.error("--bucket must be positive")
+
+    session = AnalysisSession(args.folder, args.jobs, control=True)
+    series = throughput(session, int(args.bucket * 1e9))
+
+    write_throughput_csv(report_path(args, "throughput.csv"), series)
+    print(format_summary(series))
+
+
+if __name__ == "__main__":
+    main()